@@ -1,6 +1,11 @@
 # alx_backend_graphql_crm/schema.py
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.schema import (
+    AsyncMutation as CRMAsyncMutation,
+    AsyncQuery as CRMAsyncQuery,
+    Mutation as CRMMutation,
+    Query as CRMQuery,
+)
 
 
 class Query(CRMQuery, graphene.ObjectType):
@@ -11,4 +16,18 @@ class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+schema = graphene.Schema(query=Query, mutation=Mutation)
+
+
+class AsyncQuery(CRMAsyncQuery, graphene.ObjectType):
+    class Meta:
+        name = 'Query'
+
+
+class AsyncMutation(CRMAsyncMutation, graphene.ObjectType):
+    class Meta:
+        name = 'Mutation'
+
+
+# Same API with async root resolvers, for the ASGI endpoint
+async_schema = graphene.Schema(query=AsyncQuery, mutation=AsyncMutation)
@@ -81,10 +81,47 @@ GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql_crm.schema.schema'
 }
 
+# CRM app configuration: only what differs from the defaults in crm/conf.py
+CRM = {
+    # Warn about N+1 queries on the crm.nplusone logger; tests opt into
+    # failing with detect_n_plus_one() or override_settings
+    'NPLUSONE': 'log',
+}
+
+# Cache backend for GraphQL responses; swap for a file/redis backend to share
+# it between worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# SQLite tuned for concurrent requests. WAL lets readers run alongside the
+# one writer; synchronous=NORMAL is durable with WAL except for the last
+# commits before a power loss; IMMEDIATE transactions take the write lock
+# at BEGIN, so they wait out busy_timeout instead of failing when a read
+# inside them upgrades to a write. Connections are reused across requests.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds
+    'cache_size': -64000,  # negative: KiB, so 64 MiB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -16,10 +16,15 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, document_cache_stats, metrics_view, slow_operations
+from .schema import async_schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql/", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path("graphql/async/", csrf_exempt(AsyncCRMGraphQLView.as_view(schema=async_schema))),
+    path("graphql/cache-stats/", document_cache_stats),
+    path("metrics/", metrics_view),
+    path("metrics/slow/", slow_operations),
 ]
\ No newline at end of file
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .conf import crm_setting
+        from .nplusone import install_query_log
+        from .search import ensure_search_triggers
+        from .tracing import install_sql_wrapper
+
+        post_migrate.connect(ensure_search_triggers, sender=self)
+        if crm_setting('TRACING'):
+            connection_created.connect(install_sql_wrapper)
+        if crm_setting('NPLUSONE'):
+            connection_created.connect(install_query_log)
@@ -0,0 +1,322 @@
+# crm/benchmarks.py
+import itertools
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import close_old_connections, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from . import synthetic
+from .filters import OrderFilter
+from .graphql_client import execute
+from .models import Customer, Order, Product
+
+# Datasets are generated from a fixed seed and a fixed clock, so every run
+# at a given scale loads exactly the same rows and benchmark numbers stay
+# comparable between runs and machines.
+SEED = 20240101
+END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+PRODUCTS = 200
+
+
+def parse_scale(value):
+    """Number of orders for a scale name ("10k") or a plain number"""
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Unknown scale {value!r}; use one of {', '.join(SCALES)} or a number") from None
+
+
+def load_dataset(orders, batch_size=None):
+    """Replace every CRM row with the deterministic dataset of ``orders`` orders"""
+    synthetic.clear()
+    synthetic.generate(
+        customers=max(1, orders // 5), products=PRODUCTS, orders=orders,
+        seed=SEED, end=END, batch_size=batch_size,
+    )
+
+
+class Operation:
+    """One GraphQL operation the suite times"""
+
+    def __init__(self, name, query, variables=None):
+        self.name = name
+        self.query = query
+        self.variables = variables
+
+    def run(self):
+        return execute(self.query, self.variables)
+
+
+NESTED_ORDERS = """
+    query AllOrders {
+        allOrders(first: 100) {
+            edges {
+                node {
+                    id
+                    totalAmount
+                    orderDate
+                    customer { name email }
+                    products(first: 10) { edges { node { name price } } }
+                }
+            }
+        }
+    }
+"""
+
+CREATE_ORDER = """
+    mutation CreateOrder($input: OrderInput!) {
+        createOrder(input: $input) { order { id totalAmount } }
+    }
+"""
+
+BULK_CREATE_CUSTOMERS = """
+    mutation BulkCreate($input: [CustomerInput]!) {
+        bulkCreateCustomers(input: $input) { successCount errorCount }
+    }
+"""
+
+RESTOCK = """
+    mutation Restock($increment: Int!) {
+        updateLowStockProducts(increment: $increment) { success }
+    }
+"""
+
+# One value per OrderFilter argument, inside the generated data
+ORDER_FILTER_ARGUMENTS = {
+    'total_amount_gte': ('totalAmountGte', 'Decimal', '100'),
+    'total_amount_lte': ('totalAmountLte', 'Decimal', '300'),
+    'order_date_gte': ('orderDateGte', 'DateTime', (END - timedelta(days=60)).isoformat()),
+    'order_date_lte': ('orderDateLte', 'DateTime', (END - timedelta(days=30)).isoformat()),
+    'customer_name': ('customerName', 'String', 'smith'),
+    'product_name': ('productName', 'String', 'laptop'),
+    # Filled in with the first product's id
+    'product_id': ('productId', 'Decimal', None),
+}
+
+
+def order_filter_operations():
+    """An ``allOrders`` page for every combination of OrderFilter arguments"""
+    first_product = Product.objects.order_by('pk').values_list('pk', flat=True).first()
+    names = [name for name in ORDER_FILTER_ARGUMENTS if name in OrderFilter.base_filters]
+    for size in range(1, len(names) + 1):
+        for combination in itertools.combinations(names, size):
+            arguments = [ORDER_FILTER_ARGUMENTS[name] for name in combination]
+            definitions = ', '.join(f'${argument}: {kind}' for argument, kind, _value in arguments)
+            uses = ', '.join(f'{argument}: ${argument}' for argument, _kind, _value in arguments)
+            variables = {
+                argument: str(first_product) if value is None else value
+                for argument, _kind, value in arguments
+            }
+            yield Operation(
+                'allOrders.filter:' + '+'.join(combination),
+                f'query Filtered({definitions}) {{ allOrders(first: 20, {uses}) '
+                f'{{ edges {{ node {{ id totalAmount }} }} }} }}',
+                variables,
+            )
+
+
+def operations():
+    """Every operation of the suite, reading the loaded dataset for ids"""
+    customer_id = Customer.objects.order_by('pk').values_list('pk', flat=True).first()
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:3])
+    yield Operation('allOrders.nested', NESTED_ORDERS)
+    yield from order_filter_operations()
+    yield Operation('createOrder', CREATE_ORDER, {'input': {
+        'customerId': customer_id,
+        'items': [{'productId': pk, 'quantity': 2} for pk in product_ids],
+    }})
+    for size in (100, 1000, 10000):
+        yield Operation(f'bulkCreateCustomers.{size}', BULK_CREATE_CUSTOMERS, {'input': [
+            {'name': f'Benchmark {i}', 'email': f'benchmark-{size}-{i}@example.com'}
+            for i in range(size)
+        ]})
+    yield Operation('updateLowStockProducts', RESTOCK, {'increment': 10})
+
+
+class Rollback(Exception):
+    """Raised to discard whatever a measured run wrote"""
+
+
+def _run_rolled_back(operation):
+    try:
+        with transaction.atomic():
+            operation.run()
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+def measure(operation, repeat=5):
+    """Time ``operation`` and count its queries and peak Python memory.
+
+    Queries and memory come from one traced run; wall time is the median of
+    ``repeat`` untraced runs, since tracemalloc slows everything down. Each
+    run is rolled back, so writes leave the dataset unchanged.
+    """
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _run_rolled_back(operation)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run_rolled_back(operation)
+        timings.append(time.perf_counter() - started)
+    return {
+        'operation': operation.name,
+        'seconds': statistics.median(timings),
+        'min_seconds': min(timings),
+        # The rollback's own statements are not the operation's
+        'queries': sum(
+            not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+            for query in queries.captured_queries
+        ),
+        'peak_memory_bytes': peak,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, noise_seconds=0.005, noise_memory=64 * 1024):
+    """Return a message for every result that regressed against ``baseline``.
+
+    Query counts must not grow at all. The fastest run's time and the peak
+    memory may grow by ``tolerance`` (a fraction); the fastest run is far
+    steadier than the median on a busy machine. Differences under
+    ``noise_seconds`` / ``noise_memory`` are ignored.
+    """
+    previous = {(result['scale'], result['operation']): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result['scale'], result['operation']))
+        if base is None:
+            continue
+        label = f"{result['scale']} {result['operation']}"
+        if result['queries'] > base['queries']:
+            regressions.append(f"{label}: {result['queries']} queries, baseline {base['queries']}")
+        if (
+            result['min_seconds'] > base['min_seconds'] * (1 + tolerance)
+            and result['min_seconds'] - base['min_seconds'] > noise_seconds
+        ):
+            regressions.append(
+                f"{label}: {result['min_seconds'] * 1000:.1f}ms, baseline {base['min_seconds'] * 1000:.1f}ms"
+            )
+        if (
+            result['peak_memory_bytes'] > base['peak_memory_bytes'] * (1 + tolerance)
+            and result['peak_memory_bytes'] - base['peak_memory_bytes'] > noise_memory
+        ):
+            regressions.append(
+                f"{label}: {result['peak_memory_bytes'] // 1024}KiB peak memory, "
+                f"baseline {base['peak_memory_bytes'] // 1024}KiB"
+            )
+    return regressions
+
+
+# Django's stock SQLite connection settings: rollback journal, DEFERRED
+# transactions, a new connection per request. benchmark_concurrency runs
+# with these as the "before" of the project's own profile.
+STOCK_SQLITE = {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}}
+
+ORDER_LOOKUP = """
+    query Order($id: ID) {
+        order(id: $id) { totalAmount customer { name } products { edges { node { name price } } } }
+    }
+"""
+
+PLACE_ORDER = """
+    mutation PlaceOrder($input: OrderInput!) {
+        createOrder(input: $input) { success errors }
+    }
+"""
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_concurrent(threads, seconds, write_ratio=0.2, seed=SEED):
+    """Run order lookups and createOrder mutations from ``threads`` threads at once.
+
+    Each thread picks a write with probability ``write_ratio`` and a read
+    otherwise, for ``seconds``. Every operation is bracketed by
+    close_old_connections() the way Django brackets a request, so
+    CONN_MAX_AGE decides whether connections are reused. Returns the
+    throughput and latency of each kind and how many operations failed.
+    """
+    order_ids = list(Order.objects.values_list('pk', flat=True))
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    product_ids = list(Product.objects.values_list('pk', flat=True))
+    latencies = {'read': [], 'write': []}
+    failures = {'read': 0, 'write': 0}
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        done = {'read': [], 'write': []}
+        failed = {'read': 0, 'write': 0}
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        try:
+            while time.perf_counter() < deadline:
+                kind = 'write' if rng.random() < write_ratio else 'read'
+                started = time.perf_counter()
+                close_old_connections()
+                try:
+                    if kind == 'read':
+                        execute(ORDER_LOOKUP, {'id': rng.choice(order_ids)})
+                    else:
+                        result = execute(PLACE_ORDER, {'input': {
+                            'customerId': rng.choice(customer_ids),
+                            'items': [
+                                {'productId': pk, 'quantity': rng.randint(1, 3)}
+                                for pk in rng.sample(product_ids, rng.randint(1, 3))
+                            ],
+                        }})['createOrder']
+                        if not result['success']:
+                            raise RuntimeError('; '.join(result['errors']))
+                except Exception as error:
+                    failed[kind] += 1
+                    if len(errors) < 5:
+                        errors.append(f'{kind}: {error}')
+                else:
+                    done[kind].append(time.perf_counter() - started)
+                finally:
+                    close_old_connections()
+        finally:
+            connections.close_all()
+            with lock:
+                for key in latencies:
+                    latencies[key].extend(done[key])
+                    failures[key] += failed[key]
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    result = {'threads': threads, 'seconds': seconds, 'errors': errors}
+    for kind, timings in latencies.items():
+        result[kind] = {
+            'completed': len(timings),
+            'failed': failures[kind],
+            'per_second': len(timings) / seconds,
+            'p50_ms': _percentile(timings, 0.5) * 1000,
+            'p95_ms': _percentile(timings, 0.95) * 1000,
+        }
+    return result
@@ -0,0 +1,68 @@
+# crm/conf.py
+from django.conf import settings
+
+# Defaults for the CRM dict in the project settings
+DEFAULTS = {
+    # Largest page the customers/products/orders list fields will return
+    'LIST_MAX_LIMIT': 1000,
+    # Rows fetched per database round trip while streaming a list
+    'LIST_CHUNK_SIZE': 200,
+    # Rows per INSERT statement (and transaction) in bulkCreateCustomers
+    'BULK_CREATE_BATCH_SIZE': 500,
+    # Products with less stock than this are "low stock"
+    'LOW_STOCK_THRESHOLD': 10,
+    # Units the update_low_stock cron job adds to each low-stock product
+    'LOW_STOCK_INCREMENT': 10,
+    # Parsed and validated GraphQL documents kept by the endpoint (LRU)
+    'DOCUMENT_CACHE_SIZE': 500,
+    # Django cache used for query responses and per-model version stamps
+    'RESPONSE_CACHE_ALIAS': 'default',
+    # Seconds a query response stays cached (None caches until invalidated)
+    'RESPONSE_CACHE_TIMEOUT': 300,
+    # Largest estimated cost (objects returned) an operation may request
+    'QUERY_MAX_COST': 1000000,
+    # Deepest nesting of object fields an operation may select
+    'QUERY_MAX_DEPTH': 8,
+    # Objects assumed per parent for nested connections and lists without a
+    # page size argument
+    'QUERY_COST_LIST_SIZE': 10,
+    # Customers deleted per transaction by purge_inactive_customers
+    'PURGE_BATCH_SIZE': 200,
+    # URL cron jobs and tasks send GraphQL operations to; None runs them in
+    # process against the project schema
+    'GRAPHQL_ENDPOINT': None,
+    # Best bm25 matches per model that the search field ranks
+    'SEARCH_CANDIDATES': 500,
+    # Rows per INSERT chunk (and transaction) written by generate_crm_data
+    'GENERATE_BATCH_SIZE': 5000,
+    # Time every executed operation, its fields and its SQL for the metrics
+    # endpoint; clients can also ask for the timings in extensions.tracing
+    'TRACING': True,
+    # Traced operations at least this slow (seconds) are logged and sampled
+    'TRACING_SLOW_SECONDS': 1.0,
+    # Slow operation samples kept for the metrics/slow/ endpoint
+    'TRACING_SLOW_SAMPLES': 50,
+    # What to do when a field runs the same SQL once per list item: None
+    # (don't check), 'log' (a warning on the crm.nplusone logger) or 'raise'
+    # (fail the operation with the report)
+    'NPLUSONE': None,
+    # Same-shaped queries one field may run in an operation before it counts
+    # as N+1
+    'NPLUSONE_THRESHOLD': 3,
+    # Times a mutation's write transaction is run again when the database
+    # is locked by another writer
+    'WRITE_RETRIES': 5,
+    # Seconds of backoff before the first retry; each retry doubles it, and
+    # the actual sleep is a random fraction of it
+    'WRITE_RETRY_BACKOFF': 0.05,
+    # Most operations one batched request (a JSON array) may hold
+    'BATCH_MAX_OPERATIONS': 20,
+    # Threads running the queries of batched requests, shared by all
+    # requests; 1 runs every batch in order in the request's thread
+    'BATCH_MAX_WORKERS': 4,
+}
+
+
+def crm_setting(name):
+    """Read a CRM setting, falling back to its default"""
+    return getattr(settings, 'CRM', {}).get(name, DEFAULTS[name])
@@ -1,7 +1,7 @@
 import os
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from crm.conf import crm_setting
+from crm.graphql_client import execute
 
 def log_crm_heartbeat():
     """Logs a heartbeat message to confirm CRM health."""
@@ -12,19 +12,15 @@ def log_crm_heartbeat():
     with open(LOG_FILE, 'a') as log_file:
         log_file.write(f"{TIMESTAMP} CRM is alive\n")
 
-    # Optionally, verify GraphQL endpoint
-    GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-    transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    query = gql("""
+    # Optionally, verify the GraphQL schema answers
+    query = """
         query {
             hello
         }
-    """)
+    """
 
     try:
-        response = client.execute(query)
+        response = execute(query)
         print(f"GraphQL Response: {response}")
     except Exception as e:
         print(f"GraphQL Endpoint Error: {e}")
@@ -34,11 +30,7 @@ def update_low_stock():
     LOG_FILE = "/tmp/low_stock_updates_log.txt"
     TIMESTAMP = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-    transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    mutation = gql("""
+    mutation = """
         mutation RestockLowStockProducts($increment: Int!) {
             updateLowStockProducts(increment: $increment) {
                 success
@@ -48,10 +40,11 @@ def update_low_stock():
                 }
             }
         }
-    """)
+    """
 
     try:
-        response = client.execute(mutation, variable_values={"increment": 10})
+        increment = crm_setting('LOW_STOCK_INCREMENT')
+        response = execute(mutation, {"increment": increment})
         updated_products = response['updateLowStockProducts']['updatedProducts']
 
         with open(LOG_FILE, 'a') as log_file:
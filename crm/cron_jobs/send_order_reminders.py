@@ -1,11 +1,11 @@
+import json
 import os
 import sys
-from datetime import datetime, timedelta
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import time
+from datetime import datetime, timedelta, timezone
 
 # Add the project root to Python path
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..'))
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
 sys.path.insert(0, project_root)
 
 # Django setup
@@ -13,26 +13,22 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.setting
 import django
 django.setup()
 
-def main():
-    """Main function to process order reminders."""
-    
-    # Configuration
-    GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-    LOG_FILE = "/tmp/order_reminders_log.txt"
-    TIMESTAMP = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Calculate date 7 days ago
-    seven_days_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    
-    try:
-        # Setup GraphQL client
-        transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        # GraphQL query to get orders from the last 7 days
-        query = gql("""
-            query GetRecentOrders {
-                orders {
+from crm.graphql_client import execute
+
+# Configuration
+LOG_FILE = "/tmp/order_reminders_log.txt"
+CHECKPOINT_FILE = "/tmp/order_reminders_checkpoint.json"
+WINDOW_DAYS = 7
+BATCH_SIZE = 100
+
+# Orders sort newest first, so `last`/`before` walks the window from its
+# oldest order forwards. The date bound is applied by the database and each
+# batch is one keyset page, so a run reads only the orders it reports.
+QUERY = """
+    query RecentOrders($since: DateTime!, $batchSize: Int!, $before: String) {
+        allOrders(orderDateGte: $since, last: $batchSize, before: $before, keyset: true) {
+            edges {
+                node {
                     id
                     orderDate
                     customer {
@@ -43,39 +39,97 @@ def main():
                     totalAmount
                 }
             }
-        """)
-        
-        # Execute the query
-        result = client.execute(query)
-        orders = result.get('orders', [])
-        
-        # Filter orders from the last 7 days
-        recent_orders = []
-        for order in orders:
-            order_date = datetime.fromisoformat(order['orderDate'].replace('Z', '+00:00'))
-            if order_date >= datetime.now() - timedelta(days=7):
-                recent_orders.append(order)
-        
-        # Log the reminders
+            pageInfo {
+                hasPreviousPage
+                startCursor
+            }
+        }
+    }
+"""
+
+
+def load_checkpoint(path):
+    """Return the high-water mark saved by the last run, or None"""
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    # Replace the file in one step so a crash never leaves half a checkpoint
+    partial = f"{path}.tmp"
+    with open(partial, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(partial, path)
+
+
+def process_reminders(execute, log_file, checkpoint_path, batch_size=BATCH_SIZE, now=None):
+    """Log a reminder for each order of the last WINDOW_DAYS days not yet reminded.
+
+    ``execute(query, variables)`` runs a GraphQL operation and returns its
+    data. The cursor of the newest processed order is saved after every
+    batch, so the next run, or a rerun after a crash, resumes right after it.
+    Returns the number of reminders logged.
+    """
+    now = now or datetime.now(timezone.utc)
+    timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    checkpoint = load_checkpoint(checkpoint_path)
+    variables = {
+        'since': (now - timedelta(days=WINDOW_DAYS)).isoformat(),
+        'batchSize': batch_size,
+        'before': checkpoint and checkpoint['before'],
+    }
+
+    started = time.perf_counter()
+    processed = 0
+    log_file.write(f"\n{timestamp} - Processing order reminders:\n")
+    while True:
+        page = execute(QUERY, variables)['allOrders']
+        # Each page is newest first; log it oldest first like the run itself
+        for edge in reversed(page['edges']):
+            order = edge['node']
+            customer = order['customer']
+            log_file.write(
+                f"{timestamp} - Order ID: {order['id']}, Customer: {customer['name']} "
+                f"({customer['email']}), Order Date: {order['orderDate']}\n"
+            )
+        if page['edges']:
+            newest = page['edges'][0]['node']
+            processed += len(page['edges'])
+            variables['before'] = page['pageInfo']['startCursor']
+            log_file.flush()
+            save_checkpoint(checkpoint_path, {
+                'before': variables['before'],
+                'orderId': newest['id'],
+                'orderDate': newest['orderDate'],
+            })
+        if not page['pageInfo']['hasPreviousPage']:
+            break
+
+    elapsed = time.perf_counter() - started
+    if processed:
+        log_file.write(f"{timestamp} - Total reminders processed: {processed}\n")
+    else:
+        log_file.write(f"{timestamp} - No new orders in the last {WINDOW_DAYS} days\n")
+    log_file.write(
+        f"{timestamp} - Processed {processed} orders in {elapsed:.2f}s "
+        f"({processed / elapsed if elapsed else 0:,.0f} orders/s)\n"
+    )
+    return processed
+
+
+def main():
+    """Main function to process order reminders."""
+    TIMESTAMP = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    try:
         with open(LOG_FILE, 'a') as log_file:
-            log_file.write(f"\n{TIMESTAMP} - Processing order reminders:\n")
-            
-            if recent_orders:
-                for order in recent_orders:
-                    order_id = order['id']
-                    customer_email = order['customer']['email']
-                    customer_name = order['customer']['name']
-                    order_date = order['orderDate']
-                    
-                    log_entry = f"{TIMESTAMP} - Order ID: {order_id}, Customer: {customer_name} ({customer_email}), Order Date: {order_date}\n"
-                    log_file.write(log_entry)
-                
-                log_file.write(f"{TIMESTAMP} - Total reminders processed: {len(recent_orders)}\n")
-            else:
-                log_file.write(f"{TIMESTAMP} - No orders found in the last 7 days\n")
-        
+            process_reminders(execute, log_file, CHECKPOINT_FILE)
+
         print("Order reminders processed!")
-        
+
     except Exception as e:
         error_msg = f"{TIMESTAMP} - Error processing order reminders: {str(e)}\n"
         with open(LOG_FILE, 'a') as log_file:
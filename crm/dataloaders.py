@@ -0,0 +1,205 @@
+# crm/dataloaders.py
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from .models import Customer, Product, Order, OrderItem
+
+
+class DataLoader:
+    """Request-scoped batch loader.
+
+    Resolvers that produce a page of parent rows ``prime`` the keys of that
+    page; the first ``load`` of a key that is not cached yet fetches every
+    queued key with a single call to ``batch_load_fn``.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = {}
+        self._batch = None
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def prime(self, keys):
+        """Queue keys to be fetched with the next batch"""
+        for key in keys:
+            if key not in self._cache:
+                self._queue[key] = None
+
+    def prime_values(self, values):
+        """Seed the cache with values that were fetched some other way"""
+        for key, value in values.items():
+            self._cache[key] = value
+            self._queue.pop(key, None)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue[key] = None
+            if in_event_loop():
+                return self._load_async(key)
+            self._dispatch()
+        return self._cache.get(key, self._default())
+
+    async def _load_async(self, key):
+        # Sibling resolvers queue their keys before any of them awaits, so
+        # they all share the batch that the first one starts.
+        while key not in self._cache:
+            if self._batch is None:
+                self._batch = asyncio.ensure_future(self._dispatch_async())
+            await self._batch
+        return self._cache[key]
+
+    def _default(self):
+        return self.default() if callable(self.default) else self.default
+
+    def _dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self._default())
+
+    async def _dispatch_async(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        try:
+            results = await sync_to_async(self.batch_load_fn)(keys)
+        finally:
+            self._batch = None
+        for key in keys:
+            self._cache[key] = results.get(key, self._default())
+
+
+class CRMLoaders:
+    """The DataLoaders shared by every resolver of one GraphQL request.
+
+    GraphQL completes one row's subtree before starting the next, so loaders
+    also prime the relations of every row they fetch; otherwise a nested page
+    would only be batched with itself rather than with its siblings.
+    """
+
+    def __init__(self):
+        self.customer_by_id = DataLoader(self._load_customers)
+        self.products_by_order_id = DataLoader(self._load_products_by_order, default=list)
+        self.items_by_order_id = DataLoader(self._load_items_by_order, default=list)
+        self.orders_by_customer_id = DataLoader(self._load_orders_by_customer, default=list)
+        self.orders_by_product_id = DataLoader(self._load_orders_by_product, default=list)
+
+    def prime(self, instances):
+        """Queue the relations of freshly resolved rows for batching.
+
+        Relations the queryset optimizer already joined or prefetched are
+        copied into the loader caches instead, so they cost no extra query.
+        """
+        for instance in instances:
+            if isinstance(instance, Order):
+                if Order.customer.is_cached(instance):
+                    self._prime_related(self.customer_by_id, instance.customer_id, instance.customer)
+                else:
+                    self.customer_by_id.prime([instance.customer_id])
+                self._prime_relation(self.products_by_order_id, instance, 'products')
+                self._prime_relation(self.items_by_order_id, instance, 'items')
+            elif isinstance(instance, Customer):
+                self._prime_relation(self.orders_by_customer_id, instance, 'orders')
+            elif isinstance(instance, Product):
+                self._prime_relation(self.orders_by_product_id, instance, 'orders')
+
+    def _prime_relation(self, loader, instance, name):
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if name in prefetched:
+            self._prime_related(loader, instance.pk, list(prefetched[name]))
+        else:
+            loader.prime([instance.pk])
+
+    def _prime_related(self, loader, key, value):
+        # Prefetched rows point back at their parents, so stop at rows that
+        # have been seen already.
+        if key in loader:
+            return
+        loader.prime_values({key: value})
+        self.prime(value if isinstance(value, list) else [value])
+
+    def _load_customers(self, ids):
+        customers = Customer.objects.in_bulk(ids)
+        self.prime(customers.values())
+        return customers
+
+    def _load_products_by_order(self, order_ids):
+        rows = (
+            OrderItem.objects
+            .filter(order_id__in=order_ids)
+            .select_related('product')
+            .order_by(*_ordering(Product, 'product__'))
+        )
+        products = defaultdict(list)
+        for row in rows:
+            products[row.order_id].append(row.product)
+            self.prime([row.product])
+        return products
+
+    def _load_items_by_order(self, order_ids):
+        items = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=order_ids).select_related('product'):
+            items[item.order_id].append(item)
+            self.prime([item.product])
+        return items
+
+    def _load_orders_by_customer(self, customer_ids):
+        orders = defaultdict(list)
+        for order in Order.objects.filter(customer_id__in=customer_ids):
+            orders[order.customer_id].append(order)
+            self.prime([order])
+        return orders
+
+    def _load_orders_by_product(self, product_ids):
+        rows = (
+            OrderItem.objects
+            .filter(product_id__in=product_ids)
+            .select_related('order')
+            .order_by(*_ordering(Order, 'order__'))
+        )
+        orders = defaultdict(list)
+        for row in rows:
+            orders[row.product_id].append(row.order)
+            self.prime([row.order])
+        return orders
+
+
+def _ordering(model, prefix):
+    """Translate a model's Meta.ordering so it can be applied through a join"""
+    ordering = []
+    for field in model._meta.ordering:
+        if field.startswith('-'):
+            ordering.append('-' + prefix + field[1:])
+        else:
+            ordering.append(prefix + field)
+    return ordering
+
+
+def in_event_loop():
+    """Check whether the caller runs on an event loop, where sync ORM calls are refused"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_loaders(info):
+    """Return the request's loaders, attaching a fresh set on first use"""
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        try:
+            context.loaders = loaders
+        except AttributeError:
+            # Contexts that cannot hold attributes (e.g. None) get unshared
+            # loaders: still correct, just not batched across rows.
+            pass
+    return loaders
@@ -0,0 +1,55 @@
+# crm/db.py
+import random
+import time
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from .conf import crm_setting
+
+
+def is_lock_error(error):
+    """Check whether ``error`` means another connection holds the write lock"""
+    return isinstance(error, OperationalError) and str(error).startswith(
+        ('database is locked', 'database table is locked')
+    )
+
+
+def retry_on_lock(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Run ``func`` again while it fails because the database is locked.
+
+    SQLite has one writer at a time; a write that waits longer than the
+    busy timeout fails with "database is locked". ``func`` is then run again
+    after an exponential backoff with jitter, at most WRITE_RETRIES more
+    times. It must be safe to repeat: a single statement, or a transaction
+    of its own (see atomic_with_retry). Inside an atomic block nothing is
+    retried, since the error has already broken the outer transaction.
+    """
+    if func is None:
+        return lambda func: retry_on_lock(func, using=using)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = 0 if connections[using].in_atomic_block else crm_setting('WRITE_RETRIES')
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_lock_error(error):
+                    raise
+            time.sleep(random.uniform(0, crm_setting('WRITE_RETRY_BACKOFF') * 2 ** attempt))
+
+    return wrapper
+
+
+def atomic_with_retry(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Run ``func`` in a transaction of its own, retried as a whole while the database is locked"""
+    if func is None:
+        return lambda func: atomic_with_retry(func, using=using)
+
+    @wraps(func)
+    def atomic(*args, **kwargs):
+        with transaction.atomic(using=using):
+            return func(*args, **kwargs)
+
+    return retry_on_lock(atomic, using=using)
@@ -0,0 +1,76 @@
+# crm/document_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def query_hash(query):
+    """sha256 of the query text, the key used by Automatic Persisted Queries"""
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class CachedDocument:
+    """A query's text with its parsed document and validation errors"""
+
+    def __init__(self, query, document, errors):
+        self.query = query
+        self.document = document
+        self.errors = errors
+        # Normalized hash and model labels, filled in by the response cache
+        self.cache_info = None
+
+
+class DocumentCache:
+    """Thread-safe LRU of parsed and validated GraphQL documents.
+
+    Entries are keyed by ``query_hash`` so the same cache doubles as the
+    Automatic Persisted Queries registry.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.persisted_hits = 0
+        self.persisted_misses = 0
+
+    def get(self, key, persisted=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if persisted:
+                if entry is None:
+                    self.persisted_misses += 1
+                else:
+                    self.persisted_hits += 1
+            elif entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.persisted_hits = self.persisted_misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'persisted_hits': self.persisted_hits,
+                'persisted_misses': self.persisted_misses,
+            }
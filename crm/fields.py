@@ -0,0 +1,221 @@
+# crm/fields.py
+from functools import partial
+from inspect import isawaitable
+
+import graphene
+from asgiref.sync import sync_to_async
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError, get_named_type
+
+from .conf import crm_setting
+from .dataloaders import get_loaders, in_event_loop
+from .optimizer import PAGINATION_ARGS, optimize_queryset
+from .pagination import keyset_ordering, paginate_keyset, seek_after_pk
+
+
+def has_filter_args(args):
+    """Check whether a connection was called with any filterset argument"""
+    return any(
+        value is not None
+        for name, value in args.items()
+        if name not in PAGINATION_ARGS
+    )
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """Filter connection that cooperates with the request's DataLoaders.
+
+    Lists already fetched by a loader are paginated as-is instead of being
+    re-queried. Querysets are optimized for the requested selection set, and
+    the nodes of every resolved page are primed so their remaining relations
+    are fetched in one batch.
+    """
+
+    @classmethod
+    def resolve_queryset(
+        cls, connection, iterable, info, args, filtering_args, filterset_class
+    ):
+        if isinstance(iterable, list):
+            return iterable
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return optimize_queryset(queryset, info)
+
+    @classmethod
+    def connection_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        resolve_page = partial(
+            cls.resolve_page,
+            connection=connection,
+            default_manager=default_manager,
+            queryset_resolver=queryset_resolver,
+            max_limit=max_limit,
+            enforce_first_or_last=enforce_first_or_last,
+            root=root,
+            info=info,
+            **args,
+        )
+        if in_event_loop():
+            return cls.resolve_page_async(resolver(root, info, **args), resolve_page)
+        return resolve_page(resolver)
+
+    @classmethod
+    def resolve_page(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args,
+    ):
+        resolved = super().connection_resolver(
+            resolver,
+            connection,
+            default_manager,
+            queryset_resolver,
+            max_limit,
+            enforce_first_or_last,
+            root,
+            info,
+            **args,
+        )
+        get_loaders(info).prime(edge.node for edge in resolved.edges)
+        return resolved
+
+    @staticmethod
+    async def resolve_page_async(iterable, resolve_page):
+        """Paginate under async execution.
+
+        Loader results are paginated on the event loop; querysets still go
+        through graphene-django's sync filtering and slicing, so they are
+        evaluated in Django's sync thread.
+        """
+        if isawaitable(iterable):
+            iterable = await iterable
+
+        def resolver(*_args, **_kwargs):
+            return iterable
+
+        if isinstance(iterable, list):
+            return resolve_page(resolver)
+        return await sync_to_async(resolve_page)(resolver)
+
+
+class KeysetFilterConnectionField(BatchedFilterConnectionField):
+    """Filter connection with an opt-in ``keyset`` pagination mode.
+
+    With ``keyset: true`` cursors encode the row's sort key and id, pages are
+    fetched with a seek predicate instead of an offset, and no count query is
+    run, so deep pages cost the same as the first one and stay stable while
+    rows are inserted.
+    """
+
+    def __init__(self, type_, *args, **kwargs):
+        kwargs.setdefault('keyset', graphene.Boolean(
+            default_value=False,
+            description='Paginate by sort key instead of offset.',
+        ))
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not args.get('keyset'):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        nodes, cursors, has_previous_page, has_next_page = paginate_keyset(
+            iterable, args, max_limit=max_limit
+        )
+        edges = [
+            connection.Edge(node=node, cursor=cursor)
+            for node, cursor in zip(nodes, cursors)
+        ]
+        resolved = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=cursors[0] if cursors else None,
+                end_cursor=cursors[-1] if cursors else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        resolved.iterable = iterable
+        return resolved
+
+
+def stream_list(queryset, info, first=None, after=None):
+    """Resolve a bounded list field without materializing the whole page.
+
+    ``first`` is capped by the LIST_MAX_LIMIT setting and ``after`` is the id
+    of the last row of the previous page. Rows are read with a server-side
+    iterator in LIST_CHUNK_SIZE chunks, and each chunk is primed on the
+    request's loaders before it is handed to graphene.
+    """
+    queryset = _bounded_page(queryset, info, first, after)
+    return _primed_chunks(queryset, get_loaders(info), crm_setting('LIST_CHUNK_SIZE'))
+
+
+async def astream_list(queryset, info, first=None, after=None):
+    """Async counterpart of ``stream_list``, reading rows with ``aiterator``"""
+    queryset = _bounded_page(queryset, info, first, after)
+    loaders = get_loaders(info)
+    chunk_size = crm_setting('LIST_CHUNK_SIZE')
+    rows = []
+    chunk = []
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            loaders.prime(chunk)
+            rows.extend(chunk)
+            chunk = []
+    loaders.prime(chunk)
+    rows.extend(chunk)
+    return rows
+
+
+def check_list_limit(info, first):
+    """Return ``first``, or LIST_MAX_LIMIT when it is None; larger values are an error"""
+    max_limit = crm_setting('LIST_MAX_LIMIT')
+    if first is None:
+        first = max_limit
+    if first < 0 or first > max_limit:
+        raise GraphQLError(
+            f"Requesting {first} records on the `{info.field_name}` field "
+            f"exceeds the limit of {max_limit} records."
+        )
+    return first
+
+
+def _bounded_page(queryset, info, first, after):
+    first = check_list_limit(info, first)
+    queryset = queryset.order_by(*keyset_ordering(queryset.model))
+    if after is not None:
+        queryset = seek_after_pk(queryset, after, get_named_type(info.return_type).name)
+    return optimize_queryset(queryset, info)[:first]
+
+
+def _primed_chunks(queryset, loaders, chunk_size):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            loaders.prime(chunk)
+            yield from chunk
+            chunk = []
+    loaders.prime(chunk)
+    yield from chunk
@@ -1,11 +1,25 @@
 import django_filters
 from django.db import models
+from django_filters.constants import EMPTY_VALUES
+from .conf import crm_setting
 from .models import Customer, Product, Order
+from .search import filter_contains
+
+
+class ContainsFilter(django_filters.CharFilter):
+    """Case-insensitive "contains" filter served by the search index (crm/search.py)"""
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        if self.distinct:
+            qs = qs.distinct()
+        return filter_contains(qs, self.field_name, value)
 
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
-    email = django_filters.CharFilter(lookup_expr='icontains')
+    name = ContainsFilter()
+    email = ContainsFilter()
     created_at_gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at_lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     
@@ -17,14 +31,18 @@ class CustomerFilter(django_filters.FilterSet):
         fields = ['name', 'email', 'created_at_gte', 'created_at_lte', 'phone_pattern']
     
     def filter_phone_pattern(self, queryset, name, value):
-        """Custom filter for phone number patterns"""
+        """Phones starting with ``value``.
+
+        Written as a range rather than ``startswith``: SQLite's LIKE is case
+        insensitive, so it cannot use the phone index.
+        """
         if value:
-            return queryset.filter(phone__startswith=value)
+            return queryset.filter(phone__gte=value, phone__lt=value[:-1] + chr(ord(value[-1]) + 1))
         return queryset
 
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
+    name = ContainsFilter()
     price_gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price_lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock_gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
@@ -38,9 +56,9 @@ class ProductFilter(django_filters.FilterSet):
         fields = ['name', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte', 'low_stock']
     
     def filter_low_stock(self, queryset, name, value):
-        """Filter products with stock less than 10"""
+        """Filter products with stock below CRM['LOW_STOCK_THRESHOLD'] (10 by default)"""
         if value:
-            return queryset.filter(stock__lt=10)
+            return queryset.filter(stock__lt=crm_setting('LOW_STOCK_THRESHOLD'))
         return queryset
 
 
@@ -51,13 +69,13 @@ class OrderFilter(django_filters.FilterSet):
     order_date_lte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='lte')
     
     # Filter by related customer name
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
+    customer_name = ContainsFilter(field_name='customer__name')
     
     # Filter by related product name
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
+    product_name = ContainsFilter(field_name='products__name')
     
-    # Filter orders containing specific product ID
-    product_id = django_filters.NumberFilter(field_name='products__id', lookup_expr='exact')
+    # Filter orders containing specific product ID (served by the items table alone)
+    product_id = django_filters.NumberFilter(field_name='items__product_id', lookup_expr='exact')
     
     class Meta:
         model = Order
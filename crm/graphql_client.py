@@ -0,0 +1,78 @@
+# crm/graphql_client.py
+from functools import lru_cache
+from types import SimpleNamespace
+
+from gql import Client, gql
+from gql.graphql_request import GraphQLRequest
+from gql.transport import Transport
+from gql.transport.requests import RequestsHTTPTransport
+from graphene_django.settings import graphene_settings
+from graphql import execute as execute_document
+
+from .conf import crm_setting
+
+
+class SchemaTransport(Transport):
+    """gql transport that executes operations on a graphene schema in this process.
+
+    Each operation gets a fresh context, so it has its own DataLoaders just
+    like a request to the endpoint.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def execute(self, request, *args, **kwargs):
+        return execute_document(
+            self.schema.graphql_schema,
+            request.document,
+            variable_values=request.variable_values,
+            operation_name=request.operation_name,
+            context_value=SimpleNamespace(),
+        )
+
+    def execute_batch(self, reqs, *args, **kwargs):
+        return [self.execute(request) for request in reqs]
+
+
+def get_client(endpoint=None, transport=None):
+    """Return a gql Client for the CRM schema.
+
+    Operations run in process unless a ``transport`` is given or an
+    ``endpoint`` URL (by default the GRAPHQL_ENDPOINT setting) is set, which
+    sends them over HTTP instead. Either way documents are validated against
+    the local schema, so no introspection query is sent.
+    """
+    schema = graphene_settings.SCHEMA
+    if transport is None:
+        endpoint = endpoint or crm_setting('GRAPHQL_ENDPOINT')
+        transport = RequestsHTTPTransport(url=endpoint) if endpoint else SchemaTransport(schema)
+    return Client(schema=schema.graphql_schema, transport=transport)
+
+
+@lru_cache(maxsize=64)
+def _parse(query):
+    return gql(query).document
+
+
+def execute(query, variables=None, operation_name=None, client=None):
+    """Run an operation and return its data.
+
+    GraphQL errors raise gql's TransportQueryError, whichever transport ran
+    the operation.
+    """
+    client = client or get_client()
+    request = GraphQLRequest(_parse(query), variable_values=variables, operation_name=operation_name)
+    return client.execute(request)
+
+
+def execute_batch(operations, client=None):
+    """Run ``(query, variables)`` pairs and return their data, in order.
+
+    Over HTTP the operations go in one batched request, so a job that runs
+    several pays for one round trip. Any GraphQL error raises gql's
+    TransportQueryError.
+    """
+    client = client or get_client()
+    requests = [GraphQLRequest(_parse(query), variable_values=variables) for query, variables in operations]
+    return client.execute_batch(requests)
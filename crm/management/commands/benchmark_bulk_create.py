@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from alx_backend_graphql_crm.schema import schema
+
+MUTATION = """
+    mutation BulkCreate($input: [CustomerInput]!) {
+        bulkCreateCustomers(input: $input) {
+            successCount
+            errorCount
+        }
+    }
+"""
+
+
+class Rollback(Exception):
+    """Raised to discard the rows a benchmark run inserted"""
+
+
+class Command(BaseCommand):
+    help = "Measure bulkCreateCustomers throughput (rows/sec) at several payload sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Payload sizes to benchmark',
+        )
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            payload = [
+                {
+                    'name': f'Benchmark Customer {i}',
+                    'email': f'benchmark-{size}-{i}@example.com',
+                    'phone': '+1234567890' if i % 2 else None,
+                }
+                for i in range(size)
+            ]
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    result = schema.execute(MUTATION, variables={'input': payload})
+                    elapsed = time.perf_counter() - started
+                    raise Rollback()
+            except Rollback:
+                pass
+
+            if result.errors:
+                self.stderr.write(f"rows={size}: {result.errors[0]}")
+                continue
+            created = result.data['bulkCreateCustomers']['successCount']
+            self.stdout.write(
+                f"rows={size} created={created} seconds={elapsed:.3f} "
+                f"rows/sec={size / elapsed:,.0f}"
+            )
@@ -0,0 +1,68 @@
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.benchmarks import STOCK_SQLITE, load_dataset, parse_scale, run_concurrent
+
+PROFILES = ('stock', 'project')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read and write throughput under concurrent load, with Django's stock "
+        "SQLite settings and with the project's DATABASES profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='10k', help='Dataset size in orders')
+        parser.add_argument('--threads', type=int, nargs='+', default=[8], help='Concurrent clients')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each run')
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2, help='Fraction of operations that are createOrder'
+        )
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_concurrency compares SQLite profiles')
+        try:
+            orders = parse_scale(options['scale'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict.get(key) for key in (*STOCK_SQLITE, 'TEST')}
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in options['profiles']:
+                # Each profile gets a fresh database file: WAL mode, once
+                # set, sticks to the file
+                if profile == 'stock':
+                    settings_dict.update(STOCK_SQLITE)
+                settings_dict['TEST'] = {**saved['TEST'], 'NAME': str(Path(directory) / f'{profile}.sqlite3')}
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    started = time.perf_counter()
+                    load_dataset(orders)
+                    self.stdout.write(
+                        f"profile={profile} orders={orders} load_seconds={time.perf_counter() - started:.1f}"
+                    )
+                    for threads in options['threads']:
+                        result = run_concurrent(threads, options['seconds'], options['write_ratio'])
+                        self.report(profile, result)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                    settings_dict.update(saved)
+
+    def report(self, profile, result):
+        for kind in ('read', 'write'):
+            stats = result[kind]
+            self.stdout.write(
+                f"profile={profile} threads={result['threads']} kind={kind} "
+                f"per_sec={stats['per_second']:.1f} p50_ms={stats['p50_ms']:.1f} "
+                f"p95_ms={stats['p95_ms']:.1f} failed={stats['failed']}"
+            )
+        for error in result['errors']:
+            self.stdout.write(f"profile={profile} threads={result['threads']} error {error}")
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+# Two independent root fields, so the async view can await them concurrently
+QUERY = """
+    {
+        orders(first: 50) { id totalAmount customer { name } }
+        products(first: 50) { name price stock }
+    }
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare req/s and p99 latency of the sync (WSGI) and async (ASGI) GraphQL views"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests sent to each view per concurrency level',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 10, 50],
+            help='Numbers of requests kept in flight',
+        )
+        parser.add_argument('--query', default=QUERY, help='GraphQL query to send')
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='Keep the response cache on (by default every request executes)',
+        )
+
+    def handle(self, *args, **options):
+        body = json.dumps({'query': options['query']})
+        crm = dict(getattr(settings, 'CRM', {}))
+        if not options['response_cache']:
+            crm['RESPONSE_CACHE_TIMEOUT'] = 0
+
+        # The test clients send requests for the "testserver" host
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(CRM=crm, ALLOWED_HOSTS=allowed_hosts):
+            for concurrency in options['concurrency']:
+                for name, run in (('sync', self.run_sync), ('async', self.run_async)):
+                    started = time.perf_counter()
+                    latencies = run(body, options['requests'], concurrency)
+                    elapsed = time.perf_counter() - started
+                    self.report(name, concurrency, latencies, elapsed)
+
+    def report(self, name, concurrency, latencies, elapsed):
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"view={name} concurrency={concurrency} requests={len(latencies)} "
+            f"req/s={len(latencies) / elapsed:,.0f} "
+            f"p50_ms={statistics.median(latencies) * 1000:.1f} p99_ms={p99 * 1000:.1f}"
+        )
+
+    def run_sync(self, body, requests, concurrency):
+        def request(_):
+            client = Client()
+            started = time.perf_counter()
+            response = client.post('/graphql/', body, content_type='application/json')
+            latency = time.perf_counter() - started
+            self.check_response(response)
+            return latency
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, range(requests)))
+
+    def run_async(self, body, requests, concurrency):
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        '/graphql/async/', body, content_type='application/json'
+                    )
+                    latency = time.perf_counter() - started
+                self.check_response(response)
+                return latency
+
+            return await asyncio.gather(*(request() for _ in range(requests)))
+
+        return list(asyncio.run(run()))
+
+    def check_response(self, response):
+        result = response.json()
+        if response.status_code != 200 or 'errors' in result:
+            raise RuntimeError(f"GraphQL request failed: {result.get('errors')}")
@@ -0,0 +1,56 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import Customer
+from crm.search import search
+
+
+class Command(BaseCommand):
+    help = "Measure search latency (p50/p99) through the FTS5 index and through icontains"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--terms', nargs='+',
+            help='Search terms; by default fragments of random customer names',
+        )
+        parser.add_argument('--runs', type=int, default=200, help='Searches per method')
+        parser.add_argument('--first', type=int, default=20, help='Results per search')
+
+    def handle(self, *args, **options):
+        terms = options['terms'] or self.sample_terms(options['runs'])
+        if not terms:
+            raise CommandError("No customers to take search terms from; pass --terms.")
+        runs = [terms[i % len(terms)] for i in range(options['runs'])]
+        first = options['first']
+        self.stdout.write(f"customers={Customer.objects.count()} runs={len(runs)}")
+
+        self.report('search', runs, lambda term: search(term, first=first))
+        self.report('icontains', runs, lambda term: list(Customer.objects.filter(name__icontains=term)[:first]))
+
+    def sample_terms(self, count):
+        last = Customer.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if last is None:
+            return []
+        names = Customer.objects.filter(
+            pk__in=[random.randint(1, last) for _ in range(count)]
+        ).values_list('name', flat=True)
+        terms = []
+        for name in names:
+            start = random.randint(0, max(0, len(name) - 4))
+            terms.append(name[start:start + 4])
+        return terms
+
+    def report(self, name, runs, run):
+        latencies = []
+        for term in runs:
+            started = time.perf_counter()
+            run(term)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"method={name} p50_ms={statistics.median(latencies) * 1000:.2f} p99_ms={p99 * 1000:.2f}"
+        )
@@ -0,0 +1,83 @@
+import json
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.benchmarks import SEED, SCALES, compare, load_dataset, measure, operations, parse_scale
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmark_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main GraphQL operations (wall time, query count, peak memory) on "
+        "deterministic datasets, optionally failing on regressions against a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', nargs='+', default=['10k'],
+            help=f"Dataset sizes in orders: {', '.join(SCALES)} or a number",
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per operation; the median is kept')
+        parser.add_argument(
+            '--operations', nargs='+', default=['*'],
+            help='Only run operations whose name matches one of these glob patterns',
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument(
+            '--baseline', nargs='?', const=str(BASELINE),
+            help=f'Compare with the results in this JSON file (default {BASELINE.name} next to crm/)',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed fractional growth of time and memory before it counts as a regression',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [(scale, parse_scale(scale)) for scale in options['scales']]
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        # The datasets replace every CRM row, so they go in a throwaway database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = []
+            for scale, orders in scales:
+                started = time.perf_counter()
+                load_dataset(orders)
+                self.stdout.write(f"scale={scale} orders={orders} load_seconds={time.perf_counter() - started:.1f}")
+                for operation in operations():
+                    if not any(fnmatch(operation.name, pattern) for pattern in options['operations']):
+                        continue
+                    result = {'scale': scale, **measure(operation, options['repeat'])}
+                    results.append(result)
+                    self.stdout.write(
+                        f"scale={scale} operation={operation.name} ms={result['seconds'] * 1000:.2f} "
+                        f"min_ms={result['min_seconds'] * 1000:.2f} "
+                        f"queries={result['queries']} peak_kib={result['peak_memory_bytes'] // 1024}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'seed': SEED, 'repeat': options['repeat'], 'results': results}, output, indent=2)
+                output.write('\n')
+
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)['results']
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {error}")
+            regressions = compare(results, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stderr.write(f"regression {regression}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(f"No regressions against {options['baseline']}")
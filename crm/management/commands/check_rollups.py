@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.rollups import find_mismatches, rebuild
+
+
+class Command(BaseCommand):
+    help = "Compare the daily rollups with the raw orders and report the days that differ"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help='First day to check (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help='Last day to check (YYYY-MM-DD)')
+        parser.add_argument('--fix', action='store_true', help='Rebuild every day that differs')
+
+    def handle(self, *args, **options):
+        days = set()
+        for model, key, expected, stored in find_mismatches(options['start'], options['end']):
+            days.add(key[0] if isinstance(key, tuple) else key)
+            self.stdout.write(f"{model._meta.label} {key}: expected {expected}, stored {stored}")
+
+        if not days:
+            self.stdout.write("Rollups match the raw orders.")
+            return
+        if not options['fix']:
+            raise CommandError(f"Rollups differ from the raw orders on {len(days)} day(s).")
+        for day in sorted(days):
+            rebuild(day, day)
+        self.stdout.write(f"Rebuilt {len(days)} day(s).")
@@ -0,0 +1,64 @@
+import time
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import synthetic
+from crm.conf import crm_setting
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic customers, products and orders with realistic skew, "
+        "reproducibly from a seed, through chunked bulk inserts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100_000, help='Customers to create')
+        parser.add_argument('--products', type=int, default=1000, help='Products to create')
+        parser.add_argument('--orders', type=int, default=1_000_000, help='Orders to create')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the random generator')
+        parser.add_argument(
+            '--end', type=datetime.fromisoformat,
+            help='Date the order window ends on (YYYY-MM-DD, default today); fix it to reproduce a dataset',
+        )
+        parser.add_argument('--days', type=int, default=365, help='Length of the order window in days')
+        parser.add_argument(
+            '--batch-size', type=int, default=crm_setting('GENERATE_BATCH_SIZE'),
+            help='Rows per INSERT chunk',
+        )
+        parser.add_argument('--clear', action='store_true', help='Delete all CRM data first')
+
+    def handle(self, *args, **options):
+        if options['orders'] and not (options['customers'] and options['products']):
+            raise CommandError("Orders need at least one customer and one product.")
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--days and --batch-size must be positive.")
+        end = options['end']
+        if end is not None:
+            end = datetime.combine(end.date(), dt_time(), dt_timezone.utc)
+
+        if options['clear']:
+            synthetic.clear()
+
+        started = time.perf_counter()
+
+        def progress(orders, items):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  orders={orders} items={items} rows/sec={(orders + items) / elapsed:,.0f}")
+
+        timings = synthetic.generate(
+            options['customers'], options['products'], options['orders'],
+            seed=options['seed'], end=end, days=options['days'],
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+
+        total = 0
+        for label, (rows, seconds) in timings.items():
+            self.stdout.write(
+                f"{label}: rows={rows} seconds={seconds:.3f} rows/sec={rows / seconds if seconds else 0:,.0f}"
+            )
+            total += rows
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"total: rows={total} seconds={elapsed:.3f} rows/sec={total / elapsed:,.0f}")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.search import INDEXES
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search indexes of customers and products"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--optimize', action='store_true',
+            help='Also merge each index into a single b-tree after rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        for model, index in INDEXES.items():
+            if not index.available():
+                raise CommandError(f"{index.connection.vendor} has no FTS5 index; search uses icontains.")
+            # Recreates the triggers too, in case a table rebuild dropped them
+            index.ensure_triggers(index.connection)
+            started = time.perf_counter()
+            rows = index.rebuild()
+            if options['optimize']:
+                index.optimize()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{model._meta.label}: rows={rows} seconds={elapsed:.3f} rows/sec={rows / elapsed:,.0f}"
+            )
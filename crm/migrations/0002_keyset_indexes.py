@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['name', 'id'], name='crm_customer_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'id'], name='crm_order_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='crm_product_name_id_idx'),
+        ),
+    ]
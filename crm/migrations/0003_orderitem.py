@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def copy_order_products(apps, schema_editor):
+    """Turn every existing order/product link into a quantity-1 item priced at today's price"""
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    db = schema_editor.connection.alias
+
+    links = Order.products.through.objects.using(db).select_related('product').order_by('pk')
+    items = [
+        OrderItem(
+            order_id=link.order_id,
+            product_id=link.product_id,
+            quantity=1,
+            unit_price=link.product.price,
+            line_total=link.product.price,
+        )
+        for link in links.iterator(chunk_size=2000)
+    ]
+    OrderItem.objects.using(db).bulk_create(items, batch_size=2000)
+
+    totals = (
+        OrderItem.objects.using(db)
+        .filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(total=Sum('line_total'))
+        .values('total')
+    )
+    Order.objects.using(db).update(
+        total_amount=Coalesce(Subquery(totals), Decimal('0'), output_field=models.DecimalField())
+    )
+
+
+def copy_items_back(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    db = schema_editor.connection.alias
+    Order.products.through.objects.using(db).bulk_create(
+        [
+            Order.products.through(order_id=order_id, product_id=product_id)
+            for order_id, product_id in OrderItem.objects.using(db).values_list('order_id', 'product_id')
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('line_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='crm_orderitem_order_product_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_order_products, copy_items_back),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Roll up the orders that exist already"""
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    DailyRevenue = apps.get_model('crm', 'DailyRevenue')
+    DailyProductSales = apps.get_model('crm', 'DailyProductSales')
+    db = schema_editor.connection.alias
+
+    revenue = (
+        Order.objects.using(db)
+        .annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(order_count=Count('id'), revenue=Sum('total_amount'), customer_count=Count('customer_id', distinct=True))
+        .order_by('day')
+    )
+    DailyRevenue.objects.using(db).bulk_create([DailyRevenue(**row) for row in revenue], batch_size=2000)
+
+    sales = (
+        OrderItem.objects.using(db)
+        .annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum('line_total'))
+        .order_by('day', 'product_id')
+    )
+    DailyProductSales.objects.using(db).bulk_create([DailyProductSales(**row) for row in sales], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_orderitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='crm.product')),
+            ],
+            options={
+                'ordering': ['day', 'product'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='crm_dailyproductsales_day_product_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
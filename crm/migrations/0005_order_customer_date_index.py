@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+        ),
+    ]
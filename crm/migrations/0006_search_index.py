@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:00
+
+from django.db import migrations
+
+# FTS5 trigram indexes over the customer and product text, kept in step with
+# the model tables by triggers; written out as of this migration rather than
+# generated by crm.search, so later changes there don't alter it.
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS crm_customer_search USING fts5("
+    "name, email, content='crm_customer', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS crm_customer_search_ai AFTER INSERT ON crm_customer BEGIN "
+    "INSERT INTO crm_customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS crm_customer_search_ad AFTER DELETE ON crm_customer BEGIN "
+    "INSERT INTO crm_customer_search(crm_customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS crm_customer_search_au AFTER UPDATE OF name, email ON crm_customer BEGIN "
+    "INSERT INTO crm_customer_search(crm_customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO crm_customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    # Index the rows that already exist
+    "INSERT INTO crm_customer_search(crm_customer_search) VALUES ('rebuild')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS crm_product_search USING fts5("
+    "name, content='crm_product', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS crm_product_search_ai AFTER INSERT ON crm_product BEGIN "
+    "INSERT INTO crm_product_search(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS crm_product_search_ad AFTER DELETE ON crm_product BEGIN "
+    "INSERT INTO crm_product_search(crm_product_search, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS crm_product_search_au AFTER UPDATE OF name ON crm_product BEGIN "
+    "INSERT INTO crm_product_search(crm_product_search, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO crm_product_search(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO crm_product_search(crm_product_search) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS crm_customer_search_ai",
+    "DROP TRIGGER IF EXISTS crm_customer_search_ad",
+    "DROP TRIGGER IF EXISTS crm_customer_search_au",
+    "DROP TABLE IF EXISTS crm_customer_search",
+    "DROP TRIGGER IF EXISTS crm_product_search_ai",
+    "DROP TRIGGER IF EXISTS crm_product_search_ad",
+    "DROP TRIGGER IF EXISTS crm_product_search_au",
+    "DROP TABLE IF EXISTS crm_product_search",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_order_customer_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at'], name='crm_customer_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['phone'], name='crm_customer_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount'], name='crm_order_total_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='crm_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock'], name='crm_product_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__lt', 10)), fields=['name', 'id'], name='crm_product_low_stock_idx'),
+        ),
+    ]
@@ -1,7 +1,14 @@
 # crm/models.py
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from .response_cache import bump_model_version
 from django.core.validators import EmailValidator
 import re
+from decimal import Decimal
 from django.core.exceptions import ValidationError
 
 
@@ -26,6 +33,67 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='crm_customer_name_id_idx'),
+            # One per CustomerFilter range; name and email use the search index
+            models.Index(fields=['created_at'], name='crm_customer_created_at_idx'),
+            models.Index(fields=['phone'], name='crm_customer_phone_idx'),
+        ]
+
+
+class ProductManager(models.Manager):
+    def restock_low_stock(self, threshold, increment):
+        """Add ``increment`` to every product below ``threshold`` in one UPDATE.
+
+        The stock change is applied with F() so concurrent writes are not
+        lost. Updated rows come back through RETURNING where the backend
+        supports it, otherwise through one read keyed on the new updated_at.
+        """
+        queryset = self.get_queryset().filter(stock__lt=threshold)
+        now = timezone.now()
+        values = {'stock': F('stock') + increment, 'updated_at': now}
+
+        connection = connections[queryset.db]
+        if _supports_update_returning(connection):
+            query = queryset.query.chain(UpdateQuery)
+            query.add_update_values(values)
+            sql, params = query.get_compiler(queryset.db).as_sql()
+            fields = self.model._meta.concrete_fields
+            columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+            with connection.cursor() as cursor:
+                cursor.execute(f'{sql} RETURNING {columns}', params)
+                rows = cursor.fetchall()
+            field_names = [field.attname for field in fields]
+            products = [
+                self.model.from_db(queryset.db, field_names, _convert_row(connection, fields, row))
+                for row in rows
+            ]
+            products = sorted(products, key=lambda product: (product.name, product.pk))
+        else:
+            queryset.update(**values)
+            products = list(self.get_queryset().filter(updated_at=now))
+
+        # UPDATE statements send no post_save, so invalidate cached reads here
+        bump_model_version(self.model)
+        return products
+
+
+def _supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    # SQLite gained RETURNING in 3.35, the same release Django keys this flag on
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _convert_row(connection, fields, row):
+    """Apply the backend's from-db converters to a raw RETURNING row"""
+    values = []
+    for field, value in zip(fields, row):
+        expression = field.get_col(field.model._meta.db_table)
+        for converter in connection.ops.get_db_converters(expression) + expression.get_db_converters(connection):
+            value = converter(value, expression, connection)
+        values.append(value)
+    return values
 
 
 class Product(models.Model):
@@ -35,6 +103,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductManager()
+
     def __str__(self):
         return self.name
 
@@ -44,28 +114,103 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='crm_product_name_id_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # lowStock pages in name order, and the restock UPDATE, read only
+            # these rows. Built for the default LOW_STOCK_THRESHOLD; with any
+            # other threshold the stock index serves instead.
+            models.Index(fields=['name', 'id'], condition=models.Q(stock__lt=10), name='crm_product_low_stock_idx'),
+        ]
 
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     order_date = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def calculate_total(self):
-        """Calculate total amount from associated products"""
-        return sum(product.price for product in self.products.all())
+        """Calculate total amount from the order's line totals"""
+        return self.items.aggregate(total=Coalesce(Sum('line_total'), Decimal('0')))['total']
+
+    def __str__(self):
+        return f"Order {self.id} - {self.customer.name}"
+
+    class Meta:
+        ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['order_date', 'id'], name='crm_order_date_id_idx'),
+            # Serves "has this customer ordered since ..." without reading the rows
+            models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_amount_idx'),
+        ]
+
+
+class OrderItem(models.Model):
+    """A product on an order, with the price it was bought at"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_line_total = instance.__dict__.get('line_total')
+        instance._saved_quantity = instance.__dict__.get('quantity')
+        instance._saved_product_id = instance.__dict__.get('product_id')
+        return instance
 
     def save(self, *args, **kwargs):
+        if self._state.adding and not self.unit_price:
+            self.unit_price = self.product.price
+        self.unit_price = self._meta.get_field('unit_price').to_python(self.unit_price)
+        self.line_total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
-        if self.products.exists():
-            self.total_amount = self.calculate_total()
-            super().save(update_fields=['total_amount'])
 
     def __str__(self):
-        return f"Order {self.id} - {self.customer.name}"
+        return f"{self.quantity} x {self.product_id} on order {self.order_id}"
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='crm_orderitem_order_product_uniq'),
+        ]
+
+
+# Reporting rollups, kept current by the handlers in crm/signals.py (see
+# crm/rollups.py) and rebuilt from the raw tables by rebuild_rollups.
+class DailyRevenue(models.Model):
+    """Orders placed on one day, in the current time zone"""
+    day = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    customer_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.order_count} orders, {self.revenue}"
+
+    class Meta:
+        ordering = ['day']
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue of one product over the orders placed on one day"""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.units} x {self.product_id}"
 
     class Meta:
-        ordering = ['-order_date']
\ No newline at end of file
+        ordering = ['day', 'product']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='crm_dailyproductsales_day_product_uniq'),
+        ]
@@ -0,0 +1,180 @@
+# crm/nplusone.py
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from inspect import isawaitable
+
+from django.db import connections
+
+from .conf import crm_setting
+
+logger = logging.getLogger(__name__)
+
+# The QueryLog of the GraphQL operation running in this context
+_current = ContextVar('crm_nplusone', default=None)
+# The field whose resolver started last: SQL run while resolving it, or
+# while its lazy result (a QuerySet, a related manager) is iterated, is
+# charged to it
+_field = ContextVar('crm_nplusone_field', default=None)
+# (violations, threshold) of each enclosing detect_n_plus_one() block
+_watchers = ContextVar('crm_nplusone_watchers', default=())
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_SPACE = re.compile(r'\s+')
+# IN lists and multi-row VALUES of several parameters: the statement is a
+# batch already, however often a chunked loop repeats it
+_BATCH = re.compile(r"\bIN\s*\(\s*(?:%s|\?)\s*,|\bVALUES\s*\([^()]*\)\s*,\s*\(", re.IGNORECASE)
+# Transaction control says nothing about how data is fetched
+_IGNORED = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+
+class NPlusOneError(Exception):
+    """An operation ran the same SQL for each object of a list"""
+
+    def __init__(self, violations):
+        self.violations = violations
+        super().__init__('\n'.join(str(violation) for violation in violations))
+
+
+def statement_shape(sql):
+    """``sql`` with its literals and IN lists replaced, so that queries
+    differing only in their parameters compare equal"""
+    sql = _LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class Violation:
+    """One statement shape that a field ran more often than the threshold"""
+
+    def __init__(self, operation_name, field, path, statement, count):
+        self.operation_name = operation_name
+        self.field = field
+        self.path = path
+        self.statement = statement
+        self.count = count
+
+    def __str__(self):
+        return (
+            f'N+1 queries in {self.operation_name}: {self.field} (at {self.path}) ran '
+            f'{self.count} queries shaped like {self.statement!r}; batch {self.field} '
+            f'with select_related/prefetch_related or a DataLoader'
+        )
+
+
+class QueryLog:
+    """SQL run by one operation, counted by statement shape and field"""
+
+    def __init__(self, operation_name):
+        self.operation_name = operation_name or 'anonymous'
+        # (shape, field, path) -> queries
+        self.counts = Counter()
+
+    def add(self, sql, many, info):
+        if many or sql.lstrip()[:10].upper().startswith(_IGNORED) or _BATCH.search(sql):
+            return
+        if info is None:
+            field = path = self.operation_name
+        else:
+            field = f'{info.parent_type.name}.{info.field_name}'
+            # List indices are left out: the same field of every list item
+            # shares one path
+            path = '.'.join(key for key in info.path.as_list() if isinstance(key, str))
+        self.counts[statement_shape(sql), field, path] += 1
+
+    def violations(self, threshold):
+        return [
+            Violation(self.operation_name, field, path, shape, count)
+            for (shape, field, path), count in self.counts.most_common()
+            if count > threshold
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the current QueryLog"""
+    log = _current.get()
+    if log is not None:
+        log.add(sql, many, _field.get())
+    return execute(sql, params, many, context)
+
+
+def install_query_log(connection, **kwargs):
+    """Add record_query to a connection's execute wrappers; a connection_created receiver"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def detection_enabled():
+    """Whether operations run now are checked, by setting or detect_n_plus_one()"""
+    return bool(crm_setting('NPLUSONE') or _watchers.get())
+
+
+@contextmanager
+def detecting(operation_name):
+    """Log the SQL of the operation run in the block and act on its N+1 patterns.
+
+    Violations go to the enclosing detect_n_plus_one() blocks, if any, and
+    otherwise are logged or raised as NPlusOneError as the NPLUSONE setting
+    says.
+    """
+    for connection in connections.all(initialized_only=True):
+        install_query_log(connection)
+    log = QueryLog(operation_name)
+    token = _current.set(log)
+    field_token = _field.set(None)
+    try:
+        yield log
+    finally:
+        _field.reset(field_token)
+        _current.reset(token)
+
+    watchers = _watchers.get()
+    for violations, threshold in watchers:
+        violations.extend(log.violations(threshold))
+    if watchers:
+        return
+    violations = log.violations(crm_setting('NPLUSONE_THRESHOLD'))
+    if violations and crm_setting('NPLUSONE') == 'raise':
+        raise NPlusOneError(violations)
+    for violation in violations:
+        logger.warning('%s', violation)
+
+
+@contextmanager
+def detect_n_plus_one(threshold=None, raise_violations=True):
+    """Check every GraphQL operation run in the block for N+1 queries.
+
+    Yields the list the violations are collected in; unless
+    ``raise_violations`` is False, leaving the block with any raises
+    NPlusOneError. ``threshold`` overrides NPLUSONE_THRESHOLD, the number
+    of same-shaped queries one field may run.
+    """
+    if threshold is None:
+        threshold = crm_setting('NPLUSONE_THRESHOLD')
+    violations = []
+    token = _watchers.set((*_watchers.get(), (violations, threshold)))
+    try:
+        yield violations
+    finally:
+        _watchers.reset(token)
+    if violations and raise_violations:
+        raise NPlusOneError(violations)
+
+
+class NPlusOneMiddleware:
+    """graphene middleware marking the field each resolver belongs to"""
+
+    def resolve(self, next, root, info, **args):
+        if _current.get() is not None:
+            _field.set(info)
+        result = next(root, info, **args)
+        if isawaitable(result):
+            return self._resolving(result, info)
+        return result
+
+    async def _resolving(self, result, info):
+        _field.set(info)
+        return await result
@@ -0,0 +1,100 @@
+# crm/optimizer.py
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+PAGINATION_ARGS = ('first', 'last', 'before', 'after', 'offset', 'keyset')
+
+
+def optimize_queryset(queryset, info):
+    """Add the joins and prefetches the requested selection set needs.
+
+    Forward foreign keys become ``select_related`` and to-many relations become
+    ``Prefetch`` objects whose querysets are optimized recursively, following
+    relay ``edges { node { ... } }`` wrappers at every level.
+    """
+    selections = []
+    for field_node in info.field_nodes:
+        selections.extend(_node_selections(field_node, info))
+    return _optimize(queryset, selections, info)
+
+
+def _optimize(queryset, selections, info):
+    select_related, prefetches = _lookups(queryset.model, selections, info)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+
+def _lookups(model, selections, info):
+    """Collect select_related names and Prefetch objects for a selection set"""
+    relations = {}
+    for field_node in _fields(selections, info):
+        name = to_snake_case(field_node.name.value)
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if not field.is_relation or _has_filter_arguments(field_node):
+            continue
+        relations.setdefault(name, (field, []))[1].extend(
+            _node_selections(field_node, info)
+        )
+
+    select_related, prefetches = [], []
+    for name, (field, child_selections) in relations.items():
+        related_model = field.related_model
+        if field.many_to_one or (field.one_to_one and field.concrete):
+            nested_select, nested_prefetches = _lookups(related_model, child_selections, info)
+            select_related.append(name)
+            select_related.extend(f'{name}__{lookup}' for lookup in nested_select)
+            prefetches.extend(
+                Prefetch(f'{name}__{prefetch.prefetch_through}', queryset=prefetch.queryset)
+                for prefetch in nested_prefetches
+            )
+        else:
+            related_queryset = _optimize(
+                related_model._default_manager.all(), child_selections, info
+            )
+            prefetches.append(Prefetch(name, queryset=related_queryset))
+    return select_related, prefetches
+
+
+def _has_filter_arguments(field_node):
+    """Filtered relations are re-queried per row, so prefetching them is wasted"""
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for argument in field_node.arguments or ()
+    )
+
+
+def _node_selections(field_node, info):
+    """Return the selections made on a field's object, unwrapping connections"""
+    if field_node.selection_set is None:
+        return []
+    selections = list(field_node.selection_set.selections)
+    edges = [node for node in _fields(selections, info) if node.name.value == 'edges']
+    if not edges:
+        return selections
+
+    node_selections = []
+    for edge in edges:
+        for node in _fields(edge.selection_set.selections, info):
+            if node.name.value == 'node' and node.selection_set is not None:
+                node_selections.extend(node.selection_set.selections)
+    return node_selections
+
+
+def _fields(selections, info):
+    """Yield field nodes, flattening inline fragments and fragment spreads"""
+    for selection in selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _fields(selection.selection_set.selections, info)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            yield from _fields(fragment.selection_set.selections, info)
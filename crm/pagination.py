@@ -0,0 +1,146 @@
+# crm/pagination.py
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from graphql import GraphQLError
+from graphql_relay import from_global_id
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+
+
+def keyset_ordering(model):
+    """Return the model's Meta.ordering with the primary key as tiebreaker.
+
+    The tiebreaker follows the direction of the last sort key so the whole
+    ordering can be served by a single (sort key, id) index.
+    """
+    ordering = list(model._meta.ordering)
+    descending = bool(ordering) and ordering[-1].startswith('-')
+    ordering.append('-pk' if descending else 'pk')
+    return ordering
+
+
+def encode_cursor(instance, ordering):
+    """Encode the sort key values of a row into an opaque cursor"""
+    values = []
+    for field in ordering:
+        value = getattr(instance, field.lstrip('-'))
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    payload = KEYSET_CURSOR_PREFIX + json.dumps(values, default=str)
+    return base64.b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    """Decode a cursor made by ``encode_cursor`` back into field values"""
+    try:
+        payload = base64.b64decode(cursor).decode()
+        if not payload.startswith(KEYSET_CURSOR_PREFIX):
+            raise ValueError(cursor)
+        values = json.loads(payload[len(KEYSET_CURSOR_PREFIX):])
+        if len(values) != len(ordering):
+            raise ValueError(cursor)
+        return [
+            _model_field(model, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValueError, ValidationError):
+        raise GraphQLError(f"Invalid keyset cursor: {cursor}")
+
+
+def _model_field(model, name):
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def seek_filter(ordering, values, forward=True):
+    """Build the row-value comparison selecting rows past a cursor.
+
+    For ordering ``(a, b)`` and cursor ``(x, y)`` moving forward this is
+    ``a >= x AND (a > x OR (a = x AND b > y))``, with each comparison flipped
+    for descending keys or when moving backward. The leading ``a >= x`` is
+    implied by the rest, but without it SQLite cannot seek the (a, b) index
+    to the cursor and reads it from the start instead.
+    """
+    condition = Q()
+    for position in reversed(range(len(ordering))):
+        field = ordering[position]
+        name = field.lstrip('-')
+        ascending = not field.startswith('-')
+        lookup = 'gt' if ascending == forward else 'lt'
+        step = Q(**{f'{name}__{lookup}': values[position]})
+        if position < len(ordering) - 1:
+            step |= Q(**{name: values[position]}) & condition
+        condition = step
+    if len(ordering) > 1:
+        field = ordering[0]
+        lookup = 'gte' if (not field.startswith('-')) == forward else 'lte'
+        condition = Q(**{f'{field.lstrip("-")}__{lookup}': values[0]}) & condition
+    return condition
+
+
+def seek_after_pk(queryset, pk, type_name):
+    """Restrict a queryset to the rows that sort after the row with ``pk``.
+
+    ``pk`` may be a raw primary key or a relay global id of ``type_name``.
+    The queryset must already be ordered by ``keyset_ordering``.
+    """
+    global_id = from_global_id(pk)
+    if global_id.type:
+        if global_id.type != type_name:
+            raise GraphQLError(f"Cursor {pk} is not a {type_name} id.")
+        pk = global_id.id
+    model = queryset.model
+    ordering = keyset_ordering(model)
+    fields = [field.lstrip('-') for field in ordering]
+    row = model._default_manager.filter(pk=pk).values_list(*fields).first()
+    if row is None:
+        raise GraphQLError(f"{model.__name__} {pk} does not exist.")
+    return queryset.filter(seek_filter(ordering, row))
+
+
+def paginate_keyset(queryset, args, max_limit=None):
+    """Slice a queryset by sort key instead of offset.
+
+    Returns the page of rows plus relay page info values. Only one extra row
+    is read to find out whether another page exists; nothing is counted.
+    """
+    if args.get('offset') is not None:
+        raise GraphQLError("`offset` cannot be combined with keyset pagination.")
+
+    first, last = args.get('first'), args.get('last')
+    after, before = args.get('after'), args.get('before')
+    if first is None and last is None:
+        first = max_limit
+
+    model = queryset.model
+    ordering = keyset_ordering(model)
+    queryset = queryset.order_by(*ordering)
+    if after:
+        queryset = queryset.filter(seek_filter(ordering, decode_cursor(after, model, ordering)))
+    if before:
+        queryset = queryset.filter(
+            seek_filter(ordering, decode_cursor(before, model, ordering), forward=False)
+        )
+
+    if last is not None and first is None:
+        # Walk backwards from the end of the window, then restore the order.
+        reversed_ordering = [
+            field[1:] if field.startswith('-') else '-' + field for field in ordering
+        ]
+        rows = list(queryset.order_by(*reversed_ordering)[:last + 1])
+        has_previous_page = len(rows) > last
+        nodes = rows[:last][::-1]
+        has_next_page = bool(before)
+    else:
+        rows = list(queryset[:first + 1] if first is not None else queryset)
+        has_next_page = first is not None and len(rows) > first
+        nodes = rows[:first] if first is not None else rows
+        if last is not None and len(nodes) > last:
+            nodes = nodes[-last:]
+            has_previous_page = True
+        else:
+            has_previous_page = bool(after)
+
+    cursors = [encode_cursor(node, ordering) for node in nodes]
+    return nodes, cursors, has_previous_page, has_next_page
@@ -0,0 +1,192 @@
+# crm/query_cost.py
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    is_composite_type,
+    value_from_ast,
+)
+
+from .conf import crm_setting
+
+# Fields that only wrap a connection's nodes; they add neither cost nor depth
+RELAY_WRAPPERS = ('edges', 'node', 'pageInfo')
+
+
+class QueryCost:
+    """Estimated cost and depth of one operation, with the limits it is checked against
+
+    Every object a field can return costs 1, so a field's cost is the number
+    of objects it returns times the number of parents it is resolved for.
+    Connections and ``first``-bounded lists count ``first``/``last`` objects
+    per parent, or the argument's default. Without either, top-level fields
+    count the page they return (the relay page limit or LIST_MAX_LIMIT) and
+    nested fields, like other lists, QUERY_COST_LIST_SIZE.
+    """
+
+    def __init__(self, schema, fragments, variables):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.cost = 0
+        self.depth = 0
+        self.max_cost = crm_setting('QUERY_MAX_COST')
+        self.max_depth = crm_setting('QUERY_MAX_DEPTH')
+
+    def as_extension(self):
+        return {
+            'requested': self.cost,
+            'maximum': self.max_cost,
+            'depth': self.depth,
+            'maxDepth': self.max_depth,
+        }
+
+    def errors(self, node=None):
+        errors = []
+        extensions = {'code': 'QUERY_TOO_COMPLEX', 'cost': self.as_extension()}
+        if self.max_depth is not None and self.depth > self.max_depth:
+            errors.append(GraphQLError(
+                f"Query depth {self.depth} exceeds the maximum depth of {self.max_depth}.",
+                node, extensions=extensions,
+            ))
+        if self.max_cost is not None and self.cost > self.max_cost:
+            errors.append(GraphQLError(
+                f"Query cost {self.cost} exceeds the maximum cost of {self.max_cost}.",
+                node, extensions=extensions,
+            ))
+        return errors
+
+    def add_operation(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        if root_type is not None:
+            self.add_selections(root_type, operation.selection_set, 1, 0)
+
+    def add_selections(self, parent_type, selection_set, multiplier, depth):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                self.add_field(parent_type, selection, multiplier, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                self.add_selections(fragment_type, selection.selection_set, multiplier, depth)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                    self.add_selections(fragment_type, fragment.selection_set, multiplier, depth)
+
+    def add_field(self, parent_type, node, multiplier, depth):
+        name = node.name.value
+        if name.startswith('__') or not isinstance(parent_type, GraphQLObjectType):
+            return
+        field = parent_type.fields.get(name)
+        if field is None or not is_composite_type(get_named_type(field.type)):
+            return
+
+        if name in RELAY_WRAPPERS and _is_relay_type(parent_type):
+            self.add_selections(get_named_type(field.type), node.selection_set, multiplier, depth)
+            return
+
+        multiplier *= self.field_size(field, node, nested=depth > 0)
+        depth += 1
+        self.cost += multiplier
+        self.depth = max(self.depth, depth)
+        if node.selection_set is not None:
+            self.add_selections(get_named_type(field.type), node.selection_set, multiplier, depth)
+
+    def field_size(self, field, node, nested):
+        """Number of objects ``field`` returns for a single parent
+
+        Fields nested under another object default to QUERY_COST_LIST_SIZE:
+        a customer's orders are a handful, not a full page.
+        """
+        field_type = get_nullable_type(field.type)
+        if _is_connection_type(get_named_type(field_type)):
+            size = self.page_size(field, node, 'first')
+            if size is None:
+                size = self.page_size(field, node, 'last')
+            if size is None:
+                size = crm_setting('QUERY_COST_LIST_SIZE') if nested else graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+            return size
+        if isinstance(field_type, GraphQLList):
+            if 'first' in field.args:
+                size = self.page_size(field, node, 'first')
+                if size is None:
+                    size = crm_setting('QUERY_COST_LIST_SIZE') if nested else crm_setting('LIST_MAX_LIMIT')
+                return size
+            return crm_setting('QUERY_COST_LIST_SIZE')
+        return 1
+
+    def page_size(self, field, node, name):
+        """The ``name`` page size argument's value or schema default, or None
+        unless it is a non-negative int"""
+        argument_def = field.args.get(name)
+        if argument_def is None:
+            return None
+        value = argument_def.default_value
+        for argument in node.arguments or ():
+            if argument.name.value == name:
+                # Mistyped variables are caught by validation and execution;
+                # here they only fall back to the default size
+                value = value_from_ast(argument.value, argument_def.type, self.variables)
+        if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+            return value
+        return None
+
+
+def _is_connection_type(graphql_type):
+    fields = getattr(graphql_type, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def _is_relay_type(graphql_type):
+    # Connection and edge types; pageInfo is a plain object and costs nothing
+    return _is_connection_type(graphql_type) or 'cursor' in graphql_type.fields
+
+
+def query_cost_rule(variables, operation_name, costs):
+    """Build a validation rule that rejects operations over the cost or depth budget.
+
+    Argument values can come from ``variables``, so the rule is built per
+    request rather than cached with the document. The computed QueryCost of
+    the executed operation is appended to ``costs``.
+    """
+
+    class QueryCostRule(ValidationRule):
+        def enter_document(self, node, *_args):
+            fragments = {
+                definition.name.value: definition
+                for definition in node.definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            }
+            operations = [
+                definition for definition in node.definitions
+                if isinstance(definition, OperationDefinitionNode)
+                and (operation_name is None or getattr(definition.name, 'value', None) == operation_name)
+            ]
+            for operation in operations[:1]:
+                cost = QueryCost(self.context.schema, fragments, variables)
+                try:
+                    cost.add_operation(operation)
+                except Exception as error:
+                    self.report_error(GraphQLError(
+                        f"Could not estimate the query cost: {error}",
+                        operation, original_error=error,
+                    ))
+                    return self.SKIP
+                costs.append(cost)
+                for error in cost.errors(operation):
+                    self.report_error(error)
+            return self.SKIP
+
+    return QueryCostRule
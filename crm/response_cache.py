@@ -0,0 +1,118 @@
+# crm/response_cache.py
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+
+from .conf import crm_setting
+
+VERSION_KEY = 'crm:model-version:{}'
+RESPONSE_KEY = 'crm:response:{}'
+
+
+def get_cache():
+    return caches[crm_setting('RESPONSE_CACHE_ALIAS')]
+
+
+def bump_model_version(*models):
+    """Invalidate every cached response that read any of ``models``.
+
+    Versions are bumped straight away and again once the surrounding
+    transaction commits, so a read that slips in before the commit cannot
+    leave pre-commit data cached under the current version.
+    """
+    def bump():
+        cache = get_cache()
+        for model in models:
+            key = VERSION_KEY.format(model._meta.label_lower)
+            try:
+                cache.incr(key)
+            except ValueError:
+                _init_version(cache, key)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _init_version(cache, key):
+    # Versions start from the clock rather than 0 so a version that was
+    # evicted never comes back with a value older entries were stored under.
+    cache.add(key, time.time_ns(), timeout=None)
+
+
+class _ModelCollector(Visitor):
+    """Collect the models behind every object type an operation selects from"""
+
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.labels = set()
+
+    def enter_field(self, node, *args):
+        for graphql_type in (self.type_info.get_parent_type(), self.type_info.get_type()):
+            graphene_type = getattr(get_named_type(graphql_type), 'graphene_type', None)
+            for model in _type_models(graphene_type):
+                self.labels.add(model._meta.label_lower)
+
+
+def _type_models(graphene_type):
+    if graphene_type is None:
+        return []
+    # Types that aggregate over tables without exposing rows list them here
+    models = list(getattr(graphene_type, 'cache_models', ()))
+    meta = getattr(graphene_type, '_meta', None)
+    model = getattr(meta, 'model', None)
+    if model is not None:
+        models.append(model)
+    node = getattr(meta, 'node', None)
+    if node is not None:
+        models.extend(_type_models(node))
+    return models
+
+
+def document_models(schema, document):
+    """Return the labels of the models a document can read, sorted"""
+    type_info = TypeInfo(schema)
+    collector = _ModelCollector(type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    return sorted(collector.labels)
+
+
+class ResponseCache:
+    """Cache of query results keyed by document, variables, viewer and data versions"""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def key(self, entry, operation_name, variables, viewer):
+        if entry.cache_info is None:
+            normalized = hashlib.sha256(print_ast(entry.document).encode()).hexdigest()
+            entry.cache_info = (normalized, document_models(self.schema, entry.document))
+        normalized, labels = entry.cache_info
+
+        version_keys = [VERSION_KEY.format(label) for label in labels]
+        cache = get_cache()
+        versions = cache.get_many(version_keys)
+        missing = [key for key in version_keys if key not in versions]
+        if missing:
+            for key in missing:
+                _init_version(cache, key)
+            versions.update(cache.get_many(missing))
+        parts = [
+            normalized,
+            operation_name or '',
+            json.dumps(variables or {}, sort_keys=True, default=str),
+            str(viewer),
+            [(label, versions.get(key, 0)) for label, key in zip(labels, version_keys)],
+        ]
+        digest = hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+        return RESPONSE_KEY.format(digest)
+
+    def get(self, key):
+        return get_cache().get(key)
+
+    def set(self, key, data):
+        get_cache().set(key, data, crm_setting('RESPONSE_CACHE_TIMEOUT'))
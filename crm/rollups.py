@@ -0,0 +1,363 @@
+# crm/rollups.py
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Max, Min, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import DailyProductSales, DailyRevenue, Order, OrderItem
+from .response_cache import bump_model_version
+
+# DailyRevenue and DailyProductSales are maintained with deltas: every write
+# that moves an order's total or an item's units adds the difference to the
+# row of the order's day. Distinct customers cannot be maintained that way,
+# so a day's customer_count is recounted whenever one of its orders is added,
+# removed or reassigned.
+
+CENTS = Decimal('0.01')
+PERIODS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def order_day(order_date):
+    """The rollup day of an order, in the current time zone"""
+    return timezone.localdate(order_date)
+
+
+def day_bounds(start=None, end=None):
+    """Aware datetimes covering the days [start, end]; either end may be open"""
+    tz = timezone.get_current_timezone()
+    lower = upper = None
+    if start is not None:
+        lower = timezone.make_aware(datetime.combine(start, time.min), tz)
+    if end is not None:
+        upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    return lower, upper
+
+
+def _orders_between(start=None, end=None):
+    # Range on the raw column so the order_date index applies
+    lower, upper = day_bounds(start, end)
+    orders = Order.objects.all()
+    if lower is not None:
+        orders = orders.filter(order_date__gte=lower)
+    if upper is not None:
+        orders = orders.filter(order_date__lt=upper)
+    return orders
+
+
+def _days_between(queryset, start=None, end=None):
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+    return queryset
+
+
+def _add(model, keys, rows):
+    """Add counter deltas to rollup rows, creating the rows on first use.
+
+    ``rows`` are dicts holding the ``keys`` fields and the deltas. On
+    backends with INSERT ... ON CONFLICT this is one statement for all rows.
+    """
+    rows = [row for row in rows if any(row[name] for name in row if name not in keys)]
+    if not rows:
+        return
+    # Raw INSERTs get no model defaults, so spell out every counter
+    counters = [
+        field.attname for field in model._meta.concrete_fields
+        if not field.primary_key and field.attname not in keys
+    ]
+    rows = [
+        {**{name: row[name] for name in keys}, **{name: row.get(name, 0) for name in counters}}
+        for row in rows
+    ]
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor in ('sqlite', 'postgresql'):
+        _upsert(connection, model, keys, rows)
+        return
+    for row in rows:
+        lookup = {name: row[name] for name in keys}
+        deltas = {name: value for name, value in row.items() if name not in keys}
+        matching = model.objects.filter(**lookup)
+        increments = {name: F(name) + delta for name, delta in deltas.items()}
+        if matching.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**row)
+        except IntegrityError:
+            # Another writer created the row since the UPDATE missed it
+            matching.update(**increments)
+
+
+def _upsert(connection, model, keys, rows):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = [quote(field.column) for field in fields]
+    key_columns = [quote(field.column) for field in fields if field.name in keys or field.attname in keys]
+    increments = ', '.join(
+        f'{column} = {table}.{column} + EXCLUDED.{column}'
+        for column in columns if column not in key_columns
+    )
+    values = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(rows))
+    params = [
+        field.get_db_prep_save(row[name], connection)
+        for row in rows
+        for name, field in zip(row, fields)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {values} '
+            f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET {increments}',
+            params,
+        )
+
+
+def _recount_customers(day):
+    customers = (
+        _orders_between(day, day)
+        .order_by()
+        .annotate(day=Value(day))
+        .values('day')
+        .annotate(count=Count('customer_id', distinct=True))
+        .values('count')
+    )
+    DailyRevenue.objects.filter(day=day).update(customer_count=Coalesce(Subquery(customers), 0))
+
+
+def add_order(order_date, total_amount, sign=1):
+    """Count an order in (``sign=1``) or out of (``sign=-1``) its day"""
+    day = order_day(order_date)
+    _add(DailyRevenue, ('day',), [{'day': day, 'order_count': sign, 'revenue': sign * total_amount}])
+    _recount_customers(day)
+
+
+def add_revenue(order_date, delta):
+    """Record a change of an order's total"""
+    _add(DailyRevenue, ('day',), [{'day': order_day(order_date), 'revenue': delta}])
+
+
+def add_sales(order_date, sales):
+    """Record ``(product_id, units, revenue)`` deltas of items on an order"""
+    day = order_day(order_date)
+    _add(DailyProductSales, ('day', 'product_id'), [
+        {'day': day, 'product_id': product_id, 'units': units, 'revenue': revenue}
+        for product_id, units, revenue in sales
+    ])
+
+
+def add_bulk(revenue, sales, batch_size=1000):
+    """Fold the deltas of rows inserted without signals (bulk loads) into the rollups.
+
+    ``revenue`` maps days to ``(orders, revenue)`` and ``sales`` maps
+    ``(day, product_id)`` to ``(units, revenue)``. Customer counts of the
+    days touched are recounted afterwards.
+    """
+    revenue_rows = [
+        {'day': day, 'order_count': orders, 'revenue': amount}
+        for day, (orders, amount) in sorted(revenue.items())
+    ]
+    sales_rows = [
+        {'day': day, 'product_id': product_id, 'units': units, 'revenue': amount}
+        for (day, product_id), (units, amount) in sorted(sales.items())
+    ]
+    with transaction.atomic():
+        for model, keys, rows in (
+            (DailyRevenue, ('day',), revenue_rows),
+            (DailyProductSales, ('day', 'product_id'), sales_rows),
+        ):
+            for start in range(0, len(rows), batch_size):
+                _add(model, keys, rows[start:start + batch_size])
+        for day in sorted(revenue):
+            _recount_customers(day)
+        bump_model_version(DailyRevenue, DailyProductSales)
+
+
+def move_order(order_id, previous, current):
+    """Move an order's contribution after its date, customer or total changed.
+
+    ``previous`` and ``current`` hold the order's ``order_date``,
+    ``customer_id`` and ``total_amount``.
+    """
+    old_day = order_day(previous['order_date'])
+    new_day = order_day(current['order_date'])
+    if old_day == new_day:
+        add_revenue(current['order_date'], current['total_amount'] - previous['total_amount'])
+        if previous['customer_id'] != current['customer_id']:
+            _recount_customers(new_day)
+        return
+
+    add_order(previous['order_date'], previous['total_amount'], sign=-1)
+    add_order(current['order_date'], current['total_amount'])
+    items = OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity', 'line_total')
+    items = list(items)
+    add_sales(previous['order_date'], [(product, -units, -revenue) for product, units, revenue in items])
+    add_sales(current['order_date'], items)
+
+
+def daily_revenue_rows(start=None, end=None):
+    """DailyRevenue rows computed from the raw orders"""
+    rows = (
+        _orders_between(start, end)
+        .annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(
+            order_count=Count('id'),
+            revenue=Sum('total_amount'),
+            customer_count=Count('customer_id', distinct=True),
+        )
+        .order_by('day')
+    )
+    for row in rows.iterator():
+        yield DailyRevenue(**row)
+
+
+def daily_product_sales_rows(start=None, end=None):
+    """DailyProductSales rows computed from the raw order items"""
+    rows = (
+        OrderItem.objects
+        .filter(order__in=_orders_between(start, end))
+        .annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum('line_total'))
+        .order_by('day', 'product_id')
+    )
+    for row in rows.iterator():
+        yield DailyProductSales(**row)
+
+
+def rebuild(start=None, end=None, batch_size=None):
+    """Replace the rollups of the days [start, end] with ones computed from raw data.
+
+    Returns the number of rows written to each table.
+    """
+    written = {}
+    with transaction.atomic():
+        for model, rows in (
+            (DailyRevenue, daily_revenue_rows(start, end)),
+            (DailyProductSales, daily_product_sales_rows(start, end)),
+        ):
+            _days_between(model.objects.all(), start, end).delete()
+            written[model] = 0
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    written[model] += len(model.objects.bulk_create(batch))
+                    batch = []
+            written[model] += len(model.objects.bulk_create(batch))
+        bump_model_version(DailyRevenue, DailyProductSales)
+    return written
+
+
+def _revenue_key(row):
+    return row.day
+
+
+def _sales_key(row):
+    return row.day, row.product_id
+
+
+def find_mismatches(start=None, end=None, window=31):
+    """Compare the rollups with the raw orders, ``window`` days at a time.
+
+    Yields ``(model, key, expected, stored)`` tuples where ``expected`` and
+    ``stored`` are dicts of the rollup columns; rows whose counters are all
+    zero are the same as missing rows.
+    """
+    if start is None or end is None:
+        first, last = _date_range()
+        if first is None:
+            return
+        start = start or first
+        end = end or last
+
+    checks = (
+        (DailyRevenue, daily_revenue_rows, _revenue_key, ('order_count', 'revenue', 'customer_count')),
+        (DailyProductSales, daily_product_sales_rows, _sales_key, ('units', 'revenue')),
+    )
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=window - 1), end)
+        for model, raw_rows, key, columns in checks:
+            expected = _by_key(raw_rows(window_start, window_end), key, columns)
+            stored = _by_key(_days_between(model.objects.all(), window_start, window_end), key, columns)
+            for row_key in sorted(expected.keys() | stored.keys()):
+                empty = dict.fromkeys(columns, 0)
+                if expected.get(row_key, empty) != stored.get(row_key, empty):
+                    yield model, row_key, expected.get(row_key), stored.get(row_key)
+        window_start = window_end + timedelta(days=1)
+
+
+def _date_range():
+    """First and last day that has raw orders or rollup rows"""
+    orders = _orders_between().aggregate(first=Min('order_date'), last=Max('order_date'))
+    days = [order_day(value) for value in orders.values() if value is not None]
+    for model in (DailyRevenue, DailyProductSales):
+        rollups = model.objects.aggregate(first=Min('day'), last=Max('day'))
+        days.extend(value for value in rollups.values() if value is not None)
+    if not days:
+        return None, None
+    return min(days), max(days)
+
+
+def _by_key(rows, key, columns):
+    values = {}
+    for row in rows:
+        counters = {column: getattr(row, column) for column in columns}
+        if any(counters.values()):
+            values[key(row)] = counters
+    return values
+
+
+def revenue_by_period(granularity, start=None, end=None):
+    """Revenue rows per day, week or month of the days [start, end], read from the rollups"""
+    totals, units = _period_querysets(granularity, start, end)
+    return _period_rows(list(totals), dict(units.values_list('period', 'units')), granularity)
+
+
+async def arevenue_by_period(granularity, start=None, end=None):
+    totals, units = _period_querysets(granularity, start, end)
+    totals = [row async for row in totals]
+    units = {period: value async for period, value in units.values_list('period', 'units')}
+    return _period_rows(totals, units, granularity)
+
+
+def _period_querysets(granularity, start, end):
+    trunc = PERIODS[granularity]
+    period = F('day') if trunc is None else trunc('day')
+    totals = (
+        _days_between(DailyRevenue.objects.all(), start, end)
+        .annotate(period=period)
+        .values('period')
+        .annotate(
+            order_count=Sum('order_count'),
+            revenue=Sum('revenue'),
+            customer_count=Sum('customer_count'),
+        )
+        .order_by('period')
+    )
+    units = (
+        _days_between(DailyProductSales.objects.all(), start, end)
+        .annotate(period=period)
+        .values('period')
+        .annotate(units=Sum('units'))
+        .order_by()
+    )
+    return totals, units
+
+
+def _period_rows(totals, units, granularity):
+    rows = []
+    for row in totals:
+        if granularity != 'day':
+            # A customer ordering on two days of a week is one customer, and
+            # the daily counts cannot tell; only days have an exact count.
+            row['customer_count'] = None
+        row['revenue'] = (row['revenue'] or Decimal('0')).quantize(CENTS)
+        row['units_sold'] = units.get(row['period'], 0)
+        rows.append(row)
+    return rows
@@ -1,40 +1,169 @@
 # crm/schema.py
 import graphene
+from asgiref.sync import sync_to_async
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from django.db import transaction
+from django.db import IntegrityError, connection
 from django.core.exceptions import ValidationError
-from .models import Customer, Product, Order
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from .models import Customer, DailyProductSales, DailyRevenue, Product, Order, OrderItem
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .conf import crm_setting
+from .dataloaders import get_loaders
+from .db import atomic_with_retry, retry_on_lock
+from .fields import (
+    BatchedFilterConnectionField, KeysetFilterConnectionField, astream_list, check_list_limit, has_filter_args,
+    stream_list,
+)
+from .optimizer import optimize_queryset
+from .response_cache import bump_model_version
+from . import rollups, search
 import re
 from decimal import Decimal
 from crm.models import Product
 
 
 # GraphQL Types
+# Relations resolve through the request's DataLoaders so a page of rows costs
+# one batched query per relation; filtered relations fall back to a queryset.
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
         fields = '__all__'
         interfaces = (graphene.relay.Node,)
         filterset_class = CustomerFilter
 
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return get_loaders(info).orders_by_customer_id.load(self.pk)
+
 
 class ProductType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('order_items', 'daily_sales')
         interfaces = (graphene.relay.Node,)
         filterset_class = ProductFilter
 
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        return get_loaders(info).orders_by_product_id.load(self.pk)
+
+
+class OrderItemType(DjangoObjectType):
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product', 'quantity', 'unit_price', 'line_total')
+
 
 class OrderType(DjangoObjectType):
+    products = BatchedFilterConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         fields = '__all__'
         interfaces = (graphene.relay.Node,)
         filterset_class = OrderFilter
 
+    def resolve_customer(self, info):
+        return get_loaders(info).customer_by_id.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.products.all()
+        return get_loaders(info).products_by_order_id.load(self.pk)
+
+    def resolve_items(self, info):
+        return get_loaders(info).items_by_order_id.load(self.pk)
+
+
+class CRMStatsType(graphene.ObjectType):
+    """Headline CRM numbers, each computed by an aggregate query"""
+
+    # Not backed by a model, so list the tables it reads for the response cache
+    cache_models = (Customer, Order)
+
+    customer_count = graphene.Int(required=True)
+    order_count = graphene.Int(required=True)
+    revenue = graphene.Decimal(required=True)
+
+    @staticmethod
+    def querysets(start=None, end=None):
+        """Customers created and orders placed in [start, end)"""
+        customers = Customer.objects.all()
+        orders = Order.objects.all()
+        if start is not None:
+            customers = customers.filter(created_at__gte=start)
+            orders = orders.filter(order_date__gte=start)
+        if end is not None:
+            customers = customers.filter(created_at__lt=end)
+            orders = orders.filter(order_date__lt=end)
+        return customers, orders
+
+    @staticmethod
+    def order_aggregates():
+        return {
+            'order_count': Count('id'),
+            'revenue': Coalesce(Sum('total_amount'), Decimal('0')),
+        }
+
+    def resolve_revenue(self, info):
+        # SQLite sums decimals without their scale; show cents like the
+        # other money fields
+        return self.revenue.quantize(Decimal('0.01'))
+
+
+class Granularity(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+
+class RevenuePeriodType(graphene.ObjectType):
+    """Order totals of one day, week or month, read from the daily rollups"""
+
+    # Rollup rows move with every order and item write
+    cache_models = (Order, OrderItem, DailyRevenue, DailyProductSales)
+
+    period = graphene.Date(required=True, description='First day of the period')
+    order_count = graphene.Int(required=True)
+    revenue = graphene.Decimal(required=True)
+    units_sold = graphene.Int(required=True)
+    customer_count = graphene.Int(description='Distinct customers; only set for DAY periods')
+
+
+class SearchKind(graphene.Enum):
+    CUSTOMER = 'customer'
+    PRODUCT = 'product'
+
+
+SEARCH_MODELS = {'customer': Customer, 'product': Product}
+
+
+class SearchResult(graphene.Union):
+    """A customer or product matched by the search field"""
+
+    # Selections of only __typename still depend on both tables
+    cache_models = (Customer, Product)
+
+    class Meta:
+        types = (CustomerType, ProductType)
+
+
+def search_results(info, query, types=None, first=None):
+    """Ranked search matches, with their relations primed on the request's loaders"""
+    first = check_list_limit(info, first)
+    models = None if types is None else [SEARCH_MODELS[kind.value] for kind in types]
+    rows = search.search(query, models, first)
+    get_loaders(info).prime(rows)
+    return rows
+
 
 # Input Types
 class CustomerInput(graphene.InputObjectType):
@@ -49,9 +178,16 @@ class ProductInput(graphene.InputObjectType):
     stock = graphene.Int()
 
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    # Either productIds (one of each) or items with quantities, or both
+    product_ids = graphene.List(graphene.ID)
+    items = graphene.List(OrderItemInput)
     order_date = graphene.DateTime()
 
 
@@ -96,7 +232,7 @@ class CreateCustomer(graphene.Mutation):
                 )
             
             # Create customer
-            customer = Customer.objects.create(
+            customer = retry_on_lock(Customer.objects.create)(
                 name=input.name,
                 email=input.email,
                 phone=input.phone or None
@@ -127,36 +263,83 @@ class BulkCreateCustomers(graphene.Mutation):
     success_count = graphene.Int()
     error_count = graphene.Int()
 
+    @staticmethod
+    def existing_emails(emails):
+        """Return which of the given emails are already taken, in as few queries as the backend allows"""
+        emails = list(emails)
+        step = connection.features.max_query_params or len(emails) or 1
+        existing = set()
+        for start in range(0, len(emails), step):
+            existing.update(
+                Customer.objects.filter(email__in=emails[start:start + step])
+                .values_list('email', flat=True)
+            )
+        return existing
+
+    @staticmethod
+    @atomic_with_retry
+    def bulk_insert(customers):
+        created = Customer.objects.bulk_create(customers)
+        # bulk_create sends no post_save
+        bump_model_version(Customer)
+        return created
+
+    @staticmethod
+    def insert_chunk(chunk, errors):
+        """Insert one chunk with a single bulk_create, falling back to per-row inserts on conflicts"""
+        try:
+            return BulkCreateCustomers.bulk_insert([customer for _, customer in chunk])
+        except IntegrityError:
+            # Another writer took one of the emails since the uniqueness probe;
+            # retry row by row so only the conflicting rows are reported.
+            created = []
+            for i, customer in chunk:
+                try:
+                    retry_on_lock(customer.save)(force_insert=True)
+                    created.append(customer)
+                except Exception as e:
+                    errors.append((i, f"Row {i+1}: {str(e)}"))
+            return created
+
     @staticmethod
     def mutate(root, info, input=None):
         customers_created = []
         errors = []
         
         try:
-            with transaction.atomic():
-                for i, customer_input in enumerate(input):
-                    try:
-                        # Validate email uniqueness
-                        if Customer.objects.filter(email=customer_input.email).exists():
-                            errors.append(f"Row {i+1}: Email {customer_input.email} already exists")
-                            continue
-                        
-                        # Validate phone format
-                        if customer_input.phone and not CreateCustomer.validate_phone(customer_input.phone):
-                            errors.append(f"Row {i+1}: Invalid phone format for {customer_input.email}")
-                            continue
-                        
-                        # Create customer
-                        customer = Customer.objects.create(
-                            name=customer_input.name,
-                            email=customer_input.email,
-                            phone=customer_input.phone or None
-                        )
-                        customers_created.append(customer)
-                        
-                    except Exception as e:
-                        errors.append(f"Row {i+1}: {str(e)}")
+            # Validate email uniqueness for the whole payload with one probe
+            existing = BulkCreateCustomers.existing_emails({row.email for row in input})
+            seen = set()
+            valid = []
+            for i, customer_input in enumerate(input):
+                if customer_input.email in existing or customer_input.email in seen:
+                    errors.append((i, f"Row {i+1}: Email {customer_input.email} already exists"))
+                    continue
+                
+                # Validate phone format
+                if customer_input.phone and not CreateCustomer.validate_phone(customer_input.phone):
+                    errors.append((i, f"Row {i+1}: Invalid phone format for {customer_input.email}"))
+                    continue
+                
+                seen.add(customer_input.email)
+                valid.append((i, Customer(
+                    name=customer_input.name,
+                    email=customer_input.email,
+                    phone=customer_input.phone or None
+                )))
+            
+            # Create customers in chunks, each in its own short transaction.
+            # Earlier chunks stay committed when one fails, so the failure is
+            # reported against that chunk's rows only
+            batch_size = crm_setting('BULK_CREATE_BATCH_SIZE')
+            for start in range(0, len(valid), batch_size):
+                chunk = valid[start:start + batch_size]
+                try:
+                    customers_created.extend(BulkCreateCustomers.insert_chunk(chunk, errors))
+                except Exception as e:
+                    errors.extend((i, f"Row {i+1}: {str(e)}") for i, _ in chunk)
             
+            errors = [message for _, message in sorted(errors, key=lambda error: error[0])]
             return BulkCreateCustomers(
                 customers=customers_created,
                 errors=errors,
@@ -205,7 +388,7 @@ class CreateProduct(graphene.Mutation):
                 )
             
             # Create product
-            product = Product.objects.create(
+            product = retry_on_lock(Product.objects.create)(
                 name=input.name,
                 price=input.price,
                 stock=stock
@@ -236,6 +419,28 @@ class CreateOrder(graphene.Mutation):
     success = graphene.Boolean()
     errors = graphene.List(graphene.String)
 
+    @staticmethod
+    @atomic_with_retry
+    def save(customer, order_date, items):
+        """Insert the order and its items in one transaction"""
+        order = Order.objects.create(
+            customer=customer,
+            order_date=order_date,
+            total_amount=sum((item.line_total for item in items), Decimal('0'))
+        )
+        
+        # Add items to order; bulk_create skips the post_save handler
+        # that would otherwise add each line total a second time, so
+        # only the product sales rollup is recorded here
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        bump_model_version(OrderItem)
+        rollups.add_sales(order.order_date, [
+            (item.product_id, item.quantity, item.line_total) for item in items
+        ])
+        return order
+
     @staticmethod
     def mutate(root, info, input=None):
         errors = []
@@ -247,15 +452,23 @@ class CreateOrder(graphene.Mutation):
             except Customer.DoesNotExist:
                 errors.append("Customer not found")
             
-            # Validate products exist
-            if not input.product_ids:
+            # Validate products exist, merging repeated products into one item
+            quantities = {}
+            for pid in input.product_ids or []:
+                quantities[int(pid)] = quantities.get(int(pid), 0) + 1
+            for item in input.items or []:
+                if item.quantity is None or item.quantity < 1:
+                    errors.append(f"Quantity for product {item.product_id} must be at least 1")
+                    continue
+                quantities[int(item.product_id)] = quantities.get(int(item.product_id), 0) + item.quantity
+            
+            if not quantities:
                 errors.append("At least one product must be selected")
             else:
-                product_ids = [int(pid) for pid in input.product_ids]
-                products = Product.objects.filter(id__in=product_ids)
+                products = Product.objects.in_bulk(list(quantities))
                 
-                if len(products) != len(product_ids):
-                    missing_ids = set(product_ids) - set(products.values_list('id', flat=True))
+                if len(products) != len(quantities):
+                    missing_ids = set(quantities) - set(products)
                     errors.append(f"Products not found: {list(missing_ids)}")
             
             if errors:
@@ -266,19 +479,18 @@ class CreateOrder(graphene.Mutation):
                     errors=errors
                 )
             
-            # Create order
-            with transaction.atomic():
-                order = Order.objects.create(
-                    customer=customer,
-                    order_date=input.order_date
+            # Snapshot today's prices into the items; the order total is their
+            # sum, so creation is one INSERT for the order and one for its items
+            items = [
+                OrderItem(
+                    product=product,
+                    quantity=quantities[product_id],
+                    unit_price=product.price,
+                    line_total=product.price * quantities[product_id],
                 )
-                
-                # Add products to order
-                order.products.set(products)
-                
-                # Calculate and save total amount
-                order.total_amount = order.calculate_total()
-                order.save(update_fields=['total_amount'])
+                for product_id, product in products.items()
+            ]
+            order = CreateOrder.save(customer, input.order_date, items)
             
             return CreateOrder(
                 order=order,
@@ -299,18 +511,15 @@ class CreateOrder(graphene.Mutation):
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
         increment = graphene.Int(required=True)
+        threshold = graphene.Int()
 
     success = graphene.String()
     updated_products = graphene.List(ProductType)
 
-    def mutate(self, info, increment):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_products = []
-
-        for product in low_stock_products:
-            product.stock += increment
-            product.save()
-            updated_products.append(product)
+    def mutate(self, info, increment, threshold=None):
+        if threshold is None:
+            threshold = crm_setting('LOW_STOCK_THRESHOLD')
+        updated_products = retry_on_lock(Product.objects.restock_low_stock)(threshold, increment)
 
         return UpdateLowStockProducts(
             success=f"Restocked {len(updated_products)} products.",
@@ -322,10 +531,10 @@ class UpdateLowStockProducts(graphene.Mutation):
 class Query(graphene.ObjectType):
     hello = graphene.String()
     
-    # Simple list queries (existing)
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
-    orders = graphene.List(OrderType)
+    # Simple list queries (existing), bounded by CRM['LIST_MAX_LIMIT']
+    customers = graphene.List(CustomerType, first=graphene.Int(), after=graphene.ID())
+    products = graphene.List(ProductType, first=graphene.Int(), after=graphene.ID())
+    orders = graphene.List(OrderType, first=graphene.Int(), after=graphene.ID())
     
     # Single object queries (existing)
     customer = graphene.Field(CustomerType, id=graphene.ID())
@@ -333,39 +542,86 @@ class Query(graphene.ObjectType):
     order = graphene.Field(OrderType, id=graphene.ID())
     
     # Filtered connection queries (new)
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = KeysetFilterConnectionField(CustomerType)
+    all_products = KeysetFilterConnectionField(ProductType)
+    all_orders = KeysetFilterConnectionField(OrderType)
+    
+    # Aggregates, optionally bounded to [from, to)
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        required=True,
+        start=graphene.DateTime(name='from'),
+        end=graphene.DateTime(name='to'),
+    )
+
+    # Reporting, read from the daily rollups; from/to days are inclusive
+    revenue_by_period = graphene.List(
+        graphene.NonNull(RevenuePeriodType),
+        required=True,
+        granularity=Granularity(required=True),
+        start=graphene.Date(name='from'),
+        end=graphene.Date(name='to'),
+    )
+
+    # Ranked substring search over customer names and emails and product
+    # names, served by the FTS5 trigram index (crm/search.py)
+    search = graphene.List(
+        graphene.NonNull(SearchResult),
+        required=True,
+        query=graphene.String(required=True),
+        types=graphene.List(graphene.NonNull(SearchKind), description='Defaults to every kind'),
+        first=graphene.Int(default_value=20),
+    )
 
     def resolve_hello(self, info):
         return "Hello, GraphQL!"
     
-    def resolve_customers(self, info):
-        return Customer.objects.all()
+    def resolve_customers(self, info, first=None, after=None):
+        return stream_list(Customer.objects.all(), info, first, after)
     
-    def resolve_products(self, info):
-        return Product.objects.all()
+    def resolve_products(self, info, first=None, after=None):
+        return stream_list(Product.objects.all(), info, first, after)
     
-    def resolve_orders(self, info):
-        return Order.objects.all()
+    def resolve_orders(self, info, first=None, after=None):
+        return stream_list(Order.objects.all(), info, first, after)
     
     def resolve_customer(self, info, id):
         try:
-            return Customer.objects.get(id=id)
+            customer = optimize_queryset(Customer.objects.all(), info).get(id=id)
         except Customer.DoesNotExist:
             return None
+        get_loaders(info).prime([customer])
+        return customer
     
     def resolve_product(self, info, id):
         try:
-            return Product.objects.get(id=id)
+            product = optimize_queryset(Product.objects.all(), info).get(id=id)
         except Product.DoesNotExist:
             return None
+        get_loaders(info).prime([product])
+        return product
     
     def resolve_order(self, info, id):
         try:
-            return Order.objects.get(id=id)
+            order = optimize_queryset(Order.objects.all(), info).get(id=id)
         except Order.DoesNotExist:
             return None
+        get_loaders(info).prime([order])
+        return order
+    
+    def resolve_crm_stats(self, info, start=None, end=None):
+        customers, orders = CRMStatsType.querysets(start, end)
+        return CRMStatsType(
+            customer_count=customers.count(),
+            **orders.aggregate(**CRMStatsType.order_aggregates()),
+        )
+    
+    def resolve_revenue_by_period(self, info, granularity, start=None, end=None):
+        rows = rollups.revenue_by_period(granularity.value, start, end)
+        return [RevenuePeriodType(**row) for row in rows]
+
+    def resolve_search(self, info, query, types=None, first=None):
+        return search_results(info, query, types, first)
 
 
 # Mutation Class
@@ -374,4 +630,78 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
-    update_low_stock_products = UpdateLowStockProducts.Field()
\ No newline at end of file
+    update_low_stock_products = UpdateLowStockProducts.Field()
+
+
+# Async schema, served by the ASGI endpoint
+# Root fields read through Django's async ORM, so independent root fields of
+# one operation are awaited concurrently; nested relations come from the same
+# DataLoaders, which batch on Django's sync thread.
+class AsyncQuery(Query):
+    async def resolve_hello(self, info):
+        return "Hello, GraphQL!"
+
+    async def resolve_customers(self, info, first=None, after=None):
+        return await astream_list(Customer.objects.all(), info, first, after)
+
+    async def resolve_products(self, info, first=None, after=None):
+        return await astream_list(Product.objects.all(), info, first, after)
+
+    async def resolve_orders(self, info, first=None, after=None):
+        return await astream_list(Order.objects.all(), info, first, after)
+
+    async def resolve_customer(self, info, id):
+        return await aget_primed(Customer.objects.all(), info, id)
+
+    async def resolve_product(self, info, id):
+        return await aget_primed(Product.objects.all(), info, id)
+
+    async def resolve_order(self, info, id):
+        return await aget_primed(Order.objects.all(), info, id)
+
+    async def resolve_crm_stats(self, info, start=None, end=None):
+        customers, orders = CRMStatsType.querysets(start, end)
+        return CRMStatsType(
+            customer_count=await customers.acount(),
+            **await orders.aaggregate(**CRMStatsType.order_aggregates()),
+        )
+
+    async def resolve_revenue_by_period(self, info, granularity, start=None, end=None):
+        rows = await rollups.arevenue_by_period(granularity.value, start, end)
+        return [RevenuePeriodType(**row) for row in rows]
+
+    async def resolve_search(self, info, query, types=None, first=None):
+        # FTS5 queries go through a raw cursor, which has no async API
+        return await sync_to_async(search_results)(info, query, types, first)
+
+
+async def aget_primed(queryset, info, id):
+    """Fetch one row with the joins its selection needs and prime its relations"""
+    try:
+        instance = await optimize_queryset(queryset, info).aget(id=id)
+    except queryset.model.DoesNotExist:
+        return None
+    get_loaders(info).prime([instance])
+    return instance
+
+
+def async_mutation(mutation):
+    """Async twin of a mutation, exposed under the same GraphQL name.
+
+    Mutations rely on transaction.atomic() and model signals, which only work
+    in sync code, so the whole mutation runs in Django's sync thread; the
+    event loop stays free while it does.
+    """
+    async def mutate(root, info, **kwargs):
+        return await sync_to_async(mutation.mutate)(root, info, **kwargs)
+
+    meta = type('Meta', (), {'name': mutation._meta.name})
+    return type(f'Async{mutation.__name__}', (mutation,), {'Meta': meta, 'mutate': staticmethod(mutate)})
+
+
+class AsyncMutation(graphene.ObjectType):
+    create_customer = async_mutation(CreateCustomer).Field()
+    bulk_create_customers = async_mutation(BulkCreateCustomers).Field()
+    create_product = async_mutation(CreateProduct).Field()
+    create_order = async_mutation(CreateOrder).Field()
+    update_low_stock_products = async_mutation(UpdateLowStockProducts).Field()
@@ -0,0 +1,227 @@
+# crm/search.py
+from contextlib import contextmanager
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.expressions import RawSQL
+
+from .conf import crm_setting
+from .models import Customer, Product
+from .response_cache import bump_model_version
+
+# Customer and product text lives in SQLite FTS5 tables with the trigram
+# tokenizer, so "contains" searches are index lookups rather than a LIKE
+# '%...%' scan of the whole table. The tables use the model tables as
+# external content and triggers keep them in step with every write,
+# including bulk_create() and queryset update()/delete(). Other backends, and
+# terms shorter than a trigram, fall back to icontains.
+#
+# FTS5's bm25 picks the candidates: on short name fields it ranks the
+# shortest values containing the terms first, so exact matches always make
+# the cut however old they are. The candidates are then ordered in Python,
+# by where the terms occur (see relevance()).
+
+TRIGRAM = 3
+
+
+def index_sql(table, content_table, columns):
+    """Statements creating an FTS5 trigram index over ``columns`` of ``content_table``"""
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"{names}, content='{content_table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {content_table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {content_table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {names} ON {content_table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def drop_index_sql(table):
+    return [
+        *(f"DROP TRIGGER IF EXISTS {table}_{suffix}" for suffix in ('ai', 'ad', 'au')),
+        f"DROP TABLE IF EXISTS {table}",
+    ]
+
+
+def _phrase(text):
+    # A quoted FTS5 string matches its text as a substring under trigrams
+    return '"' + text.replace('"', '""') + '"'
+
+
+class SearchIndex:
+    """The FTS5 trigram index over some text columns of a model"""
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+        self.content_table = model._meta.db_table
+        self.table = f'{self.content_table}_search'
+
+    @property
+    def connection(self):
+        return connections[router.db_for_read(self.model)]
+
+    def available(self, connection=None):
+        return (connection or self.connection).vendor == 'sqlite'
+
+    def sql(self):
+        return index_sql(self.table, self.content_table, self.columns)
+
+    def ensure_triggers(self, connection):
+        """Recreate missing triggers of an existing index.
+
+        SQLite migrations that alter a model rebuild its table, which drops
+        the triggers along with the old table.
+        """
+        tables = connection.introspection.table_names()
+        if self.table in tables and self.content_table in tables:
+            with connection.cursor() as cursor:
+                for statement in self.sql()[1:]:
+                    cursor.execute(statement)
+
+    def rebuild(self):
+        """Reindex every row of the model and return the row count"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+        # Cached search results may predate the rebuild
+        bump_model_version(self.model)
+        return self.model._default_manager.count()
+
+    @contextmanager
+    def deferred(self):
+        """Stop syncing the index for a bulk load and rebuild it once afterwards"""
+        if not self.available():
+            yield
+            return
+        connection = self.connection
+        with connection.cursor() as cursor:
+            for statement in drop_index_sql(self.table)[:-1]:
+                cursor.execute(statement)
+        try:
+            yield
+        finally:
+            self.ensure_triggers(connection)
+            self.rebuild()
+
+    def optimize(self):
+        """Merge the index's b-trees into one, for faster lookups"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')")
+
+    def matching(self, column, value):
+        """Subquery of the ids whose ``column`` contains ``value``, case-insensitively"""
+        return RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+            [f'{column} : {_phrase(value)}'],
+        )
+
+    def candidates(self, terms, limit):
+        """``(pk, *columns)`` of the best ``limit`` rows containing every term in one of the columns.
+
+        The index ranks them by bm25; the icontains fallback takes the newest.
+        """
+        if self.available() and min(len(term) for term in terms) >= TRIGRAM:
+            matches = RawSQL(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s",
+                [' '.join(_phrase(term) for term in terms), limit],
+            )
+            # Unordered: the rows are ranked afterwards
+            rows = self.model._default_manager.filter(pk__in=matches).order_by()
+        else:
+            condition = Q()
+            for term in terms:
+                condition &= Q.create([(f'{column}__icontains', term) for column in self.columns], connector=Q.OR)
+            rows = self.model._default_manager.filter(condition).order_by('-pk')[:limit]
+        return rows.values_list('pk', *self.columns)
+
+    def search(self, query, limit):
+        """Return ``(score, instance)`` pairs of the best ``limit`` matches of ``query``.
+
+        Every whitespace-separated term must occur in one of the columns.
+        Only the SEARCH_CANDIDATES matches bm25 ranks best are scored and
+        loaded; lower scores rank higher.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        scored = [
+            (relevance([value or '' for value in values], terms), pk)
+            for pk, *values in self.candidates(terms, crm_setting('SEARCH_CANDIDATES'))
+        ]
+        scored.sort()
+        scored = scored[:limit]
+        # Only the rows that made the cut are loaded in full
+        instances = self.model._default_manager.in_bulk([pk for _score, pk in scored])
+        return [(score, instances[pk]) for score, pk in scored if pk in instances]
+
+
+def relevance(values, terms):
+    """Sort key of a row whose text ``values`` contain every term; lower is better.
+
+    Each term counts by its best match in any value: the whole value, a
+    prefix of it, the start of a word, or anywhere. Shorter first values
+    break ties, so "Ann" ranks above "Annabelle" for "ann".
+    """
+    values = [value.casefold() for value in values]
+    rank = 0
+    for term in terms:
+        term = term.casefold()
+        rank += min(_term_rank(value, term) for value in values)
+    return rank, len(values[0])
+
+
+def _term_rank(value, term):
+    position = value.find(term)
+    if position < 0:
+        return 4
+    if position == 0:
+        return 0 if len(value) == len(term) else 1
+    while position > 0:
+        # The start of a word: any non-alphanumeric character comes before it
+        if not value[position - 1].isalnum():
+            return 2
+        position = value.find(term, position + 1)
+    return 3
+
+
+INDEXES = {
+    Customer: SearchIndex(Customer, ('name', 'email')),
+    Product: SearchIndex(Product, ('name',)),
+}
+
+
+def search(query, models=None, first=20):
+    """Customers and products matching ``query``, best match first"""
+    scored = []
+    for model, index in INDEXES.items():
+        if models is None or model in models:
+            scored.extend(index.search(query, first))
+    scored.sort(key=lambda pair: pair[0])
+    return [instance for _score, instance in scored[:first]]
+
+
+def filter_contains(queryset, path, value):
+    """``queryset.filter(<path>__icontains=value)``, answered by a search index when one covers ``path``"""
+    *relations, column = path.split(LOOKUP_SEP)
+    model = queryset.model
+    for name in relations:
+        model = model._meta.get_field(name).related_model
+    index = INDEXES.get(model)
+    if index is None or column not in index.columns or len(value) < TRIGRAM or not index.available():
+        return queryset.filter(**{f'{path}__icontains': value})
+    target = LOOKUP_SEP.join([*relations, 'pk', 'in'])
+    return queryset.filter(**{target: index.matching(column, value)})
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    """post_migrate receiver restoring triggers dropped by table rebuilds"""
+    connection = connections[using]
+    for index in INDEXES.values():
+        if index.available(connection):
+            index.ensure_triggers(connection)
@@ -0,0 +1,172 @@
+# crm/signals.py
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import rollups
+from .models import Customer, DailyProductSales, DailyRevenue, Order, OrderItem, Product
+from .response_cache import bump_model_version
+
+# Order.total_amount is maintained incrementally: every item write adds or
+# subtracts its own line total instead of re-summing the whole order. The
+# daily rollups follow the same deltas (see crm/rollups.py).
+
+ROLLUP_FIELDS = ('order_date', 'customer_id', 'total_amount')
+
+
+def _adjust_total(order_id, delta, order_date=None):
+    Order.objects.filter(pk=order_id).update(
+        total_amount=F('total_amount') + delta, updated_at=timezone.now()
+    )
+    if order_date is None:
+        order_date = _order_date(order_id)
+    if order_date is not None:
+        rollups.add_revenue(order_date, delta)
+
+
+def _order_date(order_id):
+    return Order.objects.filter(pk=order_id).values_list('order_date', flat=True).first()
+
+
+def _item_order_date(item, origin=None):
+    if isinstance(origin, Order):
+        return origin.order_date
+    if OrderItem.order.is_cached(item):
+        return item.order.order_date
+    return _order_date(item.order_id)
+
+
+@receiver(pre_save, sender=Order)
+def remember_rollup_fields(sender, instance, update_fields=None, **kwargs):
+    # Read from the database: totals move through UPDATEs, so the instance's
+    # own copy may be stale. The stored total is written back unless the
+    # save names total_amount explicitly.
+    instance._rollup_previous = None
+    if not instance._state.adding:
+        previous = Order.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+        instance._rollup_previous = previous
+        if previous is not None and (update_fields is None or 'total_amount' not in update_fields):
+            instance.total_amount = previous['total_amount']
+
+
+@receiver(post_save, sender=Order)
+def record_order(sender, instance, created, update_fields=None, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if created or previous is None:
+        rollups.add_order(instance.order_date, instance.total_amount)
+        return
+    current = dict(previous)
+    for field in ROLLUP_FIELDS:
+        if update_fields is None or field in update_fields or field.removesuffix('_id') in update_fields:
+            current[field] = getattr(instance, field)
+    if current != previous:
+        rollups.move_order(instance.pk, previous, current)
+
+
+@receiver(pre_delete, sender=Order)
+def refresh_deleted_order(sender, instance, origin=None, **kwargs):
+    # Rows collected by a cascade are fresh; the instance delete() was called
+    # on may predate item writes that moved its total.
+    if origin is instance:
+        instance.refresh_from_db(fields=['order_date', 'total_amount'])
+
+
+@receiver(post_delete, sender=Order)
+def remove_order(sender, instance, **kwargs):
+    rollups.add_order(instance.order_date, instance.total_amount, sign=-1)
+
+
+@receiver(post_save, sender=OrderItem)
+def add_item_to_total(sender, instance, created, **kwargs):
+    saved_total = getattr(instance, '_saved_line_total', None) or 0
+    saved_quantity = getattr(instance, '_saved_quantity', None) or 0
+    saved_product_id = getattr(instance, '_saved_product_id', None)
+    instance._saved_line_total = instance.line_total
+    instance._saved_quantity = instance.quantity
+    instance._saved_product_id = instance.product_id
+
+    order_date = _item_order_date(instance)
+    delta = instance.line_total - saved_total
+    if delta:
+        _adjust_total(instance.order_id, delta, order_date)
+
+    if saved_product_id is not None and saved_product_id != instance.product_id:
+        sales = [
+            (saved_product_id, -saved_quantity, -saved_total),
+            (instance.product_id, instance.quantity, instance.line_total),
+        ]
+    else:
+        sales = [(instance.product_id, instance.quantity - saved_quantity, delta)]
+    rollups.add_sales(order_date, sales)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_from_total(sender, instance, origin=None, **kwargs):
+    origin_model = getattr(origin, 'model', None) or type(origin)
+    # Deleting a product takes its sales rows with it
+    if origin_model is Product:
+        order_date = None
+    else:
+        order_date = _item_order_date(instance, origin)
+        if order_date is not None:
+            rollups.add_sales(order_date, [(instance.product_id, -instance.quantity, -instance.line_total)])
+
+    # Deleting an order or a customer takes the order rows with it, so there
+    # is no total left to maintain.
+    if origin_model in (Order, Customer):
+        return
+    if instance.line_total:
+        _adjust_total(instance.order_id, -instance.line_total, order_date)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def snapshot_added_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """Price the items created by products.add()/set().
+
+    The related manager bulk-inserts through rows without calling save(), so
+    they arrive without a price snapshot. Removals go through post_delete.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+
+    if reverse:
+        items = OrderItem.objects.filter(product_id=instance.pk, order_id__in=pk_set)
+    else:
+        items = OrderItem.objects.filter(order_id=instance.pk, product_id__in=pk_set)
+    price = Product.objects.filter(pk=OuterRef('product_id')).values('price')
+    items.filter(unit_price=0).update(unit_price=Subquery(price))
+    items.update(line_total=F('quantity') * F('unit_price'))
+
+    added = {}
+    for order_id, order_date, product_id, quantity, line_total in items.values_list(
+        'order_id', 'order__order_date', 'product_id', 'quantity', 'line_total'
+    ):
+        total = added.get(order_id, (order_date, 0))[1]
+        added[order_id] = (order_date, total + line_total)
+        rollups.add_sales(order_date, [(product_id, quantity, line_total)])
+    for order_id, (order_date, total) in added.items():
+        _adjust_total(order_id, total, order_date)
+    if not reverse:
+        instance.refresh_from_db(fields=['total_amount', 'updated_at'])
+
+
+# Response cache invalidation: any write to a model bumps its version stamp.
+# Item changes also move Order.total_amount, so they bump Order as well, and
+# both move the rollups.
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_response_cache(sender, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(m2m_changed, sender=Order.products.through)
+def bump_response_cache_for_orders(sender, action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        bump_model_version(Order, OrderItem, DailyRevenue, DailyProductSales)
@@ -0,0 +1,322 @@
+# crm/synthetic.py
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import rollups
+from .conf import crm_setting
+from .models import Customer, DailyProductSales, DailyRevenue, Order, OrderItem, Product
+from .response_cache import bump_model_version
+from .search import INDEXES
+
+# Synthetic CRM data with a realistic shape: a few products sell far more
+# than the rest (Zipf), some customers order far more than others, and
+# orders cluster on weekdays, in business hours and on occasional burst days
+# (sales, launches). Everything is drawn from one seeded Random, so a seed
+# and an end date always produce the same rows.
+
+FIRST_NAMES = [
+    'Alice', 'Bob', 'Carol', 'David', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy',
+    'Karim', 'Lena', 'Mateo', 'Nadia', 'Oscar', 'Priya', 'Quentin', 'Rosa', 'Sven', 'Tariq',
+    'Uma', 'Victor', 'Wei', 'Ximena', 'Yusuf', 'Zoe',
+]
+LAST_NAMES = [
+    'Smith', 'Jones', 'Brown', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Moore', 'Taylor', 'Clark',
+    'Nguyen', 'Okafor', 'Rossi', 'Kowalski', 'Haddad', 'Tanaka', 'Silva', 'Novak', 'Schmidt', 'Khan',
+]
+PRODUCT_ADJECTIVES = ['Basic', 'Pro', 'Compact', 'Wireless', 'Ergonomic', 'Deluxe', 'Portable', 'Smart']
+PRODUCT_NOUNS = [
+    'Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Widget', 'Gadget', 'Cable', 'Dock',
+    'Headset', 'Webcam', 'Charger', 'Speaker', 'Tablet', 'Router', 'Stand', 'Drive',
+]
+
+PRODUCT_SKEW = 1.1
+CUSTOMER_SKEW = 0.7
+ITEMS_PER_ORDER = ([1, 2, 3, 4, 5], [50, 25, 13, 7, 5])
+QUANTITY = ([1, 2, 3, 4, 5], [60, 20, 10, 6, 4])
+# Relative orders per hour of the day (UTC)
+HOURLY = [1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 9, 10, 9, 9, 8, 8, 9, 10, 10, 8, 6, 4, 2]
+BURST_CHANCE = 0.03
+BURST_FACTOR = (3, 10)
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights of ranks 1..count under Zipf's law, for Random.choices()"""
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def clear():
+    """Delete every CRM row with plain DELETEs, skipping per-row signals"""
+    connection = connections[router.db_for_write(Order)]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for model in (DailyProductSales, DailyRevenue, OrderItem, Order, Product, Customer):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+    bump_model_version(Customer, Product, Order, OrderItem, DailyRevenue, DailyProductSales)
+
+
+@contextmanager
+def deferred_indexes(connection, *models):
+    """Drop the secondary indexes of ``models``' tables and recreate them on exit.
+
+    Building an index once over the loaded rows is much faster than updating
+    it row by row, and most of these see inserts in random key order. SQLite
+    only; elsewhere this does nothing. Indexes backing UNIQUE constraints
+    stay, since they have no SQL of their own.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})",
+            tables,
+        )
+        indexes = cursor.fetchall()
+        for name, _sql in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _name, sql in indexes:
+                cursor.execute(sql)
+
+
+class Generator:
+    """Writes synthetic customers, products and orders in chunks.
+
+    Rows go in through one executemany() INSERT per chunk and table, with
+    ids assigned here: building model instances for bulk_create() costs
+    several times more than the INSERTs themselves. Nothing sends signals,
+    so order totals and rollup deltas are computed while generating, and
+    generate() adds the deltas to the rollups at the end. Meant for an
+    offline database: the assigned ids assume nobody else is inserting
+    meanwhile.
+    """
+
+    def __init__(self, seed=0, end=None, days=365, batch_size=None):
+        self.random = random.Random(seed)
+        self.end = end or datetime.combine(datetime.now(dt_timezone.utc).date(), dt_time(), dt_timezone.utc)
+        self.days = days
+        self.batch_size = batch_size or crm_setting('GENERATE_BATCH_SIZE')
+        self.connection = connections[router.db_for_write(Order)]
+        # Rollup deltas of the orders written so far, for rollups.add_bulk()
+        self.revenue = {}
+        self.sales = {}
+
+    def _chunks(self, count):
+        for start in range(0, count, self.batch_size):
+            yield start, min(self.batch_size, count - start)
+
+    def _next_id(self, model):
+        return (model._default_manager.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+
+    def _prep(self, model, name):
+        """Adapter of Python values to ``name``'s database representation"""
+        field = model._meta.get_field(name)
+        return lambda value: field.get_db_prep_save(value, self.connection)
+
+    def _insert(self, model, names, rows):
+        quote = self.connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in names)
+        placeholders = ', '.join(['%s'] * len(names))
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows
+            )
+
+    @contextmanager
+    def _deferred(self, *models):
+        """Defer index upkeep of ``models`` while loading them, if their tables are empty.
+
+        A table that already has rows may be in use, and would run without
+        its indexes until the load finishes.
+        """
+        with ExitStack() as stack:
+            if not any(model._default_manager.exists() for model in models):
+                stack.enter_context(deferred_indexes(self.connection, *models))
+                for model in models:
+                    if model in INDEXES:
+                        stack.enter_context(INDEXES[model].deferred())
+            yield
+
+    def _reset_sequences(self, *models):
+        # Explicit ids leave PostgreSQL sequences behind; SQLite tracks them itself
+        statements = self.connection.ops.sequence_reset_sql(no_style(), models)
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def customers(self, count):
+        """Create ``count`` customers and return their ids"""
+        rng = self.random
+        prep_date = self._prep(Customer, 'created_at')
+        first_day = self.end - timedelta(days=self.days)
+        first_id = self._next_id(Customer)
+        with self._deferred(Customer):
+            for start, size in self._chunks(count):
+                rows = []
+                for pk in range(first_id + start, first_id + start + size):
+                    # Everyone signed up before the order window opens
+                    created_at = prep_date(first_day - timedelta(seconds=rng.randrange(self.days * 86400)))
+                    rows.append((
+                        pk,
+                        f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                        # Ids are unique, so emails built from them are too
+                        f'customer{pk}@example.com',
+                        f'+1{rng.randrange(2 * 10 ** 9, 10 ** 10)}' if rng.random() < 0.6 else None,
+                        created_at,
+                        created_at,
+                    ))
+                with transaction.atomic(using=self.connection.alias):
+                    self._insert(Customer, ['id', 'name', 'email', 'phone', 'created_at', 'updated_at'], rows)
+        self._reset_sequences(Customer)
+        return range(first_id, first_id + count)
+
+    def products(self, count):
+        """Create ``count`` products and return their ``(id, price)`` pairs"""
+        rng = self.random
+        prep_price = self._prep(Product, 'price')
+        now = self._prep(Product, 'created_at')(datetime.now(dt_timezone.utc))
+        first_id = self._next_id(Product)
+        created = []
+        with self._deferred(Product):
+            for start, size in self._chunks(count):
+                rows = []
+                for pk in range(first_id + start, first_id + start + size):
+                    # Log-normal: mostly tens of dollars, a long tail of expensive items
+                    price = Decimal(min(round(rng.lognormvariate(3.5, 1.0) * 100), 99_999_999)) / 100
+                    name = f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {pk - first_id + 1}'
+                    rows.append((pk, name, prep_price(price), rng.randint(0, 200), now, now))
+                    created.append((pk, price))
+                with transaction.atomic(using=self.connection.alias):
+                    self._insert(Product, ['id', 'name', 'price', 'stock', 'created_at', 'updated_at'], rows)
+        self._reset_sequences(Product)
+        return created
+
+    def _day_cum_weights(self):
+        rng = self.random
+        first_day = (self.end - timedelta(days=self.days)).date()
+        weights = []
+        for day in range(self.days):
+            weight = 0.6 if (first_day + timedelta(days=day)).weekday() >= 5 else 1.0
+            # Slow growth over the period, plus the occasional burst day
+            weight *= 1 + day / self.days
+            if rng.random() < BURST_CHANCE:
+                weight *= rng.uniform(*BURST_FACTOR)
+            weights.append(weight)
+        return list(accumulate(weights))
+
+    def orders(self, count, customer_ids, products, progress=None):
+        """Create ``count`` orders with their items; returns the number of items.
+
+        ``products`` are ``(id, price)`` pairs. ``progress(orders, items)``
+        is called after every chunk.
+        """
+        rng = self.random
+        customers = list(customer_ids)
+        products = list(products)
+        # Popularity ranks are shuffled so they have nothing to do with ids
+        rng.shuffle(customers)
+        rng.shuffle(products)
+        customer_weights = zipf_cum_weights(len(customers), CUSTOMER_SKEW)
+        product_weights = zipf_cum_weights(len(products), PRODUCT_SKEW)
+        day_weights = self._day_cum_weights()
+        hour_weights = list(accumulate(HOURLY))
+        first_day = self.end - timedelta(days=self.days)
+        days = range(self.days)
+        hours = range(24)
+        counts, count_weights = ITEMS_PER_ORDER
+        quantities, quantity_weights = QUANTITY
+        quantity_cum_weights = list(accumulate(quantity_weights))
+
+        prep_date = self._prep(Order, 'order_date')
+        prep_total = self._prep(Order, 'total_amount')
+        prep_price = self._prep(OrderItem, 'unit_price')
+        prep_line = self._prep(OrderItem, 'line_total')
+        # (product, quantity) -> item columns, adapted once instead of per item
+        lines = {}
+        daily = self.revenue
+        tz = timezone.get_current_timezone()
+        sales = self.sales
+        first_id = self._next_id(Order)
+        items_written = 0
+        with self._deferred(Order, OrderItem):
+            for start, size in self._chunks(count):
+                order_customers = rng.choices(customers, cum_weights=customer_weights, k=size)
+                order_days = rng.choices(days, cum_weights=day_weights, k=size)
+                order_hours = rng.choices(hours, cum_weights=hour_weights, k=size)
+                item_counts = rng.choices(counts, weights=count_weights, k=size)
+                orders = []
+                items = []
+                for pk, customer_id, day, hour, item_count in zip(
+                    range(first_id + start, first_id + start + size),
+                    order_customers, order_days, order_hours, item_counts,
+                ):
+                    placed = first_day + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+                    order_date = prep_date(placed)
+                    # rollups.order_day(), minus a time zone lookup per order
+                    rollup_day = timezone.localdate(placed, tz)
+                    # Duplicate draws of a best seller collapse into one item
+                    chosen = dict.fromkeys(rng.choices(products, cum_weights=product_weights, k=item_count))
+                    total = 0
+                    for product, quantity in zip(
+                        chosen, rng.choices(quantities, cum_weights=quantity_cum_weights, k=len(chosen))
+                    ):
+                        line = lines.get((product, quantity))
+                        if line is None:
+                            product_id, price = product
+                            line = lines[product, quantity] = (
+                                product_id, quantity, prep_price(price), prep_line(price * quantity), price * quantity,
+                            )
+                        items.append((pk, *line[:4]))
+                        total += line[4]
+                        units, revenue = sales.get((rollup_day, line[0]), (0, 0))
+                        sales[rollup_day, line[0]] = (units + quantity, revenue + line[4])
+                    orders_that_day, revenue = daily.get(rollup_day, (0, 0))
+                    daily[rollup_day] = (orders_that_day + 1, revenue + total)
+                    orders.append((pk, customer_id, prep_total(total), order_date, order_date, order_date))
+
+                # Orders and their items commit together, one chunk at a time
+                with transaction.atomic(using=self.connection.alias):
+                    self._insert(Order, ['id', 'customer', 'total_amount', 'order_date', 'created_at', 'updated_at'], orders)
+                    self._insert(OrderItem, ['order', 'product', 'quantity', 'unit_price', 'line_total'], items)
+                items_written += len(items)
+                if progress:
+                    progress(start + size, items_written)
+        self._reset_sequences(Order, OrderItem)
+        return items_written
+
+
+def generate(customers, products, orders, seed=0, end=None, days=365, batch_size=None, progress=None):
+    """Add synthetic rows and return ``{label: (rows, seconds)}`` per phase"""
+    generator = Generator(seed, end, days, batch_size)
+    timings = {}
+
+    started = time.perf_counter()
+    product_rows = generator.products(products)
+    timings['products'] = (len(product_rows), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    customer_ids = generator.customers(customers)
+    timings['customers'] = (len(customer_ids), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    items = generator.orders(orders, customer_ids, product_rows, progress) if orders else 0
+    elapsed = time.perf_counter() - started
+    timings['orders and items'] = (orders + items, elapsed)
+
+    started = time.perf_counter()
+    rollups.add_bulk(generator.revenue, generator.sales)
+    timings['rollups'] = (len(generator.revenue) + len(generator.sales), time.perf_counter() - started)
+    bump_model_version(Customer, Product, Order, OrderItem)
+    return timings
@@ -1,9 +1,10 @@
 import os
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 from celery import shared_task
-import requests
+from decimal import Decimal
+
+from .graphql_client import execute
+
 
 @shared_task
 def generate_crm_report():
@@ -11,27 +12,23 @@ def generate_crm_report():
     LOG_FILE = "/tmp/crm_report_log.txt"
     TIMESTAMP = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-    transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    query = gql("""
+    # Counted and summed by the database, so the report costs the same
+    # however many rows there are
+    query = """
         query CRMReport {
-            customers {
-                id
-            }
-            orders {
-                id
-                totalAmount
+            crmStats {
+                customerCount
+                orderCount
+                revenue
             }
         }
-    """)
+    """
 
     try:
-        response = client.execute(query)
-        total_customers = len(response['customers'])
-        total_orders = len(response['orders'])
-        total_revenue = sum(order['totalAmount'] for order in response['orders'])
+        stats = execute(query)['crmStats']
+        total_customers = stats['customerCount']
+        total_orders = stats['orderCount']
+        total_revenue = Decimal(stats['revenue'])
 
         with open(LOG_FILE, 'a') as log_file:
             log_file.write(f"{TIMESTAMP} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue\n")
@@ -1,3 +1,1461 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+import graphene
+from asgiref.sync import async_to_sync, sync_to_async
+from gql.transport.exceptions import TransportQueryError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import parse, validate
+from graphql_relay import from_global_id, to_global_id
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.debug import DjangoDebugMiddleware
+
+from alx_backend_graphql_crm.schema import schema
+
+from . import graphql_client, synthetic
+from .benchmarks import compare, load_dataset, measure, operations, run_concurrent
+from .conf import crm_setting
+from .cron_jobs.send_order_reminders import process_reminders
+from .db import atomic_with_retry, retry_on_lock
+from .document_cache import query_hash
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .graphql_client import SchemaTransport, get_client
+from .management.commands.purge_inactive_customers import inactive_customers
+from .nplusone import NPlusOneError, detect_n_plus_one, statement_shape
+from .models import Customer, DailyProductSales, DailyRevenue, Product, Order, OrderItem
+from .pagination import keyset_ordering, seek_filter
+from .rollups import find_mismatches, rebuild
+from .schema import Query
+from .search import search
+from .tracing import metrics
+from .views import CRMGraphQLView, document_cache
+
+
+class GraphQLTestMixin:
+    """Helpers for posting operations to the GraphQL endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        # Rolled-back test data never bumps the response cache versions
+        caches['default'].clear()
+
+    def post(self, query, variables=None):
+        response = self.client.post(
+            '/graphql/',
+            json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        return response.json()
+
+    def execute(self, query, variables=None):
+        result = self.post(query, variables)
+        self.assertNotIn('errors', result, result.get('errors'))
+        return result['data']
+
+    def count_queries(self, query, variables=None):
+        with CaptureQueriesContext(connection) as context:
+            data = self.execute(query, variables)
+        return len(context.captured_queries), data
+
+    def create_orders(self, count, products_per_order=2):
+        products = [
+            Product.objects.create(name=f'Product {i}', price=i + 1, stock=i)
+            for i in range(products_per_order + 1)
+        ]
+        start = Customer.objects.count()
+        for i in range(start, start + count):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com')
+            order = Order.objects.create(customer=customer)
+            order.products.set(products[i % 2:i % 2 + products_per_order])
+
+
+class QueryCountTests(GraphQLTestMixin, TestCase):
+    """Relations must resolve in a fixed number of queries, whatever the page size"""
+
+    def assertConstantQueries(self, query):
+        self.create_orders(3)
+        small, _ = self.count_queries(query)
+        self.create_orders(30)
+        large, data = self.count_queries(query)
+        self.assertEqual(small, large)
+        return large, data
+
+    def test_all_orders_with_customer_and_products(self):
+        count, data = self.assertConstantQueries("""
+            {
+              allOrders {
+                edges { node { totalAmount customer { email } products { edges { node { name } } } } }
+              }
+            }
+        """)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(data['allOrders']['edges']), 33)
+
+    def test_orders_list(self):
+        count, data = self.assertConstantQueries("""
+            { orders { id customer { name } products { edges { node { name price } } } } }
+        """)
+        self.assertEqual(count, 2)
+        for order in data['orders']:
+            self.assertEqual(len(order['products']['edges']), 2)
+
+    def test_reverse_relations_through_fragments(self):
+        count, _ = self.assertConstantQueries("""
+            fragment OrderFields on OrderType { products { edges { node { name } } } }
+            {
+              allCustomers(first: 50) {
+                edges { node { name orders { edges { node { ...OrderFields customer { email } } } } } }
+              }
+            }
+        """)
+        self.assertEqual(count, 4)
+
+    def test_paginated_nested_connection(self):
+        count, data = self.assertConstantQueries("""
+            { products { name orders(first: 2) { edges { node { id customer { name } } } } } }
+        """)
+        for product in data['products']:
+            self.assertLessEqual(len(product['orders']['edges']), 2)
+
+    def test_single_order(self):
+        self.create_orders(1)
+        order = Order.objects.get()
+        count, data = self.count_queries(
+            'query ($id: ID) { order(id: $id) { customer { email } products { edges { node { name } } } } }',
+            {'id': order.id},
+        )
+        self.assertEqual(count, 2)
+        self.assertEqual(data['order']['customer']['email'], order.customer.email)
+
+    def test_filtered_nested_connection_still_filters(self):
+        self.create_orders(4)
+        # Filtered nested connections are not batched: one page query (and
+        # count) per order
+        with detect_n_plus_one(raise_violations=False) as violations:
+            data = self.execute("""
+                { orders { products(name: "Product 1") { edges { node { name } } } } }
+            """)
+        self.assertEqual({(v.field, v.path, v.count) for v in violations}, {('OrderType.products', 'orders.products', 4)})
+        for order in data['orders']:
+            names = [edge['node']['name'] for edge in order['products']['edges']]
+            self.assertEqual(names, ['Product 1'])
+
+
+class KeysetPaginationTests(GraphQLTestMixin, TestCase):
+    ORDERS_PAGE = """
+        query ($after: String) {
+          allOrders(keyset: true, first: 5, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            edges { node { id } }
+          }
+        }
+    """
+
+    def fetch_all(self, on_page=None):
+        ids, after = [], None
+        while True:
+            page = self.execute(self.ORDERS_PAGE, {'after': after})['allOrders']
+            ids.extend(edge['node']['id'] for edge in page['edges'])
+            if on_page:
+                on_page()
+            if not page['pageInfo']['hasNextPage']:
+                return ids
+            after = page['pageInfo']['endCursor']
+
+    def test_pages_follow_model_ordering(self):
+        self.create_orders(12)
+        ids = self.fetch_all()
+        expected = self.execute('{ allOrders(first: 100) { edges { node { id } } } }')
+        self.assertEqual(ids, [edge['node']['id'] for edge in expected['allOrders']['edges']])
+
+    def test_new_rows_do_not_shift_pages(self):
+        self.create_orders(12)
+        before = list(Order.objects.values_list('pk', flat=True))
+        ids = self.fetch_all(on_page=lambda: self.create_orders(1))
+        # Orders created mid-walk sort ahead of the cursor and must not cause
+        # rows to be skipped or repeated.
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), len(before))
+
+    def test_no_offset_or_count(self):
+        self.create_orders(12)
+        page = self.execute(self.ORDERS_PAGE, {'after': None})['allOrders']
+        with CaptureQueriesContext(connection) as context:
+            self.execute(self.ORDERS_PAGE, {'after': page['pageInfo']['endCursor']})
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_last_before(self):
+        self.create_orders(6)
+        everything = self.execute('{ allCustomers(keyset: true) { edges { cursor node { name } } } }')
+        edges = everything['allCustomers']['edges']
+        page = self.execute(
+            'query ($before: String) { allCustomers(keyset: true, last: 2, before: $before) '
+            '{ pageInfo { hasPreviousPage } edges { node { name } } } }',
+            {'before': edges[4]['cursor']},
+        )['allCustomers']
+        self.assertEqual(
+            [edge['node']['name'] for edge in page['edges']],
+            [edge['node']['name'] for edge in edges[2:4]],
+        )
+        self.assertTrue(page['pageInfo']['hasPreviousPage'])
+
+
+class BoundedListTests(GraphQLTestMixin, TestCase):
+    def test_pages_by_last_id(self):
+        self.create_orders(7)
+        query = 'query ($after: ID) { customers(first: 3, after: $after) { id name } }'
+        names, after = [], None
+        while True:
+            page = self.execute(query, {'after': after})['customers']
+            if not page:
+                break
+            names.extend(customer['name'] for customer in page)
+            after = page[-1]['id']
+        self.assertEqual(names, list(Customer.objects.values_list('name', flat=True)))
+
+    def test_after_rejects_ids_of_other_types(self):
+        self.create_orders(3)
+        customer = Customer.objects.order_by('name').first()
+        query = 'query ($after: ID) { customers(first: 5, after: $after) { name } }'
+        page = self.execute(query, {'after': to_global_id('CustomerType', customer.pk)})['customers']
+        self.assertEqual(len(page), 2)
+        result = self.post(query, {'after': to_global_id('OrderType', customer.pk)})
+        self.assertIn('is not a CustomerType id', result['errors'][0]['message'])
+
+    def test_limit_is_enforced(self):
+        with self.settings(CRM={'LIST_MAX_LIMIT': 5}):
+            self.create_orders(8)
+            self.assertEqual(len(self.execute('{ orders { id } }')['orders']), 5)
+            response = self.client.post(
+                '/graphql/',
+                json.dumps({'query': '{ orders(first: 6) { id } }'}),
+                content_type='application/json',
+            )
+            self.assertIn('exceeds the limit of 5', response.json()['errors'][0]['message'])
+
+    def test_chunks_are_batched(self):
+        with self.settings(CRM={'LIST_CHUNK_SIZE': 4}):
+            self.create_orders(10)
+            count, data = self.count_queries('{ orders { customer { name } products { edges { node { name } } } } }')
+        self.assertEqual(len(data['orders']), 10)
+        # One streamed query with the customer joined, plus one products
+        # prefetch for each of the three chunks
+        self.assertEqual(count, 4)
+
+
+class BulkCreateCustomersTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation ($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) { successCount errorCount errors customers { email } }
+        }
+    """
+
+    def test_reports_row_errors_in_order(self):
+        Customer.objects.create(name='Taken', email='taken@example.com')
+        result = self.execute(self.MUTATION, {'input': [
+            {'name': 'A', 'email': 'a@example.com'},
+            {'name': 'B', 'email': 'taken@example.com'},
+            {'name': 'C', 'email': 'a@example.com'},
+            {'name': 'D', 'email': 'd@example.com', 'phone': 'not-a-phone'},
+            {'name': 'E', 'email': 'd@example.com', 'phone': '123-456-7890'},
+        ]})['bulkCreateCustomers']
+        self.assertEqual(result['successCount'], 2)
+        self.assertEqual(result['errors'], [
+            'Row 2: Email taken@example.com already exists',
+            'Row 3: Email a@example.com already exists',
+            'Row 4: Invalid phone format for d@example.com',
+        ])
+        self.assertEqual(
+            [customer['email'] for customer in result['customers']],
+            ['a@example.com', 'd@example.com'],
+        )
+
+    def test_failed_chunk_keeps_committed_chunks(self):
+        # Inserting a "broken" email runs a trigger that fails with an
+        # OperationalError (integer overflow), which the per-row fallback does
+        # not handle
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TRIGGER break_insert BEFORE INSERT ON crm_customer "
+                "WHEN NEW.email LIKE 'broken%' BEGIN SELECT abs(-9223372036854775808); END"
+            )
+        try:
+            with self.settings(CRM={'BULK_CREATE_BATCH_SIZE': 2}):
+                result = self.execute(self.MUTATION, {'input': [
+                    {'name': name, 'email': f'{name}@example.com'} for name in ('a', 'b', 'broken', 'c', 'd')
+                ]})['bulkCreateCustomers']
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TRIGGER break_insert')
+        self.assertEqual((result['successCount'], result['errorCount']), (3, 2), result['errors'])
+        self.assertEqual([error[:6] for error in result['errors']], ['Row 3:', 'Row 4:'])
+        self.assertEqual(
+            [customer['email'] for customer in result['customers']],
+            ['a@example.com', 'b@example.com', 'd@example.com'],
+        )
+        self.assertEqual(
+            sorted(Customer.objects.values_list('email', flat=True)),
+            ['a@example.com', 'b@example.com', 'd@example.com'],
+        )
+
+    def test_queries_do_not_grow_per_row(self):
+        rows = [{'name': f'N{i}', 'email': f'n{i}@example.com'} for i in range(120)]
+        with self.settings(CRM={'BULK_CREATE_BATCH_SIZE': 50}):
+            count, data = self.count_queries(self.MUTATION, {'input': rows})
+        self.assertEqual(data['bulkCreateCustomers']['successCount'], 120)
+        # One uniqueness probe plus a savepoint-wrapped INSERT per chunk of 50
+        self.assertLess(count, 15)
+
+
+class UpdateLowStockProductsTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation ($increment: Int!, $threshold: Int) {
+            updateLowStockProducts(increment: $increment, threshold: $threshold) {
+                success
+                updatedProducts { name stock price }
+            }
+        }
+    """
+
+    def test_restocks_in_one_statement(self):
+        for name, stock in (('B', 3), ('A', 9), ('C', 10), ('D', 0)):
+            Product.objects.create(name=name, price='2.50', stock=stock)
+        count, data = self.count_queries(self.MUTATION, {'increment': 5})
+        result = data['updateLowStockProducts']
+        self.assertEqual(result['success'], 'Restocked 3 products.')
+        self.assertEqual(
+            [(p['name'], p['stock'], p['price']) for p in result['updatedProducts']],
+            [('A', 14, '2.50'), ('B', 8, '2.50'), ('D', 5, '2.50')],
+        )
+        self.assertEqual(count, 1)
+        self.assertEqual(Product.objects.get(name='C').stock, 10)
+
+    def test_threshold_argument(self):
+        Product.objects.create(name='A', price=1, stock=15)
+        data = self.execute(self.MUTATION, {'increment': 1, 'threshold': 20})
+        self.assertEqual(data['updateLowStockProducts']['updatedProducts'][0]['stock'], 16)
+
+
+class OrderTotalTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price='999.99', stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price='25.50', stock=5)
+
+    def test_create_order_round_trips(self):
+        mutation = """
+            mutation ($input: OrderInput!) {
+                createOrder(input: $input) { success order { totalAmount } }
+            }
+        """
+        variables = {'input': {
+            'customerId': self.customer.pk,
+            'productIds': [self.laptop.pk, self.mouse.pk],
+        }}
+        with CaptureQueriesContext(connection) as context:
+            data = self.execute(mutation, variables)
+        self.assertEqual(data['createOrder']['order']['totalAmount'], '1025.49')
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE'))
+        ]
+        rollup_writes = [sql for sql in writes if '"crm_daily' in sql.split('(')[0]]
+        self.assertEqual(len(writes) - len(rollup_writes), 2)
+        # Revenue upsert, customer recount, product sales upsert
+        self.assertEqual(len(rollup_writes), 3)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('1025.49'))
+
+    def test_related_manager_changes_update_total(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        self.assertEqual(order.total_amount, Decimal('1025.49'))
+        order.products.remove(self.laptop)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('25.50'))
+        self.mouse.orders.clear()
+        self.assertEqual(Order.objects.get().total_amount, Decimal('0'))
+        self.laptop.orders.add(order)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('999.99'))
+
+
+class OrderItemTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+        mutation ($input: OrderInput!) {
+            createOrder(input: $input) {
+                success errors
+                order { totalAmount items { product { name } quantity unitPrice lineTotal } }
+            }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price='999.99', stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price='25.50', stock=5)
+
+    def test_create_order_with_quantities(self):
+        data = self.execute(self.MUTATION, {'input': {
+            'customerId': self.customer.pk,
+            'productIds': [self.laptop.pk],
+            'items': [{'productId': self.mouse.pk, 'quantity': 3}, {'productId': self.laptop.pk}],
+        }})['createOrder']
+        self.assertTrue(data['success'], data['errors'])
+        self.assertEqual(data['order']['totalAmount'], '2076.48')
+        self.assertEqual(
+            [(item['product']['name'], item['quantity'], item['lineTotal']) for item in data['order']['items']],
+            [('Laptop', 2, '1999.98'), ('Mouse', 3, '76.50')],
+        )
+
+    def test_rejects_bad_quantity(self):
+        data = self.execute(self.MUTATION, {'input': {
+            'customerId': self.customer.pk,
+            'items': [{'productId': self.mouse.pk, 'quantity': 0}],
+        }})['createOrder']
+        self.assertFalse(data['success'])
+
+    def test_price_snapshot_survives_price_change(self):
+        order = Order.objects.create(customer=self.customer)
+        OrderItem.objects.create(order=order, product=self.mouse, quantity=2)
+        self.mouse.price = Decimal('99.00')
+        self.mouse.save()
+        self.assertEqual(order.calculate_total(), Decimal('51.00'))
+
+    def test_item_writes_adjust_total(self):
+        order = Order.objects.create(customer=self.customer)
+        item = OrderItem.objects.create(order=order, product=self.mouse, quantity=2)
+        OrderItem.objects.create(order=order, product=self.laptop)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('1050.99'))
+        item = OrderItem.objects.get(pk=item.pk)
+        item.quantity = 1
+        item.save()
+        self.assertEqual(Order.objects.get().total_amount, Decimal('1025.49'))
+        item.delete()
+        self.assertEqual(Order.objects.get().total_amount, Decimal('999.99'))
+        self.assertEqual(Order.objects.get().total_amount, Order.objects.get().calculate_total())
+
+    def test_stale_order_save_keeps_stored_total(self):
+        order = Order.objects.create(customer=self.customer)
+        OrderItem.objects.create(order=order, product=self.mouse, quantity=2)
+        order.customer = Customer.objects.create(name='Bob', email='bob@example.com')
+        order.save()
+        self.assertEqual(order.total_amount, Decimal('51.00'))
+        self.assertEqual(Order.objects.get().total_amount, order.calculate_total())
+        self.assertEqual(DailyRevenue.objects.get().revenue, Decimal('51.00'))
+        self.assertEqual(list(find_mismatches()), [])
+
+    def test_deleting_product_removes_its_lines(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        self.laptop.delete()
+        self.assertEqual(Order.objects.get().total_amount, Decimal('25.50'))
+
+
+class DocumentCacheTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        document_cache.clear()
+
+    def post_body(self, body):
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json').json()
+
+    def test_repeat_operations_hit_the_cache(self):
+        self.execute('{ hello }')
+        self.execute('{ hello }')
+        stats = self.client.get('/graphql/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_invalid_documents_are_cached_too(self):
+        for _ in range(2):
+            self.assertIn('errors', self.post_body({'query': '{ nope }'}))
+        self.assertEqual(document_cache.stats()['hits'], 1)
+
+    def test_automatic_persisted_query_flow(self):
+        query = '{ hello }'
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(query)}}
+        miss = self.post_body({'extensions': extensions})
+        self.assertEqual(miss['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+        registered = self.post_body({'query': query, 'extensions': extensions})
+        self.assertEqual(registered['data'], {'hello': 'Hello, GraphQL!'})
+        hit = self.post_body({'extensions': extensions})
+        self.assertEqual(hit['data'], {'hello': 'Hello, GraphQL!'})
+
+    def test_hash_must_match_query(self):
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash('{ other }')}}
+        result = self.post_body({'query': '{ hello }', 'extensions': extensions})
+        self.assertEqual(result['errors'][0]['message'], 'provided sha does not match query')
+
+
+class ResponseCacheTests(GraphQLTestMixin, TestCase):
+    def test_repeat_query_is_served_from_cache(self):
+        self.create_orders(2)
+        first, data = self.count_queries('{ products { name } }')
+        second, cached = self.count_queries('{ products { name } }')
+        self.assertGreater(first, 0)
+        self.assertEqual(second, 0)
+        self.assertEqual(data, cached)
+
+    def test_mutation_invalidates_affected_entries_only(self):
+        self.create_orders(2)
+        self.execute('{ products { name stock } }')
+        self.execute('{ customers { name } }')
+        self.execute(
+            'mutation { updateLowStockProducts(increment: 100) { success } }'
+        )
+        products, data = self.count_queries('{ products { name stock } }')
+        customers, _ = self.count_queries('{ customers { name } }')
+        self.assertGreater(products, 0)
+        self.assertTrue(all(product['stock'] >= 100 for product in data['products']))
+        self.assertEqual(customers, 0)
+
+    def test_order_writes_invalidate_nested_selections(self):
+        self.create_orders(1)
+        query = '{ customers { orders { edges { node { totalAmount } } } } }'
+        self.execute(query)
+        order = Order.objects.get()
+        OrderItem.objects.create(order=order, product=Product.objects.create(name='Extra', price=5))
+        data = self.execute(query)
+        total = data['customers'][0]['orders']['edges'][0]['node']['totalAmount']
+        self.assertEqual(Decimal(total), Order.objects.get().total_amount)
+
+    def test_mutations_are_not_cached(self):
+        mutation = 'mutation { createProduct(input: {name: "P", price: 1}) { success } }'
+        self.execute(mutation)
+        self.execute(mutation)
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class QueryCostTests(GraphQLTestMixin, TestCase):
+    def test_cost_is_reported_in_extensions(self):
+        self.create_orders(2)
+        result = self.post('{ orders(first: 5) { id customer { name } } }')
+        self.assertNotIn('errors', result)
+        self.assertEqual(result['extensions']['cost']['requested'], 10)
+        self.assertEqual(result['extensions']['cost']['depth'], 2)
+
+    def test_page_sizes_come_from_variables(self):
+        result = self.post(
+            'query ($n: Int) { products(first: $n) { orders(first: 3) { edges { node { id } } } } }',
+            {'n': 4},
+        )
+        self.assertEqual(result['extensions']['cost']['requested'], 4 + 4 * 3)
+
+    def test_nested_relations_fit_the_default_budget(self):
+        self.create_orders(2)
+        result = self.post(
+            '{ customers { name orders { edges { node { totalAmount '
+            'products { edges { node { name } } } } } } } }'
+        )
+        self.assertNotIn('errors', result)
+        self.assertEqual(len(result['data']['customers']), 2)
+        list_size = crm_setting('QUERY_COST_LIST_SIZE')
+        customers = crm_setting('LIST_MAX_LIMIT')
+        self.assertEqual(
+            result['extensions']['cost']['requested'],
+            customers + customers * list_size + customers * list_size ** 2,
+        )
+
+    def test_explicit_and_schema_default_page_sizes(self):
+        result = self.post('{ customers(first: 0) { orders { edges { node { id } } } } }')
+        self.assertEqual(result['extensions']['cost']['requested'], 0)
+        result = self.post('{ search(query: "ann") { __typename } }')
+        self.assertEqual(result['extensions']['cost']['requested'], 20)
+
+    def test_mistyped_page_size_variable_is_a_graphql_error(self):
+        response = self.client.post(
+            '/graphql/',
+            json.dumps({'query': 'query ($n: Int) { customers(first: $n) { id } }', 'variables': {'n': '5'}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        result = response.json()
+        self.assertIn("Variable '$n' has invalid value", result['errors'][0]['message'])
+        self.assertEqual(result['extensions']['cost']['requested'], crm_setting('LIST_MAX_LIMIT'))
+
+    def test_unbounded_recursion_is_rejected_before_execution(self):
+        self.create_orders(2)
+        query = """
+            {
+              allCustomers {
+                edges { node { orders { edges { node { products { edges { node {
+                  orders { edges { node { customer { orders { edges { node { id } } } } } } }
+                } } } } } } } }
+              }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            result = self.post(query)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertNotIn('data', result)
+        self.assertEqual(result['errors'][0]['extensions']['code'], 'QUERY_TOO_COMPLEX')
+        self.assertEqual(result['extensions']['cost']['depth'], 6)
+
+    def test_depth_limit(self):
+        query = '{ orders(first: 1) { customer { orders(first: 1) { edges { node { id } } } } } }'
+        with self.settings(CRM={'QUERY_MAX_DEPTH': 2}):
+            result = self.post(query)
+        self.assertIn('maximum depth of 2', result['errors'][0]['message'])
+
+
+class AsyncViewTests(GraphQLTestMixin, TestCase):
+    async def apost(self, query, variables=None):
+        response = await self.async_client.post(
+            '/graphql/async/',
+            json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        result = response.json()
+        self.assertNotIn('errors', result, result.get('errors'))
+        return result['data']
+
+    async def test_matches_sync_endpoint(self):
+        await sync_to_async(self.create_orders)(5)
+        query = """
+            {
+              orders { id totalAmount customer { name } items { quantity product { name } } }
+              allCustomers(first: 3) { edges { node { name orders { edges { node { id } } } } } }
+              product(id: $id) { name orders(first: 2) { edges { node { id } } } }
+            }
+        """
+        query = 'query ($id: ID)' + query
+        variables = {'id': (await Product.objects.afirst()).pk}
+        data = await self.apost(query, variables)
+        expected = await sync_to_async(self.execute)(query, variables)
+        self.assertEqual(data, expected)
+
+    def test_nested_relations_are_batched(self):
+        self.create_orders(3)
+        query = '{ orders { customer { email } products { edges { node { name } } } } }'
+        with CaptureQueriesContext(connection) as small:
+            async_to_sync(self.apost)(query)
+        self.create_orders(20)
+        with CaptureQueriesContext(connection) as large:
+            data = async_to_sync(self.apost)(query)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(len(data['orders']), 23)
+
+    async def test_filtered_connection_and_mutation(self):
+        await sync_to_async(self.create_orders)(2)
+        product_ids = [product.pk async for product in Product.objects.order_by('id')[:2]]
+        data = await self.apost(
+            'mutation ($id: ID!, $products: [ID]) { createOrder(input: {customerId: $id, productIds: $products}) '
+            '{ success order { totalAmount } } }',
+            {'id': (await Customer.objects.afirst()).pk, 'products': product_ids},
+        )
+        self.assertTrue(data['createOrder']['success'])
+        self.assertEqual(Decimal(data['createOrder']['order']['totalAmount']), Decimal('3'))
+        data = await self.apost('{ customers { orders(totalAmountLte: 3) { edges { node { id } } } } }')
+        self.assertEqual(sum(len(c['orders']['edges']) for c in data['customers']), 2)
+
+
+class CRMStatsTests(GraphQLTestMixin, TestCase):
+    QUERY = """
+        query ($from: DateTime, $to: DateTime) {
+          crmStats(from: $from, to: $to) { customerCount orderCount revenue }
+        }
+    """
+
+    def test_totals_take_constant_queries(self):
+        self.create_orders(3)
+        count, data = self.count_queries(self.QUERY)
+        self.assertEqual(count, 2)
+        self.assertEqual(data['crmStats']['customerCount'], 3)
+        self.assertEqual(data['crmStats']['orderCount'], 3)
+        self.assertEqual(data['crmStats']['revenue'], '11.00')
+        # New rows invalidate the cached stats
+        self.create_orders(1)
+        self.assertEqual(self.execute(self.QUERY)['crmStats']['orderCount'], 4)
+
+    def test_date_bounds(self):
+        self.create_orders(2)
+        old = Order.objects.order_by('id').first()
+        Order.objects.filter(pk=old.pk).update(order_date='2020-01-01T00:00:00Z')
+        data = self.execute(self.QUERY, {'from': '2021-01-01T00:00:00+00:00'})
+        self.assertEqual(data['crmStats']['orderCount'], 1)
+        self.assertEqual(data['crmStats']['customerCount'], 2)
+        data = self.execute(self.QUERY, {'to': '2021-01-01T00:00:00+00:00'})
+        self.assertEqual(data['crmStats']['orderCount'], 1)
+        self.assertEqual(data['crmStats']['revenue'], f'{old.total_amount:.2f}')
+        self.assertEqual(data['crmStats']['customerCount'], 0)
+
+    def test_empty_database(self):
+        data = self.execute(self.QUERY)
+        self.assertEqual(data['crmStats'], {'customerCount': 0, 'orderCount': 0, 'revenue': '0.00'})
+
+
+class RollupTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ann = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price='999.99', stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price='25.50', stock=5)
+
+    def assertRollupsMatch(self):
+        self.assertEqual(list(find_mismatches()), [])
+
+    def create_order(self, customer, *items):
+        data = self.execute(
+            'mutation ($input: OrderInput!) { createOrder(input: $input) { order { id } } }',
+            {'input': {
+                'customerId': customer.pk,
+                'items': [{'productId': product.pk, 'quantity': quantity} for product, quantity in items],
+            }},
+        )
+        return Order.objects.get(pk=from_global_id(data['createOrder']['order']['id']).id)
+
+    def test_rollups_follow_every_write_path(self):
+        first = self.create_order(self.ann, (self.laptop, 1), (self.mouse, 2))
+        second = self.create_order(self.ann, (self.mouse, 1))
+        self.assertRollupsMatch()
+        day = DailyRevenue.objects.get()
+        self.assertEqual((day.order_count, day.customer_count), (2, 1))
+        self.assertEqual(day.revenue, Decimal('1076.49'))
+
+        third = Order.objects.create(customer=self.bob)
+        third.products.set([self.laptop, self.mouse])
+        self.assertRollupsMatch()
+
+        item = OrderItem.objects.get(order=first, product=self.mouse)
+        item.quantity = 5
+        item.save()
+        item.product = self.laptop
+        OrderItem.objects.filter(order=first, product=self.laptop).delete()
+        item.save()
+        self.assertRollupsMatch()
+
+        second.order_date = second.order_date - timedelta(days=3)
+        second.customer = self.bob
+        second.save()
+        self.assertRollupsMatch()
+        self.assertEqual(DailyRevenue.objects.count(), 2)
+
+        third.products.remove(self.mouse)
+        first.delete()
+        self.assertRollupsMatch()
+        self.bob.delete()
+        self.mouse.delete()
+        self.assertRollupsMatch()
+        self.assertFalse(DailyRevenue.objects.exclude(order_count=0).exists())
+
+    def test_revenue_by_period(self):
+        monday = timezone.make_aware(datetime(2024, 5, 6, 12))
+        for offset, customer in ((0, self.ann), (1, self.ann), (1, self.bob), (30, self.ann)):
+            order = self.create_order(customer, (self.mouse, 2))
+            Order.objects.filter(pk=order.pk).update(order_date=monday + timedelta(days=offset))
+        rebuild()
+        query = """
+            query ($granularity: Granularity!, $from: Date, $to: Date) {
+              revenueByPeriod(granularity: $granularity, from: $from, to: $to) {
+                period orderCount revenue unitsSold customerCount
+              }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            days = self.execute(query, {'granularity': 'DAY'})['revenueByPeriod']
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(
+            [(row['period'], row['orderCount'], row['customerCount']) for row in days],
+            [('2024-05-06', 1, 1), ('2024-05-07', 2, 2), ('2024-06-05', 1, 1)],
+        )
+        weeks = self.execute(query, {'granularity': 'WEEK', 'to': '2024-05-12'})['revenueByPeriod']
+        self.assertEqual(weeks, [{
+            'period': '2024-05-06', 'orderCount': 3, 'revenue': '153.00',
+            'unitsSold': 6, 'customerCount': None,
+        }])
+        months = self.execute(query, {'granularity': 'MONTH', 'from': '2024-05-07'})['revenueByPeriod']
+        self.assertEqual([(row['period'], row['orderCount']) for row in months], [('2024-05-01', 2), ('2024-06-01', 1)])
+
+    def test_check_and_rebuild_commands(self):
+        self.create_order(self.ann, (self.laptop, 1))
+        DailyRevenue.objects.update(revenue=0)
+        DailyProductSales.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('check_rollups', stdout=StringIO())
+        call_command('check_rollups', '--fix', stdout=StringIO())
+        self.assertRollupsMatch()
+
+        DailyRevenue.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('crm.DailyRevenue: 1 rows', out.getvalue())
+        self.assertRollupsMatch()
+
+
+class TracingTests(GraphQLTestMixin, TestCase):
+    QUERY = 'query Orders { allOrders(first: 5) { edges { node { totalAmount customer { name } } } } }'
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.create_orders(3)
+
+    def post_traced(self, path='/graphql/'):
+        response = self.client.post(
+            path,
+            json.dumps({'query': self.QUERY, 'extensions': {'tracing': True}}),
+            content_type='application/json',
+        )
+        return response.json()
+
+    def test_tracing_extension_on_request(self):
+        with CaptureQueriesContext(connection) as context:
+            result = self.post_traced()
+        tracing = result['extensions']['tracing']
+        self.assertEqual(tracing['sql']['queries'], len(context.captured_queries))
+        self.assertGreater(tracing['duration'], tracing['sql']['duration'])
+        fields = {field['field']: field['calls'] for field in tracing['fields']}
+        self.assertEqual(fields['Query.allOrders'], 1)
+        self.assertEqual(fields['OrderType.customer'], 3)
+        # Plain attribute reads are not timed
+        self.assertNotIn('OrderType.totalAmount', fields)
+
+        self.assertNotIn('tracing', self.post(self.QUERY + ' ').get('extensions', {}))
+
+    def test_async_endpoint_counts_sql_in_worker_threads(self):
+        result = async_to_sync(self.async_client.post)(
+            '/graphql/async/',
+            json.dumps({'query': self.QUERY, 'extensions': {'tracing': True}}),
+            content_type='application/json',
+        ).json()
+        self.assertGreater(result['extensions']['tracing']['sql']['queries'], 0)
+
+    def test_metrics_endpoint(self):
+        self.execute(self.QUERY)
+        self.execute('mutation { updateLowStockProducts(increment: 1) { success } }')
+        response = self.client.get('/metrics/')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('crm_graphql_operation_duration_seconds_count{operation="Orders",type="query"} 1', body)
+        self.assertIn('crm_graphql_operation_duration_seconds_count{operation="anonymous",type="mutation"} 1', body)
+        self.assertIn('crm_graphql_operation_sql_queries_bucket{operation="Orders",type="query",le="+Inf"} 1', body)
+        self.assertIn('crm_graphql_field_duration_seconds_count{field="Query.allOrders"} 1', body)
+        self.assertIn('crm_graphql_document_cache_misses_total', body)
+
+    def test_slow_operations_are_sampled(self):
+        with self.settings(CRM={'TRACING_SLOW_SECONDS': 0}), self.assertLogs('crm.tracing', 'WARNING'):
+            self.execute(self.QUERY)
+        samples = self.client.get('/metrics/slow/').json()['operations']
+        self.assertEqual([sample['operation'] for sample in samples], ['Orders'])
+        self.assertIn('Query.allOrders', [field['field'] for field in samples[0]['fields']])
+        self.assertIn('crm_graphql_slow_operations_total 1', self.client.get('/metrics/').content.decode())
+
+    def test_debug_middleware_is_left_out(self):
+        view = CRMGraphQLView(middleware=[DjangoDebugMiddleware()])
+        with self.settings(CRM={'TRACING': False}):
+            self.assertEqual(view.get_middleware(RequestFactory().post('/graphql/')), [])
+
+    def test_disabled(self):
+        with self.settings(CRM={'TRACING': False}):
+            result = self.post_traced()
+        self.assertNotIn('tracing', result.get('extensions') or {})
+        self.assertNotIn('crm_graphql_operation_duration_seconds_count', self.client.get('/metrics/').content.decode())
+
+
+class NPlusOneTests(GraphQLTestMixin, TestCase):
+    FILTERED = '{ orders { id products(name: "Product 1") { edges { node { name } } } } }'
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM "crm_order"\n WHERE "id" = 12 AND "name" = \'it\'\'s\' LIMIT 21'),
+            'SELECT * FROM "crm_order" WHERE "id" = ? AND "name" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            statement_shape('SELECT 1 FROM "crm_product" WHERE "id" IN (%s, %s, %s)'),
+            statement_shape('SELECT 1 FROM "crm_product" WHERE "id" IN (%s)'),
+        )
+
+    def test_loaders_batch_every_relation(self):
+        self.create_orders(10)
+        with detect_n_plus_one(threshold=1):
+            self.execute("""
+                {
+                  allOrders(first: 20) { edges { node { customer { email } items { product { name } } } } }
+                  allCustomers(first: 20) { edges { node { orders { edges { node { products { edges { node { name } } } } } } } } }
+                }
+            """)
+
+    def test_detects_query_per_list_item(self):
+        self.create_orders(4)
+        with self.assertRaises(NPlusOneError) as raised, detect_n_plus_one() as violations:
+            self.execute(self.FILTERED)
+        self.assertEqual(raised.exception.violations, violations)
+        self.assertEqual([v.count for v in violations], [4, 4])
+        self.assertIn('batch OrderType.products', str(raised.exception))
+
+        with detect_n_plus_one(threshold=4):
+            self.execute(self.FILTERED)
+
+    def test_detects_in_async_endpoint(self):
+        self.create_orders(4)
+        with detect_n_plus_one(raise_violations=False) as violations:
+            response = async_to_sync(self.async_client.post)(
+                '/graphql/async/', json.dumps({'query': self.FILTERED}), content_type='application/json',
+            )
+        self.assertNotIn('errors', response.json())
+        self.assertEqual({v.field for v in violations}, {'OrderType.products'})
+
+    def test_strict_mode(self):
+        self.create_orders(4)
+        with self.settings(CRM={'NPLUSONE': 'raise'}):
+            result = self.post(self.FILTERED)
+        self.assertNotIn('data', result)
+        self.assertIn('OrderType.products (at orders.products) ran 4 queries', result['errors'][0]['message'])
+
+        with self.settings(CRM={'NPLUSONE': 'log'}), self.assertLogs('crm.nplusone', 'WARNING') as logs:
+            self.execute(self.FILTERED)
+        self.assertEqual(len(logs.records), 2)
+
+        with self.settings(CRM={'NPLUSONE': None}), CaptureQueriesContext(connection):
+            self.execute(self.FILTERED)
+
+
+class OrderRemindersTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name='Ann', email='ann@example.com')
+        self.now = timezone.now()
+        self.checkpoint = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'checkpoint.json')
+
+    def create_order(self, days_ago):
+        order = Order.objects.create(customer=self.customer)
+        Order.objects.filter(pk=order.pk).update(order_date=self.now - timedelta(days=days_ago))
+        return order
+
+    def run_reminders(self, batch_size=2):
+        log = StringIO()
+        with CaptureQueriesContext(connection) as context:
+            processed = process_reminders(self.execute, log, self.checkpoint, batch_size, self.now)
+        return processed, log.getvalue(), context.captured_queries
+
+    def test_only_orders_in_the_window_are_read(self):
+        self.create_order(30)
+        recent = [self.create_order(days) for days in (6, 5, 4, 3, 2)]
+        processed, log, queries = self.run_reminders()
+        self.assertEqual(processed, 5)
+        self.assertIn('Total reminders processed: 5', log)
+        logged = [line.split('Order ID: ')[1].split(',')[0] for line in log.splitlines() if 'Order ID' in line]
+        self.assertEqual([from_global_id(order_id).id for order_id in logged], [str(order.pk) for order in recent])
+        # Three batches of at most two orders, one query each
+        self.assertEqual(len(queries), 3)
+
+    def test_runs_resume_after_the_checkpoint(self):
+        self.create_order(3)
+        self.assertEqual(self.run_reminders()[0], 1)
+        processed, log, _ = self.run_reminders()
+        self.assertEqual(processed, 0)
+        self.assertIn('No new orders', log)
+
+        newest = self.create_order(0)
+        self.assertEqual(self.run_reminders()[0], 1)
+        with open(self.checkpoint) as checkpoint_file:
+            self.assertEqual(from_global_id(json.load(checkpoint_file)['orderId']).id, str(newest.pk))
+
+
+class PurgeInactiveCustomersTests(TestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=400)
+        self.lapsed = self.create_customer('lapsed', long_ago, order_days_ago=[500, 380])
+        self.active = self.create_customer('active', long_ago, order_days_ago=[500, 10])
+        self.silent = self.create_customer('silent', long_ago)
+        self.new = self.create_customer('new', timezone.now())
+
+    def create_customer(self, name, created_at, order_days_ago=()):
+        customer = Customer.objects.create(name=name, email=f'{name}@example.com')
+        Customer.objects.filter(pk=customer.pk).update(created_at=created_at)
+        for days in order_days_ago:
+            order = Order.objects.create(customer=customer)
+            Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=days))
+        return customer
+
+    def test_dry_run_only_counts(self):
+        out = StringIO()
+        call_command('purge_inactive_customers', '--dry-run', stdout=out)
+        self.assertIn('Would delete 2 inactive customers', out.getvalue())
+        self.assertEqual(Customer.objects.count(), 4)
+
+    def test_deletes_inactive_customers_in_chunks(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as context:
+            call_command('purge_inactive_customers', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 2 inactive customers', out.getvalue())
+        self.assertCountEqual(Customer.objects.values_list('name', flat=True), ['active', 'new'])
+        self.assertFalse(Order.objects.filter(customer_id=self.lapsed.pk).exists())
+        # One transaction per customer, and a last one that finds nothing
+        self.assertEqual(sum(query['sql'].startswith('SAVEPOINT') for query in context.captured_queries), 3)
+
+
+class GraphQLClientTests(GraphQLTestMixin, TestCase):
+    def test_operations_run_in_process(self):
+        self.assertIsInstance(get_client().transport, SchemaTransport)
+        self.assertEqual(graphql_client.execute('{ hello }'), {'hello': 'Hello, GraphQL!'})
+
+        self.create_orders(5)
+        with CaptureQueriesContext(connection) as context:
+            data = graphql_client.execute(
+                'query ($first: Int) { orders(first: $first) { customer { name } products(first: 5) { edges { node { name } } } } }',
+                {'first': 5},
+            )
+        self.assertEqual(len(data['orders']), 5)
+        # Each operation gets its own loaders, so related rows are batched
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_mutations_and_errors_match_the_http_client(self):
+        Product.objects.create(name='Cable', price=5, stock=1)
+        data = graphql_client.execute(
+            'mutation ($increment: Int!) { updateLowStockProducts(increment: $increment) { updatedProducts { stock } } }',
+            {'increment': 10},
+        )
+        self.assertEqual(data['updateLowStockProducts']['updatedProducts'], [{'stock': 11}])
+
+        with self.assertRaises(TransportQueryError):
+            graphql_client.execute('{ customers(first: 5000) { id } }')
+
+    def test_endpoint_setting_switches_to_http(self):
+        with self.settings(CRM={'GRAPHQL_ENDPOINT': 'http://crm.example/graphql'}):
+            client = get_client()
+        self.assertIsInstance(client.transport, RequestsHTTPTransport)
+        self.assertEqual(client.transport.url, 'http://crm.example/graphql')
+        self.assertFalse(client.fetch_schema_from_transport)
+        self.assertIsNotNone(client.schema)
+
+
+class BatchTests(GraphQLTestMixin, TestCase):
+    CUSTOMERS = 'query Customers { customers { name email } }'
+    CREATE = 'mutation ($email: String!) { createCustomer(input: {name: "Batch", email: $email}) { success errors } }'
+
+    def post_batch(self, entries):
+        response = self.client.post('/graphql/', json.dumps(entries), content_type='application/json')
+        return response.status_code, response.json()
+
+    @override_settings(CRM={'BATCH_MAX_WORKERS': 1})
+    def test_results_match_single_operations(self):
+        self.create_orders(2)
+        entries = [
+            {'query': self.CUSTOMERS},
+            {'query': self.CREATE, 'variables': {'email': 'batch@example.com'}},
+            {'query': self.CREATE, 'variables': {'email': 'batch@example.com'}},
+            {'query': self.CUSTOMERS},
+            {'query': '{ customers(first: 5000) { id } }'},
+            {'query': '{ nope'},
+            {'variables': {}},
+            ['not', 'an', 'operation'],
+        ]
+        with transaction.atomic():
+            singles = [
+                self.client.post('/graphql/', json.dumps(entry), content_type='application/json').json()
+                for entry in entries
+            ]
+            transaction.set_rollback(True)
+        caches['default'].clear()
+
+        status_code, results = self.post_batch(entries)
+        self.assertEqual(status_code, 400)
+        self.assertEqual(results[:-1], singles[:-1])
+        self.assertEqual(len(results[3]['data']['customers']), 3)
+        self.assertEqual(results[2]['data']['createCustomer']['errors'], ['Email already exists'])
+        self.assertEqual(results[-1], {'errors': [{'message': 'Every batch entry must be a JSON object.'}]})
+
+    def test_limits(self):
+        status_code, result = self.post_batch([{'query': '{ hello }'}] * (crm_setting('BATCH_MAX_OPERATIONS') + 1))
+        self.assertEqual(status_code, 400)
+        self.assertIn('at most 20 operations', result['errors'][0]['message'])
+
+        status_code, result = self.post_batch([])
+        self.assertEqual(status_code, 400)
+
+        status_code, results = self.post_batch([{'query': '{ hello }'}])
+        self.assertEqual((status_code, results[0]['data']), (200, {'hello': 'Hello, GraphQL!'}))
+
+        response = self.client.post('/graphql/async/', '[{"query": "{ hello }"}]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_client_batches(self):
+        self.assertEqual(
+            graphql_client.execute_batch([('{ hello }', None), ('query ($first: Int) { customers(first: $first) { id } }', {'first': 1})]),
+            [{'hello': 'Hello, GraphQL!'}, {'customers': []}],
+        )
+
+
+class FlaggedCreateCustomer(graphene.Mutation):
+    """Creates a customer, then reports errors the way graphene-django's form mutations do"""
+
+    class Arguments:
+        email = graphene.String(required=True)
+
+    ok = graphene.Boolean()
+
+    @staticmethod
+    def mutate(root, info, email):
+        Customer.objects.create(name='Flagged', email=email)
+        setattr(info.context, MUTATION_ERRORS_FLAG, True)
+        return FlaggedCreateCustomer(ok=False)
+
+
+class FlaggedMutation(graphene.ObjectType):
+    flagged_create_customer = FlaggedCreateCustomer.Field()
+
+
+class AtomicBatchTests(TestCase):
+    def test_flagged_mutation_in_batch_is_rolled_back(self):
+        view = CRMGraphQLView.as_view(schema=graphene.Schema(query=Query, mutation=FlaggedMutation))
+        request = RequestFactory().post('/graphql/', json.dumps([
+            {'query': '{ hello }'},
+            {'query': 'mutation { flaggedCreateCustomer(email: "flagged@example.com") { ok } }'},
+        ]), content_type='application/json')
+        connection.settings_dict['ATOMIC_MUTATIONS'] = True
+        try:
+            response = view(request)
+        finally:
+            del connection.settings_dict['ATOMIC_MUTATIONS']
+        self.assertEqual(json.loads(response.content)[1]['data'], {'flaggedCreateCustomer': {'ok': False}})
+        self.assertFalse(Customer.objects.filter(email='flagged@example.com').exists())
+
+
+class ConcurrentBatchTests(GraphQLTestMixin, TransactionTestCase):
+    COUNT = 'query Stats { crmStats { customerCount } }'
+
+    def test_queries_run_on_the_pool_and_mutations_in_order(self):
+        self.assertGreater(crm_setting('BATCH_MAX_WORKERS'), 1)
+        create = 'mutation { createCustomer(input: {name: "Batch", email: "batch@example.com"}) { success } }'
+        entries = [{'query': self.COUNT}] * 3 + [{'query': create}] + [{'query': self.COUNT}] * 3
+        response = self.client.post('/graphql/', json.dumps(entries), content_type='application/json')
+        counts = [result['data']['crmStats']['customerCount'] for result in response.json() if 'crmStats' in result['data']]
+        self.assertEqual(counts, [0, 0, 0, 1, 1, 1])
+        self.assertTrue(any(thread.name.startswith('crm-graphql-batch') for thread in threading.enumerate()))
+
+
+class SearchTests(GraphQLTestMixin, TestCase):
+    SEARCH = """
+        query ($query: String!, $types: [SearchKind!], $first: Int) {
+            search(query: $query, types: $types, first: $first) {
+                __typename
+                ... on CustomerType { name }
+                ... on ProductType { name }
+            }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        Customer.objects.bulk_create([
+            Customer(name='Alice Smith', email='alice@example.com'),
+            Customer(name='Malice Jones', email='mj@example.com'),
+            Customer(name='Bob Stone', email='bob@alice.example'),
+        ])
+        Product.objects.create(name='Alice Blue Mug', price=5)
+        Product.objects.create(name='Laptop', price=999)
+
+    def search(self, query, **variables):
+        data = self.execute(self.SEARCH, {'query': query, **variables})['search']
+        return [(row['__typename'], row['name']) for row in data]
+
+    def test_search_ranks_customers_and_products(self):
+        results = self.search('alice')
+        self.assertCountEqual(results, [
+            ('CustomerType', 'Alice Smith'), ('CustomerType', 'Malice Jones'),
+            ('CustomerType', 'Bob Stone'), ('ProductType', 'Alice Blue Mug'),
+        ])
+        # Name and email both contain the term
+        self.assertEqual(results[0], ('CustomerType', 'Alice Smith'))
+        self.assertEqual(self.search('alice smi'), [('CustomerType', 'Alice Smith')])
+        self.assertEqual(self.search('alice', types=['PRODUCT']), [('ProductType', 'Alice Blue Mug')])
+        self.assertEqual(len(self.search('alice', first=2)), 2)
+        # Shorter than a trigram: answered by icontains
+        self.assertEqual(self.search('mu'), [('ProductType', 'Alice Blue Mug')])
+
+        result = self.post(self.SEARCH, {'query': 'alice', 'first': 5000})
+        self.assertIn('exceeds the limit', result['errors'][0]['message'])
+
+    def test_old_exact_match_outranks_newer_matches(self):
+        Customer.objects.create(name='Alicia', email='a@example.com')
+        Customer.objects.bulk_create([
+            Customer(name=f'Alicia Newer {i}', email=f'newer{i}@example.com') for i in range(10)
+        ])
+        with self.settings(CRM={'SEARCH_CANDIDATES': 3}):
+            results = self.search('alicia')
+        self.assertEqual(results[0], ('CustomerType', 'Alicia'))
+
+    def test_index_follows_bulk_writes(self):
+        Customer.objects.filter(name='Bob Stone').update(name='Robert Stone', email='robert@example.com')
+        Customer.objects.filter(name='Malice Jones').delete()
+        Customer.objects.bulk_create([Customer(name='Alicia Keys', email='ak@example.com')])
+        self.assertEqual(
+            [name for _type, name in self.search('alic', types=['CUSTOMER'])],
+            ['Alice Smith', 'Alicia Keys'],
+        )
+        self.assertEqual(self.search('robert'), [('CustomerType', 'Robert Stone')])
+
+    def test_filters_use_the_index(self):
+        query = '{ allCustomers(name: "LICE") { edges { node { name } } } }'
+        with CaptureQueriesContext(connection) as context:
+            data = self.execute(query)
+        names = [edge['node']['name'] for edge in data['allCustomers']['edges']]
+        self.assertEqual(names, ['Alice Smith', 'Malice Jones'])
+        self.assertIn('crm_customer_search MATCH', context.captured_queries[0]['sql'])
+
+        order = Order.objects.create(customer=Customer.objects.get(name='Bob Stone'))
+        order.products.set(Product.objects.all())
+        query = '{ allOrders(customerName: "stone", productName: "mug") { edges { node { totalAmount } } } }'
+        self.assertEqual(len(self.execute(query)['allOrders']['edges']), 1)
+        query = '{ allOrders(productName: "lap") { edges { node { totalAmount } } } }'
+        self.assertEqual(len(self.execute(query)['allOrders']['edges']), 1)
+
+    def test_rebuild_command_restores_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO crm_customer_search(crm_customer_search) VALUES ('delete-all')")
+            cursor.execute("DROP TRIGGER crm_customer_search_ai")
+        self.assertEqual(self.search('smith'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('crm.Customer: rows=3', out.getvalue())
+        self.assertEqual(self.search('smith'), [('CustomerType', 'Alice Smith')])
+        Customer.objects.create(name='Will Smith', email='will@example.com')
+        self.assertEqual(len(self.search('smith')), 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Every combination of list filters must be answered through an index"""
+
+    FILTER_VALUES = {
+        CustomerFilter: {
+            'name': 'ali', 'email': 'example', 'phone_pattern': '+1',
+            'created_at_gte': '2024-01-01T00:00:00Z', 'created_at_lte': '2024-02-01T00:00:00Z',
+        },
+        ProductFilter: {
+            'name': 'lap', 'price_gte': '5', 'price_lte': '10',
+            'stock_gte': '1', 'stock_lte': '5', 'low_stock': 'true',
+        },
+        OrderFilter: {
+            'total_amount_gte': '5', 'total_amount_lte': '10',
+            'order_date_gte': '2024-01-01T00:00:00Z', 'order_date_lte': '2024-02-01T00:00:00Z',
+            'customer_name': 'ali', 'product_name': 'lap', 'product_id': '1',
+        },
+    }
+
+    def full_scans(self, queryset):
+        # Scans of FTS5 tables are index lookups: "VIRTUAL TABLE INDEX n:M"
+        plan = queryset.explain()
+        return [line for line in plan.splitlines() if re.search(r'\bSCAN (?!\w+ VIRTUAL TABLE)', line)]
+
+    def test_filter_combinations_use_indexes(self):
+        for filterset_class, values in self.FILTER_VALUES.items():
+            # A new filter needs a value here before it can ship
+            self.assertCountEqual(values, filterset_class.base_filters)
+            model = filterset_class._meta.model
+            for size in range(1, len(values) + 1):
+                for names in itertools.combinations(values, size):
+                    with self.subTest(filterset=filterset_class.__name__, filters=names):
+                        filterset = filterset_class({name: values[name] for name in names}, queryset=model.objects.all())
+                        self.assertTrue(filterset.is_valid(), filterset.errors)
+                        self.assertEqual(self.full_scans(filterset.qs.order_by()), [])
+
+    def test_list_pages_read_in_index_order(self):
+        low_stock = Product.objects.filter(stock__lt=crm_setting('LOW_STOCK_THRESHOLD'))
+        for queryset in (Customer.objects.all(), Product.objects.all(), Order.objects.all(), low_stock):
+            with self.subTest(model=queryset.model.__name__, filtered=bool(queryset.query.where)):
+                plan = queryset.order_by(*keyset_ordering(queryset.model))[:20].explain()
+                self.assertNotIn('TEMP B-TREE', plan)
+        self.assertIn('crm_product_low_stock_idx', low_stock.order_by('name', 'pk')[:20].explain())
+
+    def test_keyset_pages_seek_the_index(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        order = Order.objects.create(customer=customer)
+        for model, row in ((Order, order), (Customer, customer)):
+            ordering = keyset_ordering(model)
+            values = [getattr(row, field.lstrip('-')) for field in ordering]
+            for forward in (True, False):
+                with self.subTest(model=model.__name__, forward=forward):
+                    queryset = model.objects.filter(seek_filter(ordering, values, forward)).order_by(*ordering)
+                    plan = queryset[:20].explain()
+                    self.assertRegex(plan, r'\bSEARCH \w+ USING (COVERING )?INDEX')
+                    self.assertNotRegex(plan, r'\bSCAN ')
+
+    def test_phone_pattern_is_a_prefix_range(self):
+        for phone in ('+1234567890', '+1999', '+2000000000', '123-456-7890', None):
+            Customer.objects.create(name=str(phone), email=f'{phone}@example.com', phone=phone)
+        filterset = CustomerFilter({'phone_pattern': '+1'}, queryset=Customer.objects.all())
+        self.assertEqual(sorted(filterset.qs.values_list('phone', flat=True)), ['+1234567890', '+1999'])
+
+    def test_inactive_customer_purge_is_an_index_probe(self):
+        plan = inactive_customers(timezone.now()).explain()
+        self.assertIn('USING COVERING INDEX crm_order_customer_date_idx', plan)
+
+
+class GenerateCrmDataTests(TestCase):
+    def generate(self, *args):
+        out = StringIO()
+        call_command(
+            'generate_crm_data', '--customers', '40', '--products', '30', '--orders', '300',
+            '--end', '2025-01-01', '--batch-size', '64', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_generates_consistent_reproducible_data(self):
+        output = self.generate('--seed', '7')
+        self.assertIn('rows/sec=', output)
+        self.assertEqual((Customer.objects.count(), Product.objects.count(), Order.objects.count()), (40, 30, 300))
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total_amount, sum(item.line_total for item in order.items.all()))
+        self.assertEqual(list(find_mismatches()), [])
+        # Indexes dropped for the load are back
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Order._meta.db_table)
+        self.assertIn('crm_order_total_amount_idx', constraints)
+        self.assertIn('crm_order_customer_date_idx', constraints)
+
+        # Zipf: the best seller sells far more than a typical product
+        sales = sorted(Product.objects.annotate(n=Count('order_items')).values_list('n', flat=True))
+        self.assertGreater(sales[-1], 4 * sales[len(sales) // 2])
+
+        snapshot = list(Order.objects.order_by('pk').values_list('customer__name', 'order_date', 'total_amount'))
+        self.generate('--seed', '7', '--clear')
+        self.assertEqual(
+            list(Order.objects.order_by('pk').values_list('customer__name', 'order_date', 'total_amount')),
+            snapshot,
+        )
+
+    def test_reruns_add_rows_and_keep_search_in_sync(self):
+        self.generate()
+        self.generate('--orders', '10')
+        self.assertEqual(Customer.objects.count(), 80)
+        self.assertEqual(Order.objects.count(), 310)
+        self.assertEqual(list(find_mismatches()), [])
+        customer = Customer.objects.latest('pk')
+        self.assertIn(customer, search(customer.email, first=5))
+
+    def test_appends_keep_indexes_during_the_load(self):
+        self.generate()
+        indexes = []
+
+        def progress(orders, items):
+            with connection.cursor() as cursor:
+                indexes.append(set(connection.introspection.get_constraints(cursor, Order._meta.db_table)))
+
+        # More orders than the table holds, still into a live table
+        synthetic.generate(5, 5, 400, batch_size=200, progress=progress)
+        self.assertEqual(len(indexes), 2)
+        for constraints in indexes:
+            self.assertIn('crm_order_total_amount_idx', constraints)
+
+    def test_orders_need_customers_and_products(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_crm_data', '--customers', '0', '--orders', '5', stdout=StringIO())
+
+
+class WriteRetryTests(SimpleTestCase):
+    def flaky(self, failures, message='database is locked'):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'written'
+
+        return write, calls
+
+    @override_settings(CRM={'WRITE_RETRIES': 3, 'WRITE_RETRY_BACKOFF': 0})
+    def test_retries_lock_errors(self):
+        write, calls = self.flaky(3)
+        self.assertEqual(retry_on_lock(write)(), 'written')
+        self.assertEqual(len(calls), 4)
+
+        write, calls = self.flaky(4)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            retry_on_lock(write)()
+        self.assertEqual(len(calls), 4)
+
+        write, calls = self.flaky(1, 'no such table: crm_order')
+        with self.assertRaises(OperationalError):
+            retry_on_lock(write)()
+        self.assertEqual(len(calls), 1)
+
+
+class DatabaseProfileTests(TransactionTestCase):
+    def test_connection_settings(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    @override_settings(CRM={'WRITE_RETRIES': 3, 'WRITE_RETRY_BACKOFF': 0})
+    def test_no_retry_inside_a_transaction(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError), transaction.atomic():
+            atomic_with_retry(write)()
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrency_benchmark(self):
+        load_dataset(50)
+        # The in-memory test database locks whole tables between
+        # connections, so real concurrency is left to benchmark_concurrency
+        result = run_concurrent(threads=1, seconds=0.5, write_ratio=0.5)
+        self.assertEqual(result['errors'], [])
+        self.assertGreater(result['read']['completed'], 0)
+        self.assertEqual(Order.objects.count(), 50 + result['write']['completed'])
+
+
+class BenchmarkSuiteTests(TestCase):
+    def snapshot(self):
+        return list(Order.objects.order_by('pk').values_list(
+            'customer__name', 'order_date', 'total_amount', 'items__product__name', 'items__quantity',
+        ))
+
+    def test_dataset_is_deterministic_and_consistent(self):
+        load_dataset(50, batch_size=20)
+        first = self.snapshot()
+        load_dataset(50, batch_size=20)
+        self.assertEqual(self.snapshot(), first)
+
+        self.assertEqual(Order.objects.count(), 50)
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total_amount, sum(item.line_total for item in order.items.all()))
+        self.assertEqual(list(find_mismatches()), [])
+
+    def test_operations_are_valid_and_rolled_back(self):
+        load_dataset(20)
+        suite = {operation.name: operation for operation in operations()}
+        self.assertIn('allOrders.filter:total_amount_gte+customer_name+product_id', suite)
+        for operation in suite.values():
+            self.assertEqual(validate(schema.graphql_schema, parse(operation.query)), [], operation.name)
+
+        result = measure(suite['createOrder'], repeat=2)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertGreater(result['queries'], 0)
+        self.assertGreater(result['peak_memory_bytes'], 0)
+        self.assertLessEqual(result['min_seconds'], result['seconds'])
+
+    def test_compare_reports_regressions(self):
+        base = {'scale': '10k', 'operation': 'createOrder', 'seconds': 0.02, 'min_seconds': 0.02,
+                'queries': 9, 'peak_memory_bytes': 200_000}
+        self.assertEqual(compare([{**base, 'min_seconds': 0.0245}], [base]), [])
+        self.assertEqual(compare([{**base, 'queries': 10, 'operation': 'new'}], [base]), [])
+        regressions = compare([{**base, 'queries': 10, 'min_seconds': 0.04, 'peak_memory_bytes': 400_000}], [base])
+        self.assertEqual(len(regressions), 3)
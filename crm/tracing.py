@@ -0,0 +1,309 @@
+# crm/tracing.py
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from inspect import isawaitable
+
+from django.db import connections
+from graphene.types.resolver import dict_or_attr_resolver
+from graphql.execution import MiddlewareManager, default_field_resolver
+
+from .conf import crm_setting
+
+logger = logging.getLogger(__name__)
+
+# The trace of the operation running in this context. asgiref runs
+# sync_to_async functions in a copy of the caller's context, so SQL that the
+# async schema's resolvers run in worker threads is counted as well.
+_current = ContextVar('crm_trace', default=None)
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Operation names come from clients; past this many, new ones share a label
+MAX_OPERATION_NAMES = 200
+OTHER = '__other__'
+
+
+class Trace:
+    """Where one operation spent its time: per field and in SQL"""
+
+    def __init__(self, operation_name, operation_type):
+        self.operation_name = operation_name or 'anonymous'
+        self.operation_type = operation_type
+        self.started = time.perf_counter()
+        self.duration = None
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        # (parent type, field) -> [calls, seconds]
+        self.fields = {}
+
+    def add_field(self, key, seconds):
+        entry = self.fields.get(key)
+        if entry is None:
+            self.fields[key] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def slowest_fields(self, limit=None):
+        fields = sorted(self.fields.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'field': f'{parent}.{name}', 'calls': calls, 'duration': seconds}
+            for (parent, name), (calls, seconds) in fields[:limit]
+        ]
+
+    def as_extension(self):
+        """The ``extensions.tracing`` entry of a response"""
+        return {
+            'duration': self.duration,
+            'sql': {'queries': self.sql_queries, 'duration': self.sql_seconds},
+            'fields': self.slowest_fields(),
+        }
+
+
+def record_sql(execute, sql, params, many, context):
+    """Execute wrapper adding each query's time to the current trace"""
+    trace = _current.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.sql_queries += 1
+        trace.sql_seconds += time.perf_counter() - started
+
+
+def install_sql_wrapper(connection, **kwargs):
+    """Add record_sql to a connection's execute wrappers; a connection_created receiver"""
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+@contextmanager
+def tracing(trace):
+    """Make ``trace`` current while the block runs, then record it in ``metrics``"""
+    # Connections opened later get the wrapper from connection_created
+    for connection in connections.all(initialized_only=True):
+        install_sql_wrapper(connection)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.finish()
+        metrics.record(trace)
+
+
+class TracingMiddleware:
+    """graphene middleware timing each field resolver of a traced operation.
+
+    The time is the resolver's own: nested fields resolve after it returns.
+    Async resolvers are timed until their awaitable completes.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = _current.get()
+        if trace is None:
+            return next(root, info, **args)
+        started = time.perf_counter()
+        result = next(root, info, **args)
+        key = (info.parent_type.name, info.field_name)
+        if isawaitable(result):
+            return self._timed(result, trace, key, started)
+        trace.add_field(key, time.perf_counter() - started)
+        return result
+
+    async def _timed(self, result, trace, key, started):
+        try:
+            return await result
+        finally:
+            trace.add_field(key, time.perf_counter() - started)
+
+
+def _reads_attribute(resolver):
+    # graphene's resolver for fields without a resolve_<field> method, and
+    # graphql-core's own default
+    if isinstance(resolver, partial):
+        resolver = resolver.func
+    return resolver in (dict_or_attr_resolver, default_field_resolver)
+
+
+class TracingMiddlewareManager(MiddlewareManager):
+    """Runs TracingMiddleware around every field that has a resolver of its own.
+
+    Fields that only read an attribute are left untimed: there are far
+    more of them than of anything else, and timing them would cost more
+    than they take. Any other middleware still runs around every field.
+    """
+
+    def __init__(self, *middlewares):
+        super().__init__(*middlewares)
+        self.untraced = MiddlewareManager(
+            *(middleware for middleware in middlewares if not isinstance(middleware, TracingMiddleware))
+        )
+
+    def get_field_resolver(self, field_resolver):
+        if _reads_attribute(field_resolver):
+            return self.untraced.get_field_resolver(field_resolver)
+        return super().get_field_resolver(field_resolver)
+
+
+# Shared so graphql-core wraps each field resolver once, not once per request
+tracing_middleware = TracingMiddlewareManager(TracingMiddleware())
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with one series per label values tuple"""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(
+                (labels, (list(counts), total, count))
+                for labels, (counts, total, count) in self._series.items()
+            )
+        for label_values, (counts, total, count) in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join(filter(None, [labels, f'le="{bound}"']))
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Histograms of every traced operation in this process, plus slow samples"""
+
+    def __init__(self):
+        labels = ('operation', 'type')
+        self.duration = Histogram(
+            'crm_graphql_operation_duration_seconds', 'Time to execute a GraphQL operation',
+            labels, DURATION_BUCKETS,
+        )
+        self.sql_queries = Histogram(
+            'crm_graphql_operation_sql_queries', 'SQL queries run by a GraphQL operation',
+            labels, QUERY_BUCKETS,
+        )
+        self.sql_duration = Histogram(
+            'crm_graphql_operation_sql_duration_seconds', 'Time a GraphQL operation spent in SQL',
+            labels, DURATION_BUCKETS,
+        )
+        self.fields = Histogram(
+            'crm_graphql_field_duration_seconds', 'Time an operation spent in one field, over all its calls',
+            ('field',), DURATION_BUCKETS,
+        )
+        self.slow_operations = deque(maxlen=crm_setting('TRACING_SLOW_SAMPLES'))
+        self.slow_total = 0
+        self._operation_names = set()
+        self._lock = threading.Lock()
+
+    def _operation_label(self, name):
+        with self._lock:
+            if name in self._operation_names:
+                return name
+            if len(self._operation_names) < MAX_OPERATION_NAMES:
+                self._operation_names.add(name)
+                return name
+        return OTHER
+
+    def record(self, trace):
+        labels = (self._operation_label(trace.operation_name), trace.operation_type)
+        self.duration.observe(labels, trace.duration)
+        self.sql_queries.observe(labels, trace.sql_queries)
+        self.sql_duration.observe(labels, trace.sql_seconds)
+        for (parent, name), (_calls, seconds) in trace.fields.items():
+            self.fields.observe((f'{parent}.{name}',), seconds)
+
+        if trace.duration >= crm_setting('TRACING_SLOW_SECONDS'):
+            sample = {
+                'operation': trace.operation_name,
+                'type': trace.operation_type,
+                'at': time.time(),
+                **trace.as_extension(),
+                'fields': trace.slowest_fields(5),
+            }
+            with self._lock:
+                self.slow_operations.append(sample)
+                self.slow_total += 1
+            logger.warning(
+                "Slow GraphQL %s %s: %.3fs, %d SQL queries in %.3fs",
+                trace.operation_type, trace.operation_name, trace.duration,
+                trace.sql_queries, trace.sql_seconds,
+            )
+
+    def slow_samples(self):
+        with self._lock:
+            return list(self.slow_operations)
+
+    def clear(self):
+        for histogram in (self.duration, self.sql_queries, self.sql_duration, self.fields):
+            histogram.clear()
+        with self._lock:
+            self.slow_operations.clear()
+            self.slow_total = 0
+            self._operation_names.clear()
+
+    def render(self, document_cache_stats=None):
+        """The Prometheus text exposition of every metric"""
+        lines = []
+        for histogram in (self.duration, self.sql_queries, self.sql_duration, self.fields):
+            lines.extend(histogram.render())
+        lines += [
+            '# HELP crm_graphql_slow_operations_total Operations slower than TRACING_SLOW_SECONDS',
+            '# TYPE crm_graphql_slow_operations_total counter',
+            f'crm_graphql_slow_operations_total {self.slow_total}',
+        ]
+        if document_cache_stats is not None:
+            for key, kind, help in (
+                ('hits', 'counter', 'Documents found in the parsed document cache'),
+                ('misses', 'counter', 'Documents parsed and validated because they were not cached'),
+                ('persisted_hits', 'counter', 'Persisted query hashes found in the cache'),
+                ('persisted_misses', 'counter', 'Persisted query hashes not found in the cache'),
+                ('size', 'gauge', 'Documents in the cache'),
+                ('max_size', 'gauge', 'Capacity of the cache'),
+            ):
+                name = f'crm_graphql_document_cache_{key}' + ('_total' if kind == 'counter' else '')
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {document_cache_stats[key]}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
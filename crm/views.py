@@ -1,3 +1,530 @@
-from django.shortcuts import render
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+from copy import copy
+from inspect import isawaitable
 
-# Create your views here.
+from django.db import close_old_connections, connection, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.debug import DjangoDebugMiddleware
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError, set_rollback
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, parse, validate_schema
+from graphql.error import GraphQLError
+from graphql.validation import validate
+
+from .conf import crm_setting
+from .dataloaders import CRMLoaders
+from .document_cache import CachedDocument, DocumentCache, query_hash
+from .nplusone import NPlusOneMiddleware, detecting, detection_enabled
+from .query_cost import query_cost_rule
+from .response_cache import ResponseCache
+from .tracing import Trace, TracingMiddlewareManager, metrics, tracing, tracing_middleware
+
+# Shared by every request: Django builds a new view instance per request
+document_cache = DocumentCache(crm_setting('DOCUMENT_CACHE_SIZE'))
+# Runs the queries of batched requests; bounds them across all requests
+batch_executor = ThreadPoolExecutor(
+    max_workers=max(1, crm_setting('BATCH_MAX_WORKERS')), thread_name_prefix='crm-graphql-batch'
+)
+
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQL endpoint for the CRM schema.
+
+    Every request gets its own DataLoaders. Parsed and validated documents
+    are cached by the sha256 of their text, which also backs Automatic
+    Persisted Queries: a client may send only
+    ``extensions.persistedQuery.sha256Hash`` and falls back to sending the
+    full query once when the hash is unknown.
+
+    Results of query operations are cached per viewer and invalidated by
+    version stamps of the models they read (see crm/response_cache.py).
+
+    Before anything runs, each operation's cost and depth are estimated and
+    checked against the QUERY_MAX_COST / QUERY_MAX_DEPTH budget; the
+    estimate is returned in the response's ``extensions.cost``.
+
+    With TRACING on, executed operations are timed per field and their SQL
+    is counted for the metrics endpoint (see crm/tracing.py). A request
+    with ``extensions.tracing`` set gets its timings back in the response's
+    ``extensions.tracing``.
+
+    With NPLUSONE set (or inside ``detect_n_plus_one()``), the SQL
+    of each operation is grouped by statement shape and field, and fields
+    that repeat a query per list item are logged or fail the operation
+    (see crm/nplusone.py).
+
+    A JSON array of operations is run as a batch and answered with the
+    array of their results, each the same as if the operation had been
+    posted alone. Consecutive queries run at once on ``batch_executor``;
+    a mutation waits for the operations before it and runs alone, so
+    operations still see each other's writes in order.
+    """
+
+    document_cache = document_cache
+    batch_executor = batch_executor
+    batched = False
+
+    def get_context(self, request):
+        # Operations of a batch may run at once, so each needs its own loaders
+        context = copy(request) if self.batched else request
+        context.loaders = CRMLoaders()
+        return context
+
+    def get_viewer(self, request):
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else 'anonymous'
+
+    def dispatch(self, request, *args, **kwargs):
+        if (
+            request.method.lower() == "post"
+            and self.get_content_type(request) == "application/json"
+            and request.body.lstrip().startswith(b"[")
+        ):
+            return self.dispatch_batch(request)
+        return super().dispatch(request, *args, **kwargs)
+
+    def dispatch_batch(self, request):
+        try:
+            try:
+                entries = json.loads(request.body.decode("utf-8"))
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+            if not entries:
+                raise HttpError(HttpResponseBadRequest("Received an empty list in the batch request."))
+            max_operations = crm_setting('BATCH_MAX_OPERATIONS')
+            if len(entries) > max_operations:
+                raise HttpError(HttpResponseBadRequest(
+                    f"A batch may hold at most {max_operations} operations, received {len(entries)}."
+                ))
+
+            self.batched = True
+            responses = self.execute_batch(request, entries)
+            return HttpResponse(
+                status=max(status_code for _result, status_code in responses),
+                content="[{}]".format(",".join(result for result, _status_code in responses)),
+                content_type="application/json",
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    def execute_batch(self, request, entries):
+        """Return the encoded response of every entry, in order"""
+        responses = [None] * len(entries)
+        concurrent = crm_setting('BATCH_MAX_WORKERS') > 1
+        running = []
+        for index, entry in enumerate(entries):
+            if concurrent and self.is_query(request, entry):
+                running.append((index, self.batch_executor.submit(
+                    copy_context().run, self.get_worker_response, request, entry
+                )))
+                continue
+            for pending, future in running:
+                responses[pending] = future.result()
+            running = []
+            responses[index] = self.get_batch_response(request, entry)
+        for pending, future in running:
+            responses[pending] = future.result()
+        return responses
+
+    def is_query(self, request, entry):
+        """Whether a batch entry is certainly a query; anything else runs alone"""
+        if not isinstance(entry, dict):
+            return False
+        try:
+            query, _variables, operation_name, _id = self.get_graphql_params(request, entry)
+        except HttpError:
+            return False
+        if not query:
+            return False
+        document = self.get_document(query, query_hash(query)).document
+        if document is None:
+            return False
+        operation_ast = get_operation_ast(document, operation_name)
+        return operation_ast is not None and operation_ast.operation == OperationType.QUERY
+
+    def get_worker_response(self, request, entry):
+        # Pool threads keep their connections between operations, so they
+        # are checked like a request's at its start and end
+        close_old_connections()
+        try:
+            return self.get_batch_response(request, entry)
+        finally:
+            close_old_connections()
+
+    def get_batch_response(self, request, entry):
+        """One entry's response; its errors, even HTTP ones, stay its own"""
+        try:
+            if not isinstance(entry, dict):
+                raise HttpError(HttpResponseBadRequest("Every batch entry must be a JSON object."))
+            return self.get_response(request, entry)
+        except HttpError as e:
+            return self.json_encode(request, {"errors": [self.format_error(e)]}), e.response.status_code
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.encode_result(request, execution_result, id, show_graphiql)
+
+    def encode_result(self, request, execution_result, id=None, show_graphiql=False):
+        """Serialize an ExecutionResult the way GraphQLView does, plus ``extensions``"""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def get_extensions(self, request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions if isinstance(extensions, dict) else {}
+
+    def get_persisted_query_hash(self, request, data):
+        persisted_query = self.get_extensions(request, data).get('persistedQuery') or {}
+        return persisted_query.get('sha256Hash')
+
+    def get_middleware(self, request):
+        # graphene-django adds DjangoDebugMiddleware when DEBUG is on. The
+        # schema has no _debug field, so it would only wrap every resolver
+        # call, and it leaves the connections' cursors wrapped, which breaks
+        # later executemany() calls in the same process.
+        middleware = [
+            middleware for middleware in super().get_middleware(request) or ()
+            if not isinstance(middleware, DjangoDebugMiddleware)
+        ]
+        if detection_enabled():
+            # Lazy relations are attribute reads, so this wraps every field
+            middleware.append(NPlusOneMiddleware())
+        if not crm_setting('TRACING'):
+            return middleware
+        if not middleware:
+            return tracing_middleware
+        return TracingMiddlewareManager(*middleware, *tracing_middleware.middlewares)
+
+    def trace(self, request, data, operation):
+        """Context manager tracing the execution of ``operation``"""
+        if not crm_setting('TRACING'):
+            return nullcontext()
+        operation.trace = Trace(operation.name, operation.type)
+        operation.return_trace = bool(self.get_extensions(request, data).get('tracing'))
+        return tracing(operation.trace)
+
+    def detect_n_plus_one(self, operation):
+        """Context manager checking the SQL of ``operation`` for N+1 queries"""
+        if not detection_enabled():
+            return nullcontext()
+        return detecting(operation.name)
+
+    def get_document(self, query, key):
+        """Parse and validate a query, or reuse the cached result"""
+        entry = self.document_cache.get(key)
+        if entry is not None:
+            return entry
+
+        try:
+            document = parse(query)
+        except Exception as e:
+            entry = CachedDocument(query, None, [e])
+        else:
+            errors = validate(
+                self.schema.graphql_schema,
+                document,
+                self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS,
+            )
+            entry = CachedDocument(query, document, errors)
+        self.document_cache.set(key, entry)
+        return entry
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, viewer, show_graphiql=False
+    ):
+        """Run every step that comes before execution.
+
+        Returns ``(result, None)`` when the request is answered without
+        executing (errors, GraphiQL, a cached response) and
+        ``(None, operation)`` otherwise.
+        """
+        persisted_hash = self.get_persisted_query_hash(request, data)
+        if persisted_hash and not query:
+            entry = self.document_cache.get(persisted_hash, persisted=True)
+            if entry is None:
+                return ExecutionResult(errors=[GraphQLError(
+                    "PersistedQueryNotFound",
+                    extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+                )]), None
+            query = entry.query
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        key = query_hash(query)
+        if persisted_hash and persisted_hash != key:
+            return ExecutionResult(errors=[GraphQLError("provided sha does not match query")]), None
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        entry = self.get_document(query, key)
+        if entry.document is None:
+            return ExecutionResult(errors=entry.errors), None
+        document = entry.document
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if entry.errors:
+            return ExecutionResult(data=None, errors=entry.errors), None
+
+        costs = []
+        cost_errors = validate(
+            schema, document, [query_cost_rule(variables, operation_name, costs)]
+        )
+        extensions = {'cost': costs[0].as_extension()} if costs else None
+        if cost_errors:
+            return ExecutionResult(data=None, errors=cost_errors, extensions=extensions), None
+
+        operation = PreparedOperation(document, operation_ast, extensions)
+        if operation.is_query:
+            operation.response_cache = ResponseCache(schema)
+            operation.cache_key = operation.response_cache.key(
+                entry, operation_name, variables, viewer
+            )
+            data = operation.response_cache.get(operation.cache_key)
+            if data is not None:
+                return ExecutionResult(data=data, extensions=extensions), None
+        return None, operation
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        result, operation = self.prepare_operation(
+            request, data, query, variables, operation_name,
+            self.get_viewer(request), show_graphiql,
+        )
+        if operation is None:
+            return result
+
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = self.get_execute_options(request, variables, operation_name)
+            # graphene-django's mutations flag errors on the context, which is
+            # a copy of the request in batches
+            context = execute_options["context_value"]
+
+            with self.trace(request, data, operation), self.detect_n_plus_one(operation):
+                if operation.is_mutation and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, operation.document, **execute_options)
+                        if getattr(context, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                else:
+                    result = execute(schema, operation.document, **execute_options)
+            if context is not request and getattr(context, MUTATION_ERRORS_FLAG, False) is True:
+                # encode_result rolls back ATOMIC_REQUESTS on the request's flag
+                setattr(request, MUTATION_ERRORS_FLAG, True)
+            return operation.finish(result)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class PreparedOperation:
+    """A validated operation that is ready to execute"""
+
+    def __init__(self, document, operation_ast, extensions):
+        self.document = document
+        self.operation_ast = operation_ast
+        self.extensions = extensions
+        self.response_cache = None
+        self.cache_key = None
+        self.trace = None
+        self.return_trace = False
+
+    @property
+    def name(self):
+        name = self.operation_ast.name if self.operation_ast is not None else None
+        return name.value if name is not None else None
+
+    @property
+    def type(self):
+        return self.operation_ast.operation.value if self.operation_ast is not None else None
+
+    @property
+    def is_query(self):
+        return self.operation_ast is not None and self.operation_ast.operation == OperationType.QUERY
+
+    @property
+    def is_mutation(self):
+        return self.operation_ast is not None and self.operation_ast.operation == OperationType.MUTATION
+
+    def finish(self, result):
+        """Attach the cost (and tracing) extensions and cache a successful query result"""
+        result.extensions = self.extensions
+        if self.return_trace:
+            result.extensions = {**(self.extensions or {}), 'tracing': self.trace.as_extension()}
+        if self.cache_key is not None and not result.errors:
+            self.response_cache.set(self.cache_key, result.data)
+        return result
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """The CRM endpoint as an async view, for ASGI deployments.
+
+    Requests go through the same document cache, cost limits and response
+    cache as CRMGraphQLView, then execute against the async schema without
+    holding a worker thread; mount it with ``schema=async_schema``.
+    GraphiQL and batching are left to the sync endpoint, and
+    ATOMIC_MUTATIONS is not supported: a transaction cannot span awaits, so
+    each mutation keeps its own transactions.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            execution_result = await self.execute_graphql_request_async(
+                request, data, query, variables, operation_name
+            )
+            result, status_code = self.encode_result(request, execution_result, id)
+            return HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def get_viewer_async(self, request):
+        if not hasattr(request, 'auser'):
+            return 'anonymous'
+        user = await request.auser()
+        return user.pk if user.is_authenticated else 'anonymous'
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        result, operation = self.prepare_operation(
+            request, data, query, variables, operation_name,
+            await self.get_viewer_async(request),
+        )
+        if operation is None:
+            return result
+
+        try:
+            execute_options = self.get_execute_options(request, variables, operation_name)
+            with self.trace(request, data, operation), self.detect_n_plus_one(operation):
+                result = execute(self.schema.graphql_schema, operation.document, **execute_options)
+                if isawaitable(result):
+                    result = await result
+            return operation.finish(result)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+def document_cache_stats(request):
+    """Hit/miss counters of the GraphQL document cache"""
+    return JsonResponse(document_cache.stats())
+
+
+def metrics_view(request):
+    """GraphQL metrics of this process in the Prometheus text format"""
+    return HttpResponse(
+        metrics.render(document_cache.stats()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def slow_operations(request):
+    """The latest operations slower than TRACING_SLOW_SECONDS, oldest first"""
+    return JsonResponse({'operations': metrics.slow_samples()})